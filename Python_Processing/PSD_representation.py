@@ -5,51 +5,60 @@
 
 Power Spectral Density
 """
+
 # Imports modules
 
 import mne
 import numpy as np
 
-from mne.time_frequency import psd_welch
-from lib.data_extractions import extract_block_data_from_subject
-from lib.data_extractions import extract_data_from_subject
-from lib.data_processing import filter_by_condition, filter_by_class
+from pathlib import Path
+from lib.accumulators import PSDAccumulator
+from lib.psd_engine import array_psd
+from lib.data_extractions import (
+    FIGURE_PSD_PARAMS,
+    PSD_DIR,
+    extract_block_data_from_subject,
+)
+from lib.data_provider import iter_grouped_subjects
 from lib.utils import ensure_dir, unify_names
 
-
 # Processing Variables
 
 # Root where the data are stored
 root_dir = "../ds003626/"
-save_dir = "../ds003626/"
+# Folder read by Plotting/PSD_plot_PSD.py
+save_dir = PSD_DIR
 
 # Save options
-save_bool = False
+save_bool = True
 overwrite = True
 
 # Subjets list
-N_S_list = [1]
+N_S_list = FIGURE_PSD_PARAMS["subjects"]
 
 # Data filtering
 datatype = "EEG"
-Conditions_list = ["Pron"]  # All - Pron - Inner - Vis
-Classes_list = ["Left"]  # All - Up - Down - Right - Left
+Conditions_list = ["Inner", "Vis"]  # All - Pron - Inner - Vis
+Classes_list = ["All"]  # All - Up - Down - Right - Left
 
 # Fix all random states
 random_state = 23
 np.random.seed(random_state)
 
-# Time window
-tmin = 0.5
-tmax = 3
+# Time window and PSD parameters of the published figure, checked by
+# Plotting/PSD_plot_PSD.py
+tmin = FIGURE_PSD_PARAMS["tmin"]
+tmax = FIGURE_PSD_PARAMS["tmax"]
 
 # PSD Parameters
+method = FIGURE_PSD_PARAMS["method"]  # "welch" - "multitaper"
 fmin = 0.5
 fmax = 100
+# Welch
 n_overlap = 0
 n_fft = 256
-picks = "all"
-average = "mean"
+# Multitaper
+bandwidth = FIGURE_PSD_PARAMS["bandwidth"]
 
 
 # In[]: Main Loop
@@ -57,65 +66,75 @@ average = "mean"
 # Load a single subject to use the Epoched Object structure
 N_B = 1
 N_S = 1
-X_S, Y = extract_block_data_from_subject(root_dir, N_S, datatype, N_B=N_B)
+X_S, Y = extract_block_data_from_subject(Path(root_dir), N_S, datatype, N_B)
 
 # Set Montage
 Adquisition_eq = "biosemi128"
 montage = mne.channels.make_standard_montage(Adquisition_eq)
 X_S.set_montage(montage)
 
+# Samples of the time window
+time_mask = (X_S.times >= tmin) & (X_S.times <= tmax)
+
+sfreq = X_S.info["sfreq"]
+psd_params = dict(
+    method=method,
+    fmin=fmin,
+    fmax=fmax,
+    n_fft=n_fft,
+    n_overlap=n_overlap,
+    bandwidth=bandwidth,
+)
+
+# One running PSD average per Condition and Class
+accumulators = {
+    (Cond, Classes): PSDAccumulator(sfreq, **psd_params)
+    for Classes in Classes_list
+    for Cond in Conditions_list
+}
+
+# Load every subject once, compute the PSD of each of its trials once and
+# add them to every Condition and Class they belong to
+for N_S, X, Y, groups in iter_grouped_subjects(
+    root_dir, N_S_list, datatype, Conditions_list, Classes_list
+):
+    trials = np.unique(np.concatenate(list(groups.values())))
+    psds, freqs = array_psd(X[trials][:, :, time_mask], sfreq, **psd_params)
+    for key, index in groups.items():
+        accumulators[key].add_psd(psds[np.searchsorted(trials, index)], freqs)
+    del X, psds
+
 # Loop over Classes and Conditions
 for Classes in Classes_list:
     for Cond in Conditions_list:
-        count = 1
-        for N_S in N_S_list:
-            # Load full subject's data
-            X_s, Y = extract_data_from_subject(root_dir, N_S, datatype)
-
-            # Filter by condition
-            X_cond, Y_cond = filter_by_condition(X_s, Y, Condition=Cond)
-
-            # Filter by class
-            X_cond, Y_cond = filter_by_class(X_cond, Y_cond, Class=Classes)
-
-            # Stack trials for every subject
-            if count == 1:
-                # Initialize
-                X_data = X_cond
-                count = 2
-            else:
-                # Stack trials
-                X_data = np.vstack((X_data, X_cond))
-
-        # Create a subject with all trials
-        # (Note: The code assumes you have properly instantiated X_S)
-        X_S._data = X_data
-
-        # Calculate PSD for a particular class in a
-        # particular condition for the selected subjects
+        accumulator = accumulators[(Cond, Classes)]
+        psds, freqs = accumulator.psd, accumulator.freqs
+
+        # PSD for a particular class in a particular condition
+        # for the selected subjects
         print("Calculated PSD for Class: " + Classes + " in Condition: " + Cond)  # noqa
         print("with the information of Subjects: " + str(N_S_list))
 
-        # Perform PSD calculation
-        psds, freqs = psd_welch(
-            X_S,
-            fmin=fmin,
-            fmax=fmax,
-            tmin=tmin,
-            tmax=tmax,
-            n_fft=n_fft,
-            average=average,
-            n_overlap=n_overlap,
-            picks=picks,
-        )
-
         if save_bool:
             # Ensure directory exists
             ensure_dir(save_dir)
 
             # Correct names if needed
-            Cond, Classes = unify_names(Cond, Class=Classes)
+            cond_name, class_name = unify_names(Cond, Class=Classes)
 
             # Save PSD results
-            file_name = save_dir + "PSD_" + Cond + "_" + Classes + "_PSD-tfr.h5"  # noqa
-            psds.save(fname=file_name, overwrite=overwrite)
+            file_name = Path(save_dir) / f"PSD_{cond_name}_{class_name}_psd.npz"
+            np.savez(
+                file_name,
+                psds=psds,
+                freqs=freqs,
+                ch_names=np.array(X_S.ch_names),
+                nave=accumulator.count,
+                method=method,
+                subjects=np.array(N_S_list),
+                tmin=tmin,
+                tmax=tmax,
+                bandwidth=np.nan if bandwidth is None else bandwidth,
+                n_fft=n_fft,
+                n_overlap=n_overlap,
+            )
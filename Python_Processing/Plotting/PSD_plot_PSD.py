@@ -7,42 +7,27 @@ PSD - Plotting
 """
 
 # In[] Imports modules
-import mne
-
 import numpy as np
 import matplotlib.pyplot as plt
 
-from lib.data_extractions import (
-    extract_block_data_from_subject,
-    extract_data_from_subject,
-)
-from lib.data_processing import (
-    filter_by_condition,
-    filter_by_class,
-)
-from lib.utils import (
-    ensure_dir,
-    picks_from_channels,
-)
+from lib.data_extractions import FIGURE_PSD_PARAMS, PSD_DIR, extract_psd
+from lib.figure_export import export_figures, figure_spec
+from lib.utils import ensure_dir, unify_names
 
 # In[] Imports modules
 
-# Root where the data are stored
-root_dir = "../"
+# Root where the PSDs (PSD_representation.py) are stored
+root_dir = PSD_DIR
 
 save_dir = "../"
 
-# Subjets
-N_S_list = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
-
 # Data Parameters
-datatype = "EEG"
 Condition_list = ["Inner", "Vis"]
 Classes_list = ["All"]
 channel = "A26"
-# Get picks for the selected channels
-picks = picks_from_channels(channel)
-picks = ["A26"]
+# Channels averaged in the figure (a single channel is not a region of
+# picks_from_channels)
+picks = [channel]
 
 
 save_bool = True
@@ -53,98 +38,94 @@ random_state = 23
 np.random.seed(random_state)
 
 # Plotting
-# Time Windows
-tmin = 1
-tmax = 3
-
 fmin = 11
 fmax = 32
 
 y_min = 19
 y_max = 31
-bandwidth = 1
 fontsize = 23
+# Number of processes rendering the figures
+n_jobs = 1
 
-
-plt.rcParams.update({"font.size": fontsize})
-plt.rcParams.update({"legend.framealpha": 0})
+rc_params = {"font.size": fontsize, "legend.framealpha": 0}
+plt.rcParams.update(rc_params)
 # "midnightblue" - "darkred" - "darkcyan" - "darkgreen"
 colors = ["darkred", "midnightblue"]
 
-# In[]: Fix Parameters
-
-N_B = 1
-N_S = 1
-# Load a single subject to use the Epoched Object structure
-X_S, Y = extract_block_data_from_subject(root_dir, N_S, datatype, N_B=N_B)
-
-Adquisition_eq = "biosemi128"
-montage = mne.channels.make_standard_montage(Adquisition_eq)
-X_S.set_montage(montage)
-
-# Load Data
-fig = plt.figure(figsize=[13, 10])
-axs = plt.axes()
-n_plot = 0
-for Classes in Classes_list:
-    for Cond in Condition_list:
-        count = 1
-        for N_S in N_S_list:
-            # Load full subject's data
-            X, Y = extract_data_from_subject(root_dir, N_S, datatype)
-
-            # Filter by condition
-            X_cond, Y_cond = filter_by_condition(X, Y, Condition=Cond)
-
-            # Filter by class
-            X_class, Y_class = filter_by_class(X_cond, Y_cond, Class=Classes)
-
-            if count == 1:
-                X_data = X_class
-                Y_data = Y_class
-                count = 2
-            else:
-                X_data = np.vstack((X_data, X_class))
-                Y_data = np.vstack((Y_data, Y_class))
-
-        # Plotting
-        # Put all data
-        X_S._data = X_data
-        X_S.events = Y_data
-
-        color = colors[n_plot]
-        # for next color
-        n_plot = n_plot + 1
-
-        fig = X_S.plot_psd(
-            average=True,
-            dB=True,
-            estimate="power",
-            bandwidth=bandwidth,
-            color=color,
-            picks=picks,
-            fmin=fmin,
-            fmax=fmax,
-            tmin=tmin,
-            tmax=tmax,
-            ax=axs,
+
+def draw_psds(freqs, psds, colors, labels, title, ylim):
+    fig = plt.figure(figsize=[13, 10])
+    axs = plt.axes()
+
+    for psd, color in zip(psds, colors):
+        axs.plot(freqs, psd, color=color)
+
+    axs.legend(
+        labels,
+        loc="upper right",
+        borderaxespad=0.9,
+        fontsize=fontsize,
+        shadow=False,
+    )
+    axs.set_title(" ", fontsize=fontsize)
+    axs.set_xlabel("Frequency (Hz)")
+    axs.set_ylabel("µV²/Hz (dB)")
+    axs.set_ylim(bottom=ylim[0], top=ylim[1])
+    fig.suptitle(title)
+
+    return fig
+
+
+def check_psd(psd, file_name):
+    # The stored PSDs must be those of the figure
+    stored = {key: psd[key] for key in FIGURE_PSD_PARAMS}
+    if stored != FIGURE_PSD_PARAMS:
+        raise ValueError(
+            f"{file_name} was computed with {stored}, the figure needs "
+            f"{FIGURE_PSD_PARAMS}. Compute it again with PSD_representation.py"
         )
 
-# Saving
-axs.legend(
-    ["Inner Speech", "Visualized"],
-    loc="upper right",
-    borderaxespad=0.9,
-    fontsize=fontsize,
-    shadow=False,
-)
-axs.set_title(" ", fontsize=fontsize)
-axs.set_ylim(bottom=y_min, top=y_max)
-
-title = "Power Spectral Density"
-fig.suptitle(title)
-
-# Save Figure
-if save_bool:
-    ensure_dir(save_dir)
-    fig.savefig(save_dir + prefix + "_" + channel + "_.png", transparent=True)
+
+if __name__ == "__main__":
+    # In[]: Load Data
+    # Average PSD of the picked channels of every Condition and Class, in dB
+    psds = []
+    inputs = []
+    for Classes in Classes_list:
+        for Cond in Condition_list:
+            psd = extract_psd(root_dir, Cond, Classes)
+            # File names as stored
+            cond, class_label = unify_names(Cond, Classes)
+            inputs.append(str(root_dir / f"PSD_{cond}_{class_label}_psd.npz"))
+            check_psd(psd, inputs[-1])
+
+            freq_mask = (psd["freqs"] >= fmin) & (psd["freqs"] <= fmax)
+            channels = [psd["ch_names"].index(ch) for ch in picks]
+            # V²/Hz to µV²/Hz
+            power = psd["psds"][channels][:, freq_mask] * 1e12
+            psds.append(10 * np.log10(power).mean(axis=0))
+            freqs = psd["freqs"][freq_mask]
+
+    params = dict(
+        freqs=freqs,
+        psds=np.array(psds),
+        colors=colors,
+        labels=["Inner Speech", "Visualized"],
+        title="Power Spectral Density",
+        ylim=(y_min, y_max),
+    )
+
+    # Save Figure
+    if save_bool:
+        ensure_dir(save_dir)
+        spec = figure_spec(
+            save_dir + prefix + "_" + channel + "_.png",
+            draw_psds,
+            params=params,
+            inputs=inputs,
+            savefig_kwargs=dict(transparent=True),
+            rc_params=rc_params,
+        )
+        export_figures([spec], n_jobs=n_jobs)
+    else:
+        fig = draw_psds(**params)
@@ -12,11 +12,10 @@ import mne
 import numpy as np
 import matplotlib.pyplot as plt
 
-from lib.data_extractions import (
-    extract_block_data_from_subject,
-    extract_data_from_subject,
-)
-from lib.data_processing import filter_by_condition, filter_by_class
+from pathlib import Path
+from lib.data_extractions import extract_block_data_from_subject
+from lib.erp import compute_grouped_erps
+from lib.figure_export import export_figures, figure_spec
 from lib.utils import ensure_dir, picks_from_channels
 
 # In[] Imports modules
@@ -37,6 +36,8 @@ channels = "all"
 # Saving Parameters
 save_bool = True
 prefix = "ERPs"
+# Number of processes rendering the figures
+n_jobs = 1
 
 # Fix all random states
 random_state = 23
@@ -52,87 +53,98 @@ clim = dict(eeg=[-10, 15])
 ylim = clim
 bandwidth = 2
 fontsize = 20
-plt.rcParams.update({"font.size": fontsize})
-plt.rcParams.update({"legend.framealpha": 0})
+rc_params = {"font.size": fontsize, "legend.framealpha": 0}
+plt.rcParams.update(rc_params)
 
-# Load Data
-N_B = 1
-N_S = 1
 
-# Load a single subject to use the Epoched Object structure
-X_S, Y = extract_block_data_from_subject(root_dir, N_S, datatype, N_B=N_B)
+def draw_erps(evoked, title, plot_options, plot_cues):
+    fig = plt.figure(figsize=(20, 10))
+    axs = fig.add_axes([0.1, 0.1, 0.8, 0.8])
 
-Adquisition_eq = "biosemi128"
-montage = mne.channels.make_standard_montage(Adquisition_eq)
-X_S.set_montage(montage)
+    # Plot Cues
+    if plot_cues:
+        axs.plot([0, 0], [-15, 15], color="black")
+        axs.plot([0.5, 0.5], [-15, 15], color="black")
+        axs.plot([3, 3], [-15, 15], color="black")
 
-# Get picks for the selected channels
-picks = picks_from_channels(channels)
+    # Plot ERPs
+    evoked.plot(axes=axs, **plot_options)
+    axs.set_title(title, fontsize=fontsize)
 
-n_test = 1
-for Classes in Classes_list:
-    for Cond in Condition_list:
-        count = 1
-        for N_S in N_S_list:
-            # Load full subject's data
-            X, Y = extract_data_from_subject(root_dir, N_S, datatype)
+    return fig
 
-            # Filter by condition
-            X_cond, Y_cond = filter_by_condition(X, Y, Condition=Cond)
 
-            # Filter by class
-            X_class, Y_class = filter_by_class(X_cond, Y_cond, Class=Classes)
+# In[]: Main Loop
 
-            if count == 1:
-                X_data = X_class
-                Y_data = Y_class
-                count = 2
-            else:
-                X_data = np.vstack((X_data, X_class))
-                Y_data = np.vstack((Y_data, Y_class))
-
-        # In[]: Plotting
-        print("Ploting ERPs for Class: " + Classes + " in Condition: " + Cond)  # noqa
-        print("with the information of Subjects: " + str(N_S_list))  # noqa
-
-        # Put all data
-        X_S._data = X_data
-        X_S.events = Y_data
-        X_averaged = X_S.average()
-
-        fig = plt.figure(figsize=(20, 10))
-        axs = fig.add_axes([0.1, 0.1, 0.8, 0.8])
-
-        # Plot Cues
-        if plot_cues_bool:
-            plt.plot([0, 0], [-15, 15], axes=axs, color="black")
-            plt.plot([0.5, 0.5], [-15, 15], axes=axs, color="black")
-            plt.plot([3, 3], [-15, 15], axes=axs, color="black")
-
-        # Plot ERPs
-        X_averaged.plot(
-            spatial_colors=spatial_colors,
-            picks=picks,
-            ylim=ylim,
-            axes=axs,
-            xlim=[t_start, t_end],
-        )
-
-        title = "ERPs - Condition: " + Cond + " in Class" + Classes
-        axs.set_title(title, fontsize=fontsize)
-
-        # Save Figure
-        if save_bool:
-            ensure_dir(save_dir)
-            fig.savefig(
-                save_dir
-                + prefix
-                + "_"
-                + Cond
-                + "_"
-                + Classes
-                + "_"
-                + channels
-                + "_.png",
-                transparent=True,
+if __name__ == "__main__":
+    # Load Data
+    N_B = 1
+    N_S = 1
+
+    # Load a single subject to use the Epoched Object structure
+    X_S, Y = extract_block_data_from_subject(Path(root_dir), N_S, datatype, N_B)
+
+    Adquisition_eq = "biosemi128"
+    montage = mne.channels.make_standard_montage(Adquisition_eq)
+    X_S.set_montage(montage)
+
+    # Get picks for the selected channels
+    picks = picks_from_channels(channels)
+
+    # Load every subject once and accumulate the ERPs of all the Conditions
+    # and Classes, without keeping the trials of all the subjects
+    erps = compute_grouped_erps(
+        root_dir, N_S_list, datatype, Condition_list, Classes_list, X_S.info, X_S.tmin
+    )
+
+    plot_options = dict(
+        spatial_colors=spatial_colors, picks=picks, ylim=ylim, xlim=[t_start, t_end]
+    )
+
+    specs = []
+    for Classes in Classes_list:
+        for Cond in Condition_list:
+            # In[]: Plotting
+            print(
+                "Ploting ERPs for Class: " + Classes + " in Condition: " + Cond
             )  # noqa
+            print("with the information of Subjects: " + str(N_S_list))  # noqa
+
+            X_averaged = erps[(Cond, Classes)]
+
+            title = "ERPs - Condition: " + Cond + " in Class" + Classes
+            params = dict(
+                evoked=X_averaged,
+                title=title,
+                plot_options=plot_options,
+                plot_cues=plot_cues_bool,
+            )
+
+            # Save Figure
+            if save_bool:
+                ensure_dir(save_dir)
+                file_name = (
+                    save_dir
+                    + prefix
+                    + "_"
+                    + Cond
+                    + "_"
+                    + Classes
+                    + "_"
+                    + channels
+                    + "_.png"
+                )
+                specs.append(
+                    figure_spec(
+                        file_name,
+                        draw_erps,
+                        params=params,
+                        savefig_kwargs=dict(transparent=True),
+                        rc_params=rc_params,
+                    )
+                )
+            else:
+                fig = draw_erps(**params)
+
+    # Figures whose ERPs and plot parameters did not change are skipped
+    export_figures(specs, n_jobs=n_jobs)
@@ -5,12 +5,14 @@
 
 Plot Inter Trial Coherence
 """
+
 # Imports modules
 
 import matplotlib.pyplot as plt
 
 from lib.utils import ensure_dir
 from lib.data_extractions import extract_tfr
+from lib.figure_export import export_figures, figure_spec
 
 # Imports modules
 
@@ -36,8 +38,10 @@ itc = extract_tfr(
     trf_dir=root_spectrograms,
     cond=Condition,
     class_label=Class,
-    trf_method=TRF_method,
+    tfr_method=TRF_method,
     trf_type=TRF_type,
+    # Writable, for the baseline correction
+    copy=baseline_bool,
 )
 
 if baseline_bool:
@@ -58,25 +62,39 @@ save_bool = True
 prefix = "ITC"
 
 fontsize = 20
-plt.rcParams.update({"font.size": fontsize})
-plt.rcParams.update({"legend.framealpha": 0})
 plot_cues_bool = True
+rc_params = {"font.size": fontsize, "legend.framealpha": 0}
+
+
+def draw_itc(itc, title, plot_options, plot_cues):
+    fig = plt.figure(figsize=(20, 10))
+    ax = fig.add_axes([0.1, 0.1, 0.8, 0.8])
+    if plot_cues:
+        ax.plot([0, 0], [-15, 150], color="black")
+        ax.plot([0.5, 0.5], [-15, 150], color="black")
+        ax.plot([3, 3], [-15, 150], color="black")
+
+    itc.plot(axes=ax, **plot_options)
+    ax.set_title(title, fontsize=fontsize)
 
-fig = plt.figure(figsize=(20, 10))
-ax = fig.add_axes([0.1, 0.1, 0.8, 0.8])
-if plot_cues_bool:
-    plt.plot([0, 0], [-15, 150], axes=ax, color="black")
-    plt.plot([0.5, 0.5], [-15, 150], axes=ax, color="black")
-    plt.plot([3, 3], [-15, 150], axes=ax, color="black")
+    return fig
 
-itc.plot(combine=combine, dB=dB, axes=ax, vmin=vmin, vmax=vmax, fmin=fmin, fmax=fmax)
 
 title = "ITC - Condition: " + Condition + " in Class " + Class
-ax.set_title(title, fontsize=fontsize)
-ax.set_title(title, fontsize=fontsize)
+plot_options = dict(combine=combine, dB=dB, vmin=vmin, vmax=vmax, fmin=fmin, fmax=fmax)
+params = dict(itc=itc, title=title, plot_options=plot_options, plot_cues=plot_cues_bool)
 
 if save_bool:
     ensure_dir(save_dir)
-    fig.savefig(
-        save_dir + prefix + "_" + Condition + "_" + Class + ".png", transparent=True
+    spec = figure_spec(
+        save_dir + prefix + "_" + Condition + "_" + Class + ".png",
+        draw_itc,
+        params=params,
+        savefig_kwargs=dict(transparent=True),
+        rc_params=rc_params,
     )
+    # Skipped if the ITC and the plot parameters did not change
+    export_figures([spec])
+else:
+    plt.rcParams.update(rc_params)
+    fig = draw_itc(**params)
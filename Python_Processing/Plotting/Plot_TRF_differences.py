@@ -7,11 +7,11 @@ Plot power difference between two clases or conditions.
 """
 # In[] Imports modules
 
-import matplotlib.pyplot as plt
 import numpy as np
 
 from lib.utils import ensure_dir
-from lib.data_extractions import extract_tfr
+from lib.data_extractions import extract_tfr_range
+from lib.topomaps import band_time_averages, render_topomaps, topomap_layout
 
 # In[] Imports modules
 
@@ -38,6 +38,8 @@ sphere = None
 
 # Saving
 save_bool = True
+# Number of processes rendering the saved figures
+n_jobs = 1
 # Prefix for saving
 prefix = "TRF_differences_Topomaps"
 
@@ -59,118 +61,104 @@ bands = [
     (55, 100, "High Gamma (55-100 Hz)"),
 ]
 
-# Load Data
-
-# Load Class and condition
-power_1 = extract_tfr(
-    trf_dir=root_spectrograms,
-    cond=Condition_1,
-    class_label=Class_1,
-    trf_method=TRF_method,
-    trf_type=TRF_type,
-)
-
-# Load Class and Condition
-power_2 = extract_tfr(
-    trf_dir=root_spectrograms,
-    cond=Condition_2,
-    class_label=Class_2,
-    trf_method=TRF_method,
-    trf_type=TRF_type,
-)
-
-
-# Create a new Power where the diference will be stored
-power_dif = power_1.copy()
-if baseline_bool:
-    power_1.apply_baseline(baseline)
-    power_2.apply_baseline(baseline)
-
-
-if normalized_bool:
-    power_dif._data = (power_1._data - power_2._data) / np.maximum(
-        power_1._data, power_2._data
-    )  # noqa
-    # Plot limit per band - [min_lim, max_lim]
-    vlim = [(-1, 1), (-1, 1), (-1, 1), (-1, 1), (-1, 1), (-1, 1)]
-
-else:
-    power_dif._data = power_1._data - power_2._data
-    # Plot limit per band - [min_lim, max_lim]
-    vlim = [
-        (-7.5e-9, 7.5e-9),
-        (-9e-10, 9e-10),
-        (-3e-10, 3e-10),
-        (-9e-11, 9e-11),
-        (-1.2e-10, 1.2e-10),
-        (-1.2e-10, 1.2e-10),
-    ]
-
-
-# Plotting
-fontsize = 20
-plt.rcParams.update({"font.size": fontsize})
-plt.rcParams.update({"legend.framealpha": 0})
-
-
-for band in range(len(bands)):
-    bands_loop = bands[band]
-    vlim_loop = vlim[band]
-    fig = plt.figure(figsize=(20, 10))
-    ax = fig.add_axes([0.1, 0.1, 0.8, 0.8])
-
-    power_dif.plot_topomap(
-        fmin=bands_loop[0],
-        fmax=bands_loop[1],
-        tmin=tmin,
-        tmax=tmax,
-        title=bands_loop[2],
-        show=False,
-        axes=ax,
-        vmin=vlim_loop[0],
-        vmax=vlim_loop[1],
-        outlines=outlines,
-        sensors=sensors,
-        sphere=sphere,
-        unit="Power difference",
+# In[]: Main Loop
+
+if __name__ == "__main__":
+    # Load Data
+    fmin = min(band[0] for band in bands)
+    fmax = max(band[1] for band in bands)
+
+    # Load Class and condition
+    power_1 = extract_tfr_range(
+        trf_dir=root_spectrograms,
+        cond=Condition_1,
+        class_label=Class_1,
+        tfr_method=TRF_method,
+        trf_type=TRF_type,
+        fmin=fmin,
+        fmax=fmax,
+        copy=baseline_bool,
+    )
+
+    # Load Class and Condition
+    power_2 = extract_tfr_range(
+        trf_dir=root_spectrograms,
+        cond=Condition_2,
+        class_label=Class_2,
+        tfr_method=TRF_method,
+        trf_type=TRF_type,
+        fmin=fmin,
+        fmax=fmax,
+        copy=baseline_bool,
+    )
+
+    if baseline_bool:
+        power_1.apply_baseline(baseline)
+        power_2.apply_baseline(baseline)
+
+
+    if normalized_bool:
+        power_dif = (power_1.data - power_2.data) / np.maximum(
+            power_1.data, power_2.data
+        )  # noqa
+        # Plot limit per band - [min_lim, max_lim]
+        vlim = [(-1, 1), (-1, 1), (-1, 1), (-1, 1), (-1, 1), (-1, 1)]
+
+    else:
+        power_dif = power_1.data - power_2.data
+        # Plot limit per band - [min_lim, max_lim]
+        vlim = [
+            (-7.5e-9, 7.5e-9),
+            (-9e-10, 9e-10),
+            (-3e-10, 3e-10),
+            (-9e-11, 9e-11),
+            (-1.2e-10, 1.2e-10),
+            (-1.2e-10, 1.2e-10),
+        ]
+
+    # All band averages in the time window, in one pass
+    band_values = band_time_averages(
+        power_dif, power_1.freqs, power_1.times, bands, tmin=tmin, tmax=tmax
     )
 
+    # Plotting
+    fontsize = 20
+    rc_params = {"font.size": fontsize, "legend.framealpha": 0}
+
+    # Sensor-to-image interpolation, computed once for all the bands
+    layout = topomap_layout(power_1.info, sphere=sphere, outlines=outlines)
+
+    file_names = None
     if save_bool:
         ensure_dir(save_dir)
-
-        if baseline_bool:
-            fig.savefig(
-                save_dir
-                + prefix
-                + "_"
-                + Condition_1
-                + "_"
-                + Class_1
-                + "_vs_"
-                + Condition_2
-                + "_"
-                + Class_2
-                + "_band"
-                + str(band)
-                + "_Baseline.png",
-                transparent=True,
-                pad_inches=0.5,
-            )
-
-        else:
-            fig.savefig(
-                save_dir
-                + prefix
-                + "_"
-                + Condition_1
-                + "_"
-                + Class_1
-                + "_vs_"
-                + Condition_2
-                + "_"
-                + Class_2
-                + "_band"
-                + str(band)
-                + "_NO_Baseline.png",
-                transparent=True,
-            )
+        suffix = "_Baseline.png" if baseline_bool else "_NO_Baseline.png"
+        file_names = [
+            save_dir
+            + prefix
+            + "_"
+            + Condition_1
+            + "_"
+            + Class_1
+            + "_vs_"
+            + Condition_2
+            + "_"
+            + Class_2
+            + "_band"
+            + str(band)
+            + suffix
+            for band in range(len(bands))
+        ]
+
+    figs = render_topomaps(
+        band_values,
+        layout,
+        titles=[band[2] for band in bands],
+        vlims=vlim,
+        file_names=file_names,
+        n_jobs=n_jobs,
+        cmap="RdBu_r",
+        sensors=sensors,
+        unit="Power difference",
+        savefig_kwargs=dict(transparent=True),
+        rc_params=rc_params,
+    )
@@ -10,10 +10,9 @@ Plot single TRF
 
 # In[] Imports modules
 
-import matplotlib.pyplot as plt
-
 from lib.utils import ensure_dir
-from lib.data_extractions import extract_tfr
+from lib.data_extractions import extract_tfr_range
+from lib.topomaps import band_time_averages, render_topomaps, topomap_layout
 
 # In[] Imports modules
 
@@ -37,6 +36,8 @@ sphere = None
 
 # Saving
 save_bool = False
+# Number of processes rendering the saved figures
+n_jobs = 1
 # Prefix for saving
 prefix = "TRF_Topomaps"
 
@@ -57,74 +58,65 @@ bands = [
 # Plot limit per band - [min_lim, max_lim]
 vlim = [(0, 7.5e-9), (0, 9e-10), (0, 2e-9), (0, 5e-10), (0, 3e-10), (0, 3e-10)]
 
-# In[] Load Data
-# Load Class and condition
-power = extract_tfr(
-    TRF_dir=root_spectrograms,
-    Cond=Condition,
-    Class=Class,
-    TFR_method=TRF_method,
-    TRF_type=TRF_type,
-)
-
-if baseline_bool:
-    power.apply_baseline(baseline)
-
-# Plotting
-
-fontsize = 20
-plt.rcParams.update({"font.size": fontsize})
-plt.rcParams.update({"legend.framealpha": 0})
-
-
-for band in range(len(bands)):
-    bands_loop = bands[band]
-    vlim_loop = vlim[band]
-    fig = plt.figure(figsize=(20, 10))
-    ax = fig.add_axes([0.1, 0.1, 0.8, 0.8])
-
-    power.plot_topomap(
-        fmin=bands_loop[0],
-        fmax=bands_loop[1],
-        tmin=tmin,
-        tmax=tmax,
-        title=bands_loop[2],
-        show=False,
-        axes=ax,
-        vmin=vlim_loop[0],
-        vmax=vlim_loop[1],
-        outlines=outlines,
-        sensors=sensors,
-        sphere=sphere,
+# In[]: Main Loop
+
+if __name__ == "__main__":
+    # In[] Load Data
+    # Load the frequencies of all the bands of the Class and Condition at once
+    power = extract_tfr_range(
+        trf_dir=root_spectrograms,
+        cond=Condition,
+        class_label=Class,
+        tfr_method=TRF_method,
+        trf_type=TRF_type,
+        fmin=min(band[0] for band in bands),
+        fmax=max(band[1] for band in bands),
+        # Writable, for the baseline correction
+        copy=baseline_bool,
+    )
+
+    if baseline_bool:
+        power.apply_baseline(baseline)
+
+    # All band averages in the time window, in one pass
+    band_values = band_time_averages(
+        power.data, power.freqs, power.times, bands, tmin=tmin, tmax=tmax
     )
 
+    # Plotting
+
+    fontsize = 20
+    rc_params = {"font.size": fontsize, "legend.framealpha": 0}
+
+    # Sensor-to-image interpolation, computed once for all the bands
+    layout = topomap_layout(power.info, sphere=sphere, outlines=outlines)
+
+    file_names = None
     if save_bool:
         ensure_dir(save_dir)
-
-        if baseline_bool:
-            fig.savefig(
-                save_dir
-                + prefix
-                + "_"
-                + Condition
-                + "_"
-                + Class
-                + "_band"
-                + str(band)
-                + "_Baseline.png",  # noqa
-                transparent=True,
-            )
-
-        else:
-            fig.savefig(
-                save_dir
-                + prefix
-                + "_"
-                + Condition
-                + "_"
-                + Class
-                + "_band"
-                + str(band)
-                + "_NO_Baseline.png",  # noqa
-                transparent=True,
-            )
+        suffix = "_Baseline.png" if baseline_bool else "_NO_Baseline.png"
+        file_names = [
+            save_dir
+            + prefix
+            + "_"
+            + Condition
+            + "_"
+            + Class
+            + "_band"
+            + str(band)
+            + suffix
+            for band in range(len(bands))
+        ]
+
+    figs = render_topomaps(
+        band_values,
+        layout,
+        titles=[band[2] for band in bands],
+        vlims=vlim,
+        file_names=file_names,
+        n_jobs=n_jobs,
+        cmap="Reds",
+        sensors=sensors,
+        savefig_kwargs=dict(transparent=True),
+        rc_params=rc_params,
+    )
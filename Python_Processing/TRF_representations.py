@@ -10,16 +10,9 @@ Time Frecuency Representations
 import mne
 import numpy as np
 
-from mne.time_frequency import tfr_multitaper, tfr_morlet
-from lib.data_extractions import (
-    extract_block_data_from_subject,
-    extract_data_from_subject,
-)
-from lib.data_processing import (
-    filter_by_condition,
-    filter_by_class,
-)
-from lib.utils import ensure_dir, unify_names
+from pathlib import Path
+from lib.data_extractions import extract_block_data_from_subject
+from lib.tfr_processing import run_tfr_grid, run_tfr_grid_single_pass
 
 # Processing Variables
 
@@ -52,11 +45,24 @@ fmax = 100
 n_steps = 300
 average = True
 return_itc = True
-use_fft = False
+# FFT convolution with cached wavelet spectra (lib.tfr_engine)
+use_fft = True
 decim = 1
 n_jobs = 1
 picks = "all"
 
+# Number of condition/class cells computed in parallel (None: all CPUs).
+# Every worker holds the full TFR of its cell
+n_workers = 2
+
+# Averaged Morlet only: compute the TFR of every trial once and derive
+# all the condition/class cells from it
+single_pass = True
+batch_size = 32
+# Complex type of the trial TFRs of the single pass (np.complex64 halves
+# the memory, with single precision power and ITC)
+tfr_dtype = np.complex128
+
 freqs = np.logspace(*np.log10([fmin, fmax]), num=n_steps)
 n_cycles = freqs
 
@@ -65,117 +71,63 @@ zero_mean = True
 
 # In[]: Main Loop
 
-# Load a single subject to use the Epoched Object structure
-N_B = 1
-N_S = 1
-X_S, Y = extract_block_data_from_subject(root_dir, N_S, datatype, N_B=N_B)
-
-# Set Montage
-Adquisition_eq = "biosemi128"
-montage = mne.channels.make_standard_montage(Adquisition_eq)
-X_S.set_montage(montage)
-
-for Classes in Classes_list:
-    for Cond in Conditions_list:
-        count = 1
-        for N_S in N_S_list:
-            # Load full subject's data
-            X_s, Y = extract_data_from_subject(root_dir, N_S, datatype)
-
-            # Filter by condition
-            X_cond, Y_cond = filter_by_condition(X_s, Y, Condition=Cond)
-
-            # Filter by class
-            X_cond, Y_cond = filter_by_class(X_cond, Y_cond, Class=Classes)
-
-            # Stack trial for every subject
-            if count == 1:
-                # Inicialiced
-                X_data = X_cond
-                count = 2
-            else:
-                # Stack trials
-                X_data = np.vstack((X_data, X_cond))
-
-        # Calculated TFR for a particular clase in
-        # a particular condition for the selected subjects
-        print(
-            "Calculated "
-            + TFR_method
-            + " for Class: "
-            + Classes
-            + " in Condition: "
-            + Cond
-        )  # noqa
-        print("with the information of Subjects: " + str(N_S_list))  # noqa
-
-        # Create a subject with all trials
-        X_S._data = X_data
-
-        if TFR_method == "Multitaper":
-            power, itc = tfr_multitaper(
-                X_S,
-                freqs=freqs,
-                n_cycles=n_cycles,
-                use_fft=use_fft,
-                return_itc=return_itc,
-                decim=decim,
-                n_jobs=n_jobs,
-                average=average,
-                picks=picks,
-            )
-
-            if save_bool:
-                ensure_dir(save_dir)
-                file_name = (
-                    save_dir + TFR_method + "_" + Cond + "_" + Classes + "_power-tfr.h5"
-                )  # noqa
-                power.save(fname=file_name, overwrite=overwrite)
-                if return_itc:
-                    file_name = (
-                        save_dir
-                        + TFR_method
-                        + "_"
-                        + Cond
-                        + "_"
-                        + Classes
-                        + "_itc-tfr.h5"
-                    )  # noqa
-                    itc.save(fname=file_name, overwrite=overwrite)
-
-        elif TFR_method == "Morlet":
-            power, itc = tfr_morlet(
-                X_S,
-                freqs=freqs,
-                n_cycles=n_cycles,
-                use_fft=use_fft,
-                return_itc=return_itc,
-                decim=decim,
-                n_jobs=n_jobs,
-                average=average,
-                zero_mean=zero_mean,
-                picks=picks,
-            )
-            if save_bool:
-                ensure_dir(save_dir)
-                Cond, Classes = unify_names(Cond, Class=Classes)
-                file_name = (
-                    save_dir + TFR_method + "_" + Cond + "_" + Classes + "_power-tfr.h5"
-                )  # noqa
-                power.save(fname=file_name, overwrite=overwrite)
-
-                if return_itc:
-                    Cond, Classes = unify_names(Cond, Class=Classes)
-                    file_name = (
-                        save_dir
-                        + TFR_method
-                        + "_"
-                        + Cond
-                        + "_"
-                        + Classes
-                        + "_itc-tfr.h5"
-                    )  # noqa
-                    itc.save(fname=file_name, overwrite=overwrite)
-
-        else:
-            print("Invalid TFR_rep")
+if __name__ == "__main__":
+    # Load a single subject to use the Epoched Object structure
+    N_B = 1
+    N_S = 1
+    X_S, Y = extract_block_data_from_subject(Path(root_dir), N_S, datatype, N_B)
+
+    # Set Montage
+    Adquisition_eq = "biosemi128"
+    montage = mne.channels.make_standard_montage(Adquisition_eq)
+    X_S.set_montage(montage)
+
+    tfr_params = dict(
+        freqs=freqs,
+        n_cycles=n_cycles,
+        use_fft=use_fft,
+        return_itc=return_itc,
+        decim=decim,
+        n_jobs=n_jobs,
+        average=average,
+        picks=picks,
+    )
+    if TFR_method == "Morlet":
+        tfr_params["zero_mean"] = zero_mean
+
+    print("with the information of Subjects: " + str(N_S_list))  # noqa
+    if single_pass and TFR_method == "Morlet" and average:
+        # Every trial is transformed once, in batches of trial TFRs
+        run_tfr_grid_single_pass(
+            root_dir=root_dir,
+            n_s_list=N_S_list,
+            datatype=datatype,
+            conditions=Conditions_list,
+            classes=Classes_list,
+            info=X_S.info,
+            tmin=X_S.tmin,
+            tfr_params=tfr_params,
+            save_dir=save_dir if save_bool else None,
+            overwrite=overwrite,
+            batch_size=batch_size,
+            dtype=tfr_dtype,
+        )
+    else:
+        # Each condition/class cell is computed and saved by a worker
+        # process. Subjects are loaded only once and shared as read-only
+        # memory maps.
+        run_tfr_grid(
+            root_dir=root_dir,
+            n_s_list=N_S_list,
+            datatype=datatype,
+            conditions=Conditions_list,
+            classes=Classes_list,
+            info=X_S.info,
+            tmin=X_S.tmin,
+            tfr_method=TFR_method,
+            tfr_params=tfr_params,
+            save_dir=save_dir if save_bool else None,
+            n_workers=n_workers,
+            overwrite=overwrite,
+            batch_size=batch_size,
+        )
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the FIR filter bank (lib.filter_bank) against MNE.
+
+Run from the Python_Processing folder:
+
+    python -m benchmarks.bench_filter_bank --duration 600
+
+The band-pass and notch filters of the preprocessing are applied to a
+random Raw with the channels of a BioSemi recording (128 EEG, 8 EXG and
+the Status channel), once with lib.filter_bank and once with the MNE
+methods they replace (Raw.filter, Raw.notch_filter), and the EMG control
+band-pass is applied to random Epochs in the same way. The largest
+difference between both outputs is printed after the timings. Wall time
+and peak RSS of every benchmark (the extra memory is the peak minus the
+one of the setup) are appended to the JSON history and compared with the
+previous run of the same configuration.
+"""
+
+import argparse
+import mne
+import numpy as np
+from pathlib import Path
+from benchmarks.harness import append_history, compare, load_history, run_suite
+from lib.filter_bank import filter_epochs, filter_raw, notch_filter_raw
+
+HISTORY_FILE = Path(__file__).parent / "results" / "history.json"
+
+# Recording parameters, as the raw BDF files
+RAW_SFREQ = 1024
+N_EEG = 128
+N_EXG = 8
+DURATION = 600
+
+# Filters of InnerSpeech_preprocessing.py and of the EMG control
+LOW_CUT = 0.5
+HIGH_CUT = 100
+LINE_FREQ = 50
+EMG_LOW = 1
+EMG_HIGH = 20
+
+# Epochs of the EMG control (EXG channels, decimated to 256 Hz)
+EPOCHS_SFREQ = 256
+N_EPOCHS = 200
+EPOCH_DURATION = 4.5
+
+
+def setup_raw(duration: float = DURATION, random_state: int = 23) -> tuple:
+    """
+    Random Raw with the channels of a BioSemi recording.
+
+    Parameters:
+    - duration (float): Length of the recording, in seconds. Default
+      DURATION.
+    - random_state (int): Seed of the data. Default 23.
+
+    Returns:
+    - tuple: The preloaded Raw, as the only argument of the benchmarks.
+    """
+    ch_names = (
+        [f"EEG{i + 1}" for i in range(N_EEG)]
+        + [f"EXG{i + 1}" for i in range(N_EXG)]
+        + ["Status"]
+    )
+    ch_types = ["eeg"] * (N_EEG + N_EXG) + ["stim"]
+    info = mne.create_info(ch_names, RAW_SFREQ, ch_types)
+    rng = np.random.default_rng(random_state)
+    data = rng.standard_normal((len(ch_names), int(duration * RAW_SFREQ))) * 1e-5
+    data[-1] = 0
+
+    return (mne.io.RawArray(data, info, verbose="WARNING"),)
+
+
+def setup_epochs(random_state: int = 23) -> tuple:
+    """
+    Random EXG Epochs, as filtered by the EMG control.
+
+    Parameters:
+    - random_state (int): Seed of the data. Default 23.
+
+    Returns:
+    - tuple: The preloaded Epochs, as the only argument of the benchmarks.
+    """
+    info = mne.create_info(N_EXG, EPOCHS_SFREQ, "emg")
+    rng = np.random.default_rng(random_state)
+    n_times = int(EPOCH_DURATION * EPOCHS_SFREQ) + 1
+    data = rng.standard_normal((N_EPOCHS, N_EXG, n_times)) * 1e-5
+
+    return (mne.EpochsArray(data, info, verbose="WARNING"),)
+
+
+def bench_filter_raw(raw: mne.io.BaseRaw) -> None:
+    filter_raw(raw, LOW_CUT, HIGH_CUT)
+
+
+def bench_mne_filter_raw(raw: mne.io.BaseRaw) -> None:
+    raw.filter(LOW_CUT, HIGH_CUT, verbose="WARNING")
+
+
+def bench_notch_filter_raw(raw: mne.io.BaseRaw) -> None:
+    notch_filter_raw(raw, LINE_FREQ)
+
+
+def bench_mne_notch_filter_raw(raw: mne.io.BaseRaw) -> None:
+    raw.notch_filter(LINE_FREQ, verbose="WARNING")
+
+
+def bench_filter_epochs(epochs: mne.BaseEpochs) -> None:
+    filter_epochs(epochs, EMG_LOW, EMG_HIGH)
+
+
+def bench_mne_filter_epochs(epochs: mne.BaseEpochs) -> None:
+    epochs.filter(EMG_LOW, EMG_HIGH, picks="emg", verbose="WARNING")
+
+
+def check_outputs(duration: float) -> dict:
+    """
+    Largest difference between the filter bank and MNE outputs.
+
+    Parameters:
+    - duration (float): Length of the recording, in seconds.
+
+    Returns:
+    - dict: Difference relative to the largest MNE output, per filter.
+    """
+    errors = dict()
+    pairs = [
+        ("band-pass", setup_raw, bench_filter_raw, bench_mne_filter_raw),
+        ("notch", setup_raw, bench_notch_filter_raw, bench_mne_notch_filter_raw),
+        (
+            "epochs band-pass",
+            setup_epochs,
+            bench_filter_epochs,
+            bench_mne_filter_epochs,
+        ),
+    ]
+    for name, setup, func, mne_func in pairs:
+        kwargs = dict(duration=duration) if setup is setup_raw else dict()
+        (inst,) = setup(**kwargs)
+        (expected,) = setup(**kwargs)
+        func(inst)
+        mne_func(expected)
+        data, expected = inst.get_data(), expected.get_data()
+        errors[name] = np.abs(data - expected).max() / np.abs(expected).max()
+        del inst, expected, data
+
+    return errors
+
+
+def get_benchmarks(duration: float) -> dict:
+    """
+    Get the benchmarks of the filter bank and of the MNE filters.
+
+    Parameters:
+    - duration (float): Length of the recording, in seconds.
+
+    Returns:
+    - dict: (setup, function, setup arguments) of every benchmark.
+    """
+    raw = dict(duration=duration)
+    return {
+        "filter_raw": (setup_raw, bench_filter_raw, raw),
+        "mne_filter_raw": (setup_raw, bench_mne_filter_raw, raw),
+        "notch_filter_raw": (setup_raw, bench_notch_filter_raw, raw),
+        "mne_notch_filter_raw": (setup_raw, bench_mne_notch_filter_raw, raw),
+        "filter_epochs": (setup_epochs, bench_filter_epochs, dict()),
+        "mne_filter_epochs": (setup_epochs, bench_mne_filter_epochs, dict()),
+    }
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--history", type=Path, default=HISTORY_FILE)
+    parser.add_argument("--duration", type=float, default=DURATION)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="*", help="Benchmarks to run")
+    args = parser.parse_args(argv)
+
+    # Timed first: the workers inherit the peak RSS of this process
+    benchmarks = get_benchmarks(args.duration)
+    results = run_suite(benchmarks, names=args.only, repeat=args.repeat)
+    for name, result in results.items():
+        extra = ""
+        if result["peak_rss_mb"] is not None:
+            extra = f", +{result['peak_rss_mb'] - result['setup_rss_mb']:.0f} MB"
+        print(f"{name:<24} {result['wall_time']:.3f} s{extra}")
+
+    for name, error in check_outputs(args.duration).items():
+        print(f"Difference with MNE ({name}): {error:.2e}")
+
+    config = dict(suite="filter_bank", duration=args.duration, repeat=args.repeat)
+    history = load_history(args.history)
+    record = append_history(args.history, results, config)
+    print(compare(record, history))
+
+
+if __name__ == "__main__":
+    main()
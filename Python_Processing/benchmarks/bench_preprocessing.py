@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end benchmark of the preprocessing on synthetic BDF recordings.
+
+Run from the Python_Processing folder:
+
+    python -m benchmarks.bench_preprocessing --n-subjects 1 --n-sessions 1
+
+The synthetic recordings (benchmarks.synthetic_data.write_raw_recordings)
+are written once to the data folder and reused while their configuration
+does not change. Every session goes through the same stages as in
+InnerSpeech_preprocessing.py (lib.preprocessing.preprocess_recording:
+loading, event correction, filtering, epoching, optional ICA, saving) and
+the EMG control runs at the end. Wall
+time, CPU time, peak RSS and I/O of every stage are appended to the JSON
+history and compared with the previous run of the same configuration.
+"""
+
+import argparse
+import tempfile
+import mne
+from pathlib import Path
+from benchmarks.harness import (
+    append_history,
+    compare,
+    load_history,
+    run_stages,
+)
+from benchmarks.synthetic_data import (
+    DS_RATE,
+    N_SESSIONS,
+    N_SUBJECTS,
+    N_TRIALS,
+    RECOVERABLE_CODES,
+    write_raw_recordings,
+)
+from lib.instrumentation import StageLog
+from lib.preprocessing import finish_dataset, preprocess_recording
+
+# Default location of the synthetic recordings and of the history
+DATA_DIR = Path(tempfile.gettempdir()) / "inner_speech_raw_benchmarks"
+HISTORY_FILE = Path(__file__).parent / "results" / "history.json"
+
+# Events dropped from every session, restored by the event correction.
+# Codes without a droppable occurrence in a session (e.g. 16 with a single
+# run) are not dropped there
+MISSING_EVENTS = [42, 31, 44, 45, 46, 16, 17]
+
+# Preprocessing parameters, as in InnerSpeech_preprocessing.py
+REF_CHANNELS = ["EXG1", "EXG2"]
+LOW_CUT = 0.5
+HIGH_CUT = 100
+ICA_PARAMS = dict(
+    n_components=None,
+    method="infomax",
+    random_state=23,
+    fit_params=dict(extended=True),
+)
+EVENT_ID = dict(Arriba=31, Abajo=32, Derecha=33, Izquierda=34)
+BASELINE_ID = dict(Baseline=13)
+
+# EMG control parameters, as in InnerSpeech_preprocessing.py
+EMG_PARAMS = dict(
+    low_f=1,
+    high_f=20,
+    t_min=1,
+    t_max=3.5,
+    window_len=0.5,
+    window_step=0.05,
+    std_times=3,
+    t_min_baseline=0,
+    t_max_baseline=15,
+)
+
+
+def preprocess_dataset(
+    stage_log: StageLog,
+    data_dir: Path,
+    n_subjects: int,
+    n_sessions: int,
+    ica: bool = False,
+) -> None:
+    """
+    Preprocess every recording and run the EMG control.
+
+    Parameters:
+    - stage_log (StageLog): Log of the stages.
+    - data_dir (Path): Root of the raw dataset.
+    - n_subjects (int): Number of subjects.
+    - n_sessions (int): Number of sessions per subject.
+    - ica (bool): Whether to apply ICA. Default False.
+
+    Returns:
+    - None
+    """
+    data_dir = Path(data_dir)
+    mne.set_log_level("WARNING")
+
+    n_s_list = list(range(1, n_subjects + 1))
+    n_b_list = list(range(1, n_sessions + 1))
+    for n_s in n_s_list:
+        for n_b in n_b_list:
+            preprocess_recording(
+                data_dir,
+                data_dir / "derivatives",
+                n_s,
+                n_b,
+                event_id=EVENT_ID,
+                baseline_id=BASELINE_ID,
+                ref_channels=REF_CHANNELS,
+                decim=DS_RATE,
+                low_cut=LOW_CUT,
+                high_cut=HIGH_CUT,
+                ica=ica,
+                ica_params=ICA_PARAMS,
+                stage_log=stage_log,
+            )
+
+    # The synthetic sub-03 has no mislabelled trials to correct
+    finish_dataset(
+        data_dir, n_s_list, n_b_list, EMG_PARAMS, adhoc=False, stage_log=stage_log
+    )
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--history", type=Path, default=HISTORY_FILE)
+    parser.add_argument("--n-subjects", type=int, default=N_SUBJECTS)
+    parser.add_argument("--n-sessions", type=int, default=N_SESSIONS)
+    parser.add_argument("--n-trials", type=int, default=N_TRIALS)
+    parser.add_argument(
+        "--missing",
+        type=int,
+        nargs="*",
+        default=MISSING_EVENTS,
+        help="Event codes dropped from every session",
+    )
+    parser.add_argument("--ica", action="store_true", help="Apply ICA")
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args(argv)
+    invalid = sorted(set(args.missing) - set(RECOVERABLE_CODES))
+    if invalid:
+        parser.error(
+            f"--missing codes {invalid} can not be restored by the event "
+            f"correction, use codes of {RECOVERABLE_CODES}"
+        )
+
+    print("Writing synthetic recordings to " + str(args.data_dir))
+    data_dir = write_raw_recordings(
+        args.data_dir,
+        n_subjects=args.n_subjects,
+        n_sessions=args.n_sessions,
+        n_trials=args.n_trials,
+        missing=args.missing,
+        overwrite=args.overwrite,
+    )
+
+    print("Running preprocessing...")
+    results = run_stages(
+        preprocess_dataset,
+        dict(
+            data_dir=data_dir,
+            n_subjects=args.n_subjects,
+            n_sessions=args.n_sessions,
+            ica=args.ica,
+        ),
+    )
+
+    config = dict(
+        suite="preprocessing",
+        n_subjects=args.n_subjects,
+        n_sessions=args.n_sessions,
+        n_trials=args.n_trials,
+        missing=args.missing,
+        ica=args.ica,
+    )
+    history = load_history(args.history)
+    record = append_history(args.history, results, config)
+    print(compare(record, history))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the loaders and processing primitives on synthetic data.
+
+Run from the Python_Processing folder:
+
+    python -m benchmarks.bench_processing --n-subjects 10
+
+The synthetic derivatives (benchmarks.synthetic_data) are written once to
+the data folder and reused while their configuration does not change.
+Wall time and peak RSS of every benchmark are appended to the JSON
+history and compared with the previous run of the same configuration.
+"""
+
+import argparse
+import tempfile
+import numpy as np
+from pathlib import Path
+from benchmarks.harness import append_history, compare, load_history, run_suite
+from benchmarks.synthetic_data import (
+    N_SUBJECTS,
+    N_TRIALS,
+    SFREQ,
+    TRIALS_PER_RUN,
+    make_protocol_events,
+    write_derivatives,
+)
+from lib.data_extractions import (
+    extract_block_data_from_subject,
+    extract_data_from_subject,
+    extract_data_multisubject,
+)
+from lib.data_processing import (
+    average_in_frequency,
+    calculate_power_windowed,
+    filter_by_condition,
+    split_trial_in_time,
+    transform_for_classificator,
+)
+from lib.events_analysis import check_baseline_tags, event_correction
+
+# Default location of the synthetic data and of the history
+DATA_DIR = Path(tempfile.gettempdir()) / "inner_speech_benchmarks"
+HISTORY_FILE = Path(__file__).parent / "results" / "history.json"
+
+# Processing parameters, as used by the analysis and EMG control scripts
+WINDOW_LEN = 1.0
+WINDOW_STEP = 0.5
+EMG_WINDOW_LEN = 0.5
+EMG_WINDOW_STEP = 0.05
+EMG_T_MIN = 1
+EMG_T_MAX = 3.5
+BANDS = [(0.5, 4), (4, 8), (8, 12), (12, 30), (30, 45), (55, 100)]
+TFR_FREQS = np.logspace(*np.log10([0.5, 100]), num=64)
+MISSING_EVENTS = [42, 31, 44, 45, 46, 16, 17]
+
+# Selection of the classifier benchmark: the four Inner Speech classes
+TRANSFORM_CLASSES = [["Up"], ["Down"], ["Right"], ["Left"]]
+TRANSFORM_CONDITIONS = [["Inner"], ["Inner"], ["Inner"], ["Inner"]]
+
+
+def setup_multisubject(root_dir: Path, n_subjects: int) -> tuple:
+    return Path(root_dir), list(range(1, n_subjects + 1))
+
+
+def bench_multisubject(root_dir: Path, n_s_list: list) -> None:
+    extract_data_multisubject(root_dir, n_s_list, "eeg")
+
+
+def setup_session(root_dir: Path, datatype: str = "eeg") -> tuple:
+    X, Y = extract_block_data_from_subject(Path(root_dir), 1, datatype, 1)
+    return X.get_data(), np.asarray(Y)
+
+
+def bench_split_trial(X: np.ndarray, Y: np.ndarray) -> None:
+    split_trial_in_time(X, Y, WINDOW_LEN, WINDOW_STEP, SFREQ)
+
+
+def setup_subject(root_dir: Path) -> tuple:
+    X, Y = extract_data_from_subject(Path(root_dir), 1, "eeg")
+    # Runs cycle over the conditions: short sessions have no Inner Speech
+    _, Y_inner = filter_by_condition(Y, Y, "Inner")
+    if len(Y_inner) == 0:
+        raise ValueError(
+            "No Inner Speech trial to select, use at least "
+            f"{3 * TRIALS_PER_RUN} trials per session"
+        )
+    return X, Y
+
+
+def bench_transform(X: np.ndarray, Y: np.ndarray) -> None:
+    transform_for_classificator(X, Y, TRANSFORM_CLASSES, TRANSFORM_CONDITIONS)
+
+
+def bench_power_windowed(X: np.ndarray, Y: np.ndarray) -> None:
+    # Rectified EXG7 and EXG8 of every trial, as in the EMG control
+    for n_trial in range(len(X)):
+        for channel in (6, 7):
+            calculate_power_windowed(
+                np.abs(X[n_trial, channel]),
+                SFREQ,
+                EMG_WINDOW_LEN,
+                EMG_WINDOW_STEP,
+                EMG_T_MIN,
+                EMG_T_MAX,
+            )
+
+
+def setup_power(n_channels: int = 128, n_times: int = 1153) -> tuple:
+    rng = np.random.default_rng(23)
+    power = rng.random((n_channels, len(TFR_FREQS), n_times))
+    return power, TFR_FREQS, BANDS
+
+
+def bench_average_in_frequency(power, freqs, bands) -> None:
+    average_in_frequency(power, freqs, bands)
+
+
+def setup_events(n_trials: int, missing: list) -> tuple:
+    return (check_baseline_tags(make_protocol_events(n_trials, missing=missing)),)
+
+
+def bench_event_correction(events) -> None:
+    event_correction(events.copy())
+
+
+def get_benchmarks(root_dir: Path, n_subjects: int) -> dict:
+    """
+    Get the benchmarks of the loaders and processing primitives.
+
+    Parameters:
+    - root_dir (Path): Root of the synthetic dataset.
+    - n_subjects (int): Number of subjects loaded by the multi-subject
+      loader.
+
+    Returns:
+    - dict: (setup, function, setup arguments) of every benchmark.
+    """
+    data = dict(root_dir=root_dir)
+    return {
+        "extract_data_multisubject": (
+            setup_multisubject,
+            bench_multisubject,
+            dict(root_dir=root_dir, n_subjects=n_subjects),
+        ),
+        "split_trial_in_time": (setup_session, bench_split_trial, data),
+        "transform_for_classificator": (setup_subject, bench_transform, data),
+        "calculate_power_windowed": (
+            setup_session,
+            bench_power_windowed,
+            dict(root_dir=root_dir, datatype="exg"),
+        ),
+        "average_in_frequency": (setup_power, bench_average_in_frequency, dict()),
+        "event_correction": (
+            setup_events,
+            bench_event_correction,
+            # Event sequence of a full session
+            dict(n_trials=N_TRIALS, missing=MISSING_EVENTS),
+        ),
+    }
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--history", type=Path, default=HISTORY_FILE)
+    parser.add_argument("--n-subjects", type=int, default=N_SUBJECTS)
+    parser.add_argument("--n-trials", type=int, default=N_TRIALS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="*", help="Benchmarks to run")
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args(argv)
+    if args.n_trials < 3 * TRIALS_PER_RUN:
+        # One run of every condition (Pron, Inner and Vis) per session
+        parser.error(f"--n-trials must be at least {3 * TRIALS_PER_RUN}")
+
+    print("Writing synthetic derivatives to " + str(args.data_dir))
+    root_dir = write_derivatives(
+        args.data_dir,
+        n_subjects=args.n_subjects,
+        n_trials=args.n_trials,
+        overwrite=args.overwrite,
+    )
+
+    benchmarks = get_benchmarks(root_dir, args.n_subjects)
+    results = run_suite(benchmarks, names=args.only, repeat=args.repeat)
+
+    config = dict(
+        suite="processing",
+        n_subjects=args.n_subjects,
+        n_trials=args.n_trials,
+        repeat=args.repeat,
+    )
+    history = load_history(args.history)
+    record = append_history(args.history, results, config)
+    print(compare(record, history))
+
+
+if __name__ == "__main__":
+    main()
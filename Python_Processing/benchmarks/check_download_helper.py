@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+"""
+Check of the downloader (lib.download_helper) against a local stand-in of
+the OpenNeuro dataset.
+
+Run from the Python_Processing folder (needs DataLad and git-annex):
+
+    python -m benchmarks.check_download_helper
+
+A small DataLad dataset with the layout of ds003626 (raw BDF files and a
+derivatives subdataset, with files of identical content sharing one
+git-annex key) is created in a temporary folder and used as the source
+of get_derivatives and get_raw_eeg, so no network access is needed. The
+hidden cache is also created in that folder. Every materialize method is
+run on a fresh visible directory, and the check fails if the download
+raises, if a visible file differs from the source, is not writable or
+shares its data with another file, if an annexed object of the hidden
+cache was made writable, or if the hidden cache fails ``git annex fsck``
+afterwards. The exit status is 1 if any case fails.
+"""
+
+import argparse
+import stat
+import subprocess
+import sys
+import tempfile
+import numpy as np
+from pathlib import Path
+from datalad import api as dl
+
+# Files of the stand-in dataset and their size in bytes
+RAW_FILES = [
+    f"sub-0{n_s}/ses-0{n_b}/eeg/sub-0{n_s}_ses-0{n_b}_task-innerspeech_eeg.bdf"
+    for n_s in (1, 2)
+    for n_b in (1, 2)
+]
+DERIVATIVE_FILES = [
+    f"derivatives/sub-0{n_s}/ses-0{n_b}/sub-0{n_s}_ses-0{n_b}_{suffix}"
+    for n_s in (1, 2)
+    for n_b in (1, 2)
+    for suffix in ("eeg-epo.fif", "events.dat", "report.pkl")
+]
+FILE_SIZE = 256 * 1024
+
+# Files with the content of another one (same annex key): with 2 jobs, in
+# the next download batch and in the same batch
+DUPLICATE_FILES = {
+    "derivatives/sub-01/ses-02/sub-01_ses-02_eeg-epo.fif": DERIVATIVE_FILES[0],
+    RAW_FILES[1]: RAW_FILES[0],
+}
+
+CASES = ["copy", "reflink", "hardlink", "move", "auto"]
+
+
+def make_source(root: Path, random_state: int = 23) -> dict:
+    """
+    Create the stand-in DataLad dataset.
+
+    Parameters:
+    - root (Path): Folder of the dataset.
+    - random_state (int): Seed of the file contents. Default 23.
+
+    Returns:
+    - dict: Content of every file, keyed by its relative path.
+    """
+    rng = np.random.default_rng(random_state)
+    ds = dl.create(root, result_renderer="disabled")
+    ds.create("derivatives", result_renderer="disabled")
+
+    contents = dict()
+    for rel in RAW_FILES + DERIVATIVE_FILES:
+        if rel in DUPLICATE_FILES:
+            contents[rel] = contents[DUPLICATE_FILES[rel]]
+        else:
+            contents[rel] = rng.bytes(FILE_SIZE)
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(contents[rel])
+
+    ds.save(recursive=True, message="Stand-in dataset", result_renderer="disabled")
+
+    return contents
+
+
+def check_case(
+    source: Path, out_dir: Path, contents: dict, materialize: str, jobs: int
+) -> list:
+    """
+    Download the stand-in dataset with one materialize method.
+
+    Parameters:
+    - source (Path): Stand-in DataLad dataset.
+    - out_dir (Path): Parent of the visible directory.
+    - contents (dict): Expected content of every file.
+    - materialize (str): Materialize method.
+    - jobs (int): Number of files fetched concurrently.
+
+    Returns:
+    - list: Description of every problem found, empty if none.
+    """
+    from lib.download_helper import get_derivatives, get_raw_eeg
+
+    problems = []
+    for get_files in (get_derivatives, get_raw_eeg):
+        try:
+            get_files(out_dir, source=str(source), jobs=jobs, materialize=materialize)
+        except Exception as exc:
+            problems.append(f"{get_files.__name__} raised {exc!r}")
+
+    dataset_path = out_dir / "ds003626"
+    for rel, content in contents.items():
+        path = dataset_path / rel
+        if not path.is_file() or path.is_symlink():
+            problems.append(f"{rel} missing")
+        elif path.read_bytes() != content:
+            problems.append(f"{rel} differs from the source")
+        elif not path.stat().st_mode & stat.S_IWUSR:
+            problems.append(f"{rel} is not writable")
+        elif path.stat().st_nlink > 1:
+            problems.append(f"{rel} shares its data with another file")
+
+    hidden = Path(tempfile.gettempdir()) / "datalad_cache" / "ds003626"
+    for repo in (hidden, hidden / "derivatives"):
+        # Annexed objects must stay write-protected
+        for obj in (repo / ".git" / "annex" / "objects").rglob("*"):
+            if obj.is_file() and obj.stat().st_mode & stat.S_IWUSR:
+                problems.append(f"annexed object {obj.name} is writable")
+
+        fsck = subprocess.run(
+            ["git", "annex", "fsck", "--fast", "--quiet"],
+            cwd=repo,
+            capture_output=True,
+            text=True,
+        )
+        if fsck.returncode != 0:
+            problems.append(f"git annex fsck failed in {repo.name}: {fsck.stdout}")
+
+    return problems
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=2)
+    parser.add_argument("--materialize", nargs="*", default=CASES, choices=CASES)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        contents = make_source(tmp_dir / "source")
+
+        # Hidden cache inside the temporary folder, not in the real one
+        tempfile.tempdir = str(tmp_dir)
+
+        failed = 0
+        for materialize in args.materialize:
+            problems = check_case(
+                tmp_dir / "source",
+                tmp_dir / f"visible_{materialize}",
+                contents,
+                materialize,
+                args.jobs,
+            )
+            failed += bool(problems)
+            print(f"{materialize:<10} {'FAILED' if problems else 'ok'}")
+            for problem in problems:
+                print(f"    {problem}")
+
+        # Let the temporary folder be removed (annexed objects are read-only)
+        subprocess.run(["chmod", "-R", "u+w", str(tmp_dir)], check=False)
+
+    if failed:
+        print(f"{failed} of {len(args.materialize)} cases failed")
+        sys.exit(1)
+    print(f"All {len(args.materialize)} cases passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""
+Validation of the FFT Morlet engine (lib.tfr_engine) against MNE.
+
+Run from the Python_Processing folder:
+
+    python -m benchmarks.check_tfr_engine
+
+Every case transforms the same random trials with morlet_tfr and with
+mne.time_frequency.tfr_array_morlet, and compares the outputs relative to
+the largest MNE coefficient. The cases cover decimation, chunk sizes that
+do and do not divide the number of signals (trial, channel), scalar and
+per-frequency cycles, wavelets without zero mean, power output and
+single precision. The accumulated power and ITC (lib.accumulators) are
+checked against tfr_morlet averages, with a flat channel. The exit
+status is 1 if any case is above its tolerance.
+"""
+
+import argparse
+import sys
+import mne
+import numpy as np
+from mne.time_frequency import tfr_array_morlet, tfr_morlet
+from lib.accumulators import TFRAccumulator
+from lib.tfr_engine import morlet_tfr
+
+# Shapes of the check, small enough to run in seconds
+SFREQ = 256
+N_TRIALS = 3
+N_CHANNELS = 5
+N_TIMES = 512
+
+# Relative tolerance of double and single precision outputs
+TOLERANCE = 1e-10
+TOLERANCE_SINGLE = 1e-5
+
+# Cases: name and morlet_tfr options (the MNE reference uses the same
+# frequencies, cycles, zero_mean, decim and output, with FFT convolution)
+CASES = [
+    ("default", dict()),
+    ("decim 3", dict(decim=3)),
+    ("decim 7", dict(decim=7)),
+    # 15 signals: chunks of 4 leave a last chunk of 3
+    ("chunk 4", dict(chunk_size=4)),
+    ("chunk 1", dict(chunk_size=1)),
+    ("chunk 15", dict(chunk_size=15)),
+    ("chunk 4, decim 3", dict(chunk_size=4, decim=3)),
+    ("cycles per frequency", dict(n_cycles="freqs")),
+    ("no zero mean", dict(zero_mean=False)),
+    ("power", dict(output="power")),
+    ("power, chunk 4, decim 2", dict(output="power", chunk_size=4, decim=2)),
+    ("complex64", dict(dtype=np.complex64)),
+    # Reference by direct convolution instead of FFT
+    ("direct convolution", dict(use_fft=False)),
+]
+
+
+def make_trials(random_state: int = 23) -> np.ndarray:
+    """
+    Random trials with a flat channel.
+
+    Parameters:
+    - random_state (int): Seed of the trials. Default 23.
+
+    Returns:
+    - np.ndarray: Trials (N_TRIALS, N_CHANNELS, N_TIMES).
+    """
+    rng = np.random.default_rng(random_state)
+    X = rng.standard_normal((N_TRIALS, N_CHANNELS, N_TIMES))
+    X[:, -1] = 0
+
+    return X
+
+
+def check_case(X: np.ndarray, freqs: np.ndarray, options: dict) -> float:
+    """
+    Relative error of morlet_tfr against tfr_array_morlet.
+
+    Parameters:
+    - X (np.ndarray): Trials (n_trials, n_channels, n_times).
+    - freqs (np.ndarray): Frequencies of interest.
+    - options (dict): Options of morlet_tfr. n_cycles="freqs" uses one
+      cycle per Hz, as TRF_representations.py, and use_fft=False compares
+      with the direct convolution of MNE.
+
+    Returns:
+    - float: Largest absolute difference over the largest MNE coefficient.
+    """
+    options = dict(options)
+    n_cycles = options.pop("n_cycles", 5.0)
+    if isinstance(n_cycles, str):
+        n_cycles = freqs
+    params = dict(
+        sfreq=SFREQ,
+        freqs=freqs,
+        n_cycles=n_cycles,
+        zero_mean=options.pop("zero_mean", True),
+        decim=options.pop("decim", 1),
+    )
+    output = options.pop("output", "complex")
+    use_fft = options.pop("use_fft", True)
+
+    tfr = morlet_tfr(X, output=output, **params, **options)
+    expected = tfr_array_morlet(X, output=output, use_fft=use_fft, **params)
+
+    return np.abs(tfr - expected).max() / np.abs(expected).max()
+
+
+def check_accumulator(X: np.ndarray, freqs: np.ndarray) -> float:
+    """
+    Relative error of the accumulated power and ITC against tfr_morlet.
+
+    Parameters:
+    - X (np.ndarray): Trials (n_trials, n_channels, n_times).
+    - freqs (np.ndarray): Frequencies of interest.
+
+    Returns:
+    - float: Largest relative error of the power and ITC.
+    """
+    info = mne.create_info(X.shape[1], SFREQ, "eeg")
+    epochs = mne.EpochsArray(X, info, verbose="WARNING")
+    power, itc = tfr_morlet(
+        epochs, freqs, n_cycles=5.0, use_fft=True, decim=2, verbose="WARNING"
+    )
+
+    accumulator = TFRAccumulator(SFREQ, freqs, 5.0, use_fft=True, decim=2)
+    for trial in X:
+        accumulator.add(trial[np.newaxis])
+
+    # Flat channels: MNE versions give NaN or 0, the accumulator 0
+    errors = []
+    for value, expected in ((accumulator.power, power), (accumulator.itc, itc)):
+        expected = np.nan_to_num(expected.data)
+        errors.append(np.abs(value - expected).max() / expected.max())
+
+    return max(errors)
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--random-state", type=int, default=23)
+    args = parser.parse_args(argv)
+
+    X = make_trials(args.random_state)
+    freqs = np.logspace(np.log10(4), np.log10(60), 12)
+
+    results = [
+        (name, check_case(X, freqs, options), options.get("dtype"))
+        for name, options in CASES
+    ]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        results.append(("accumulated power and ITC", check_accumulator(X, freqs), None))
+
+    failed = 0
+    for name, error, dtype in results:
+        tolerance = TOLERANCE_SINGLE if dtype == np.complex64 else TOLERANCE
+        ok = error <= tolerance
+        failed += not ok
+        print(f"{name:<28} {error:.2e} {'ok' if ok else 'FAILED'}")
+
+    if failed:
+        print(f"{failed} of {len(results)} cases above tolerance")
+        sys.exit(1)
+    print(f"All {len(results)} cases match MNE")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark runner with a JSON history.
+
+Every benchmark runs in a fresh worker process, so its peak resident
+memory is not mixed with the one of the previous benchmarks. The setup of
+a benchmark (e.g. loading its input data) is not timed. Pipelines are
+timed stage by stage with lib.instrumentation.StageLog. Results are
+appended to a JSON history together with the commit and the library
+versions, so runs of different commits can be compared.
+"""
+
+import contextlib
+import io
+import json
+import multiprocessing
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+from lib.instrumentation import StageLog
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def run_benchmark(
+    setup: Callable,
+    func: Callable,
+    kwargs: Optional[dict] = None,
+    repeat: int = 3,
+    isolate: bool = True,
+) -> dict:
+    """
+    Time a benchmark.
+
+    Parameters:
+    - setup (Callable): Module-level function called as ``setup(**kwargs)``
+      that returns the arguments (tuple) of func. Not timed.
+    - func (Callable): Module-level function to time.
+    - kwargs (dict): Keyword arguments of setup. Default None.
+    - repeat (int): Number of timed calls. Default 3.
+    - isolate (bool): Whether to run in a new worker process. Default True.
+
+    Returns:
+    - dict: Best and mean wall time (s), CPU time (s) and peak RSS (MB) of
+      the setup and of the whole benchmark.
+    """
+    if not isolate:
+        return _run(setup, func, kwargs or dict(), repeat)
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(_run, setup, func, kwargs or dict(), repeat).result()
+
+
+def run_suite(benchmarks: dict, names: Optional[list] = None, **options) -> dict:
+    """
+    Run a set of benchmarks.
+
+    Parameters:
+    - benchmarks (dict): (setup, func, kwargs) of every benchmark, keyed by
+      name.
+    - names (list): Names of the benchmarks to run. Default all.
+    - **options: Options of run_benchmark (repeat, isolate).
+
+    Returns:
+    - dict: Results of every benchmark, keyed by name.
+    """
+    results = dict()
+    for name, (setup, func, kwargs) in benchmarks.items():
+        if names and name not in names:
+            continue
+        print(f"Running {name}...")
+        results[name] = run_benchmark(setup, func, kwargs, **options)
+        print(
+            f"    {results[name]['wall_time']:.3f} s, "
+            f"{_format_mb(results[name]['peak_rss_mb'])}"
+        )
+
+    return results
+
+
+def run_stages(
+    func: Callable, kwargs: Optional[dict] = None, isolate: bool = True
+) -> dict:
+    """
+    Time a pipeline stage by stage.
+
+    Parameters:
+    - func (Callable): Module-level function called as
+      ``func(stage_log, **kwargs)`` that measures its stages with the
+      lib.instrumentation.StageLog.
+    - kwargs (dict): Keyword arguments of func. Default None.
+    - isolate (bool): Whether to run in a new worker process. Default True.
+
+    Returns:
+    - dict: Calls, wall time (s), CPU time (s), peak RSS (MB) and MB read
+      and written of every stage, and of the whole pipeline ("total").
+    """
+    if not isolate:
+        return _run_stages(func, kwargs or dict())
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(_run_stages, func, kwargs or dict()).result()
+
+
+def append_history(history_file: Path, results: dict, config: dict) -> dict:
+    """
+    Append the results of a run to the JSON history.
+
+    Parameters:
+    - history_file (Path): The JSON history file.
+    - results (dict): Results of run_suite.
+    - config (dict): Configuration of the run (data shapes, repeats, ...).
+
+    Returns:
+    - dict: The appended record.
+    """
+    history_file = Path(history_file)
+    history = load_history(history_file)
+
+    record = {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(Path(__file__).parent),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "versions": _versions(),
+        "config": config,
+        "results": results,
+    }
+    history.append(record)
+
+    history_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(history_file, "w") as f:
+        json.dump(history, f, indent=2)
+
+    return record
+
+
+def load_history(history_file: Path) -> list:
+    """
+    Load the JSON history.
+
+    Parameters:
+    - history_file (Path): The JSON history file.
+
+    Returns:
+    - list: The recorded runs, oldest first (empty if there is no file).
+    """
+    if not Path(history_file).exists():
+        return []
+
+    with open(history_file) as f:
+        return json.load(f)
+
+
+def compare(record: dict, history: list) -> str:
+    """
+    Compare a run with the last previous run of the same configuration.
+
+    Parameters:
+    - record (dict): The run to compare.
+    - history (list): The runs recorded before it.
+
+    Returns:
+    - str: Table with the wall time and peak RSS of every benchmark and
+      their ratio to the previous run.
+    """
+    previous = None
+    for old in history:
+        if old["config"] == record["config"]:
+            previous = old
+
+    lines = [
+        f"{'benchmark':<32}{'wall (s)':>10}{'ratio':>8}{'peak RSS':>12}{'ratio':>8}"
+    ]
+    for name, result in record["results"].items():
+        old = (previous or {}).get("results", {}).get(name)
+        lines.append(
+            f"{name:<32}{result['wall_time']:>10.3f}"
+            f"{_ratio(result['wall_time'], old and old['wall_time']):>8}"
+            f"{_format_mb(result['peak_rss_mb']):>12}"
+            f"{_ratio(result['peak_rss_mb'], old and old['peak_rss_mb']):>8}"
+        )
+    if previous is not None:
+        lines.append(f"Compared with {previous['commit']} ({previous['date']})")
+
+    return "\n".join(lines)
+
+
+def _run(setup: Callable, func: Callable, kwargs: dict, repeat: int) -> dict:
+    # Library output (prints, MNE logs) is not part of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        args = setup(**kwargs)
+        setup_rss = _peak_rss_mb()
+
+        wall_times = []
+        cpu_times = []
+        for _ in range(repeat):
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            func(*args)
+            cpu_times.append(time.process_time() - cpu)
+            wall_times.append(time.perf_counter() - wall)
+
+    return {
+        "wall_time": min(wall_times),
+        "wall_time_mean": sum(wall_times) / len(wall_times),
+        "cpu_time": min(cpu_times),
+        "repeat": repeat,
+        "setup_rss_mb": setup_rss,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _run_stages(func: Callable, kwargs: dict) -> dict:
+    stage_log = StageLog()
+    with contextlib.redirect_stdout(io.StringIO()):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        func(stage_log, **kwargs)
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+
+    summary = stage_log.summary()
+    stages = summary.drop(columns=["mean_wall_time", "wall_share"]).to_dict("index")
+    stages["total"] = dict(
+        calls=1,
+        wall_time=wall,
+        cpu_time=cpu,
+        # The peak RSS is reset at the start of every stage
+        peak_rss_mb=summary["peak_rss_mb"].max(),
+        read_mb=summary["read_mb"].sum(),
+        write_mb=summary["write_mb"].sum(),
+    )
+
+    return stages
+
+
+def _peak_rss_mb() -> Optional[float]:
+    # Peak resident memory of the process (kB on Linux, bytes on macOS)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024
+    return round(peak / 1024, 1)
+
+
+def _git_commit(directory: Path) -> Optional[str]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=directory,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=directory,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return commit + ("-dirty" if dirty else "")
+
+
+def _versions() -> dict:
+    versions = dict()
+    for module in ("numpy", "scipy", "mne", "pandas"):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return versions
+
+
+def _format_mb(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.0f} MB"
+
+
+def _ratio(value: Optional[float], old: Optional[float]) -> str:
+    if value is None or not old:
+        return "-"
+    return f"{value / old:.2f}x"
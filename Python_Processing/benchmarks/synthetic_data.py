@@ -0,0 +1,530 @@
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic Inner Speech data for the benchmarks.
+
+The generated files follow the layout and shapes of the published
+derivatives (OpenNeuro ds003626): 128 EEG and 8 EXG channels at 256 Hz
+(1024 Hz raw data decimated by 4), -0.5 to 4 s epochs around the cue and
+about 200 trials per session. The event sequences follow the stimulation
+protocol checked by lib.events_analysis.
+
+Raw recordings are BioSemi BDF files (24 bit samples, 1 s data records)
+with the 136 channels of the acquisition and the Status channel, to run
+the preprocessing of InnerSpeech_preprocessing.py.
+"""
+
+import json
+import pickle
+import mne
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Iterator, Optional
+from lib.utils import sub_name
+
+# Shapes of the derivatives
+N_SUBJECTS = 10
+N_SESSIONS = 3
+N_TRIALS = 200
+N_EEG = 128
+N_EXG = 8
+RAW_SFREQ = 1024
+DS_RATE = 4
+SFREQ = RAW_SFREQ // DS_RATE
+TMIN = -0.5
+TMAX = 4
+BASELINE_LEN = 15
+
+# Trials of a run (balanced over the four classes)
+TRIALS_PER_RUN = 40
+
+# Condition of every run, cycled: Pron, Inner and Vis blocks
+RUN_BLOCKS = (21, 22, 23)
+
+# Time between consecutive protocol marks (raw samples at 1024 Hz)
+PROTOCOL_TIMING = {
+    "start": 2048,  # Protocol start -> baseline start
+    "baseline": BASELINE_LEN * RAW_SFREQ,  # Baseline start -> baseline end
+    "run": 2048,  # Run start -> block tag -> first trial
+    "concentration": 512,  # 42 -> cue (31-34)
+    "cue": 512,  # Cue -> action interval (44)
+    "action": 2560,  # 44 -> 45
+    "relax": 1024,  # 45 -> 46
+    "rest": 1536,  # 46 -> next trial, question or end of run
+    "question": 2048,  # 17 -> answer
+    "inter_run": 10240,  # 16 -> 51 -> next run
+}
+
+# Events that event_correction can restore when missing
+RECOVERABLE_CODES = (16, 17, 31, 32, 33, 34, 42, 44, 45, 46)
+
+# BioSemi ranges: 24 bit samples, 1/32 uV resolution
+BDF_DIGITAL_RANGE = (-8388608, 8388607)
+BDF_PHYSICAL_RANGE = (-262144, 262143)
+
+# Status channel: initial value (see EVENT_CODES["EXCLUDE"]) and samples of
+# every trigger pulse
+STATUS_INIT = 65536
+STATUS_INIT_LEN = RAW_SFREQ
+PULSE_LEN = 20
+
+
+def make_protocol_events(
+    n_trials: int = N_TRIALS,
+    question_rate: float = 0.1,
+    missing: Optional[list] = None,
+    sfreq: float = RAW_SFREQ,
+    seed: int = 23,
+) -> pd.DataFrame:
+    """
+    Build the raw event sequence of a recording session.
+
+    Parameters:
+    - n_trials (int): Number of trials (multiple of 4). Default N_TRIALS.
+    - question_rate (float): Fraction of trials followed by a cognitive
+      control question. Default 0.1.
+    - missing (list): Event codes to drop, one occurrence per item, to
+      exercise the event correction (see RECOVERABLE_CODES). Codes without
+      a droppable occurrence are kept (16 in single-run sessions, 17
+      without questions). Default None.
+    - sfreq (float): Sampling frequency of the event times. Default
+      RAW_SFREQ.
+    - seed (int): Seed of the random generator. Default 23.
+
+    Returns:
+    - pd.DataFrame: Events with "Time", "Trigger" and "Code" columns, as
+      returned by lib.data_extractions.get_events_from_raw.
+    """
+    if n_trials % 4:
+        raise ValueError("n_trials must be a multiple of 4")
+
+    rng = np.random.default_rng(seed)
+    timing = {k: int(round(v * sfreq / RAW_SFREQ)) for k, v in PROTOCOL_TIMING.items()}
+
+    codes = []
+    times = []
+
+    def add(code, delay):
+        times.append((times[-1] if times else 0) + delay)
+        codes.append(code)
+
+    # Initial status, protocol start and baseline
+    add(65536, 0)
+    add(11, timing["start"])
+    add(13, timing["start"])
+    add(14, timing["baseline"])
+
+    n_runs = int(np.ceil(n_trials / TRIALS_PER_RUN))
+    for n_run in range(n_runs):
+        run_trials = min(TRIALS_PER_RUN, n_trials - n_run * TRIALS_PER_RUN)
+        if n_run > 0:
+            add(51, timing["inter_run"])
+        add(15, timing["inter_run"] if n_run > 0 else timing["run"])
+        add(RUN_BLOCKS[n_run % len(RUN_BLOCKS)], timing["run"])
+
+        tags = rng.permutation(np.repeat([31, 32, 33, 34], run_trials // 4))
+        for k, tag in enumerate(tags):
+            add(42, timing["run"] if k == 0 else timing["rest"])
+            add(int(tag), timing["concentration"])
+            add(44, timing["cue"])
+            add(45, timing["action"])
+            add(46, timing["relax"])
+            if rng.random() < question_rate:
+                add(17, timing["rest"])
+                add(int(tag) + 30, timing["question"])
+        add(16, timing["rest"])
+    add(12, timing["run"])
+
+    codes = np.array(codes)
+    keep = np.ones(len(codes), dtype=bool)
+    for code in missing or []:
+        index = _pick_missing(codes, keep, code, rng)
+        if index is not None:
+            keep[index] = False
+
+    return pd.DataFrame(
+        {
+            "Time": np.array(times)[keep],
+            "Trigger": np.zeros(keep.sum(), dtype=int),
+            "Code": codes[keep],
+        }
+    )
+
+
+def derivative_events(events: pd.DataFrame, n_b: int) -> np.ndarray:
+    """
+    Build the trial events of the derivatives from a raw event sequence.
+
+    Parameters:
+    - events (pd.DataFrame): Raw events (see make_protocol_events).
+    - n_b (int): The block (session) number.
+
+    Returns:
+    - np.ndarray: Events (n_trials, 4): time, class (0-3), condition
+      (0 Pron, 1 Inner, 2 Vis) and block.
+    """
+    codes = events["Code"].to_numpy()
+    times = events["Time"].to_numpy()
+
+    # Condition of every event: the last block tag before it
+    is_block = np.isin(codes, RUN_BLOCKS)
+    last_block = np.maximum.accumulate(np.where(is_block, np.arange(len(codes)), 0))
+    condition = codes[last_block] - RUN_BLOCKS[0]
+
+    tags = np.isin(codes, (31, 32, 33, 34))
+    n_trials = tags.sum()
+
+    return np.column_stack(
+        (
+            times[tags],
+            codes[tags] - 31,
+            condition[tags],
+            np.full(n_trials, n_b),
+        )
+    ).astype(int)
+
+
+def make_info(datatype: str) -> mne.Info:
+    """
+    Get the measurement info of a type of derivative.
+
+    Parameters:
+    - datatype (str): "eeg", "exg" or "baseline".
+
+    Returns:
+    - mne.Info: Info of the epochs (with the biosemi128 montage for EEG).
+    """
+    montage = mne.channels.make_standard_montage("biosemi128")
+    eeg_names = montage.ch_names[:N_EEG]
+    exg_names = [f"EXG{k}" for k in range(1, N_EXG + 1)]
+
+    if datatype == "eeg":
+        info = mne.create_info(eeg_names, SFREQ, "eeg")
+        info.set_montage(montage)
+    elif datatype == "exg":
+        info = mne.create_info(exg_names, SFREQ, "eeg")
+    elif datatype == "baseline":
+        info = mne.create_info(
+            eeg_names + exg_names + ["Status"],
+            SFREQ,
+            ["eeg"] * (N_EEG + N_EXG) + ["stim"],
+        )
+        info.set_montage(montage, on_missing="ignore")
+    else:
+        raise ValueError("Invalid Datatype")
+
+    return info
+
+
+def write_derivatives(
+    root_dir: Path,
+    n_subjects: int = N_SUBJECTS,
+    n_sessions: int = N_SESSIONS,
+    n_trials: int = N_TRIALS,
+    seed: int = 23,
+    overwrite: bool = False,
+) -> Path:
+    """
+    Write synthetic derivatives (EEG, EXG and baseline epochs, events and
+    reports) for every subject and session.
+
+    Existing derivatives generated with the same configuration are reused
+    unless overwrite is True.
+
+    Parameters:
+    - root_dir (Path): Root of the synthetic dataset.
+    - n_subjects (int): Number of subjects. Default N_SUBJECTS.
+    - n_sessions (int): Number of sessions per subject. Default N_SESSIONS.
+    - n_trials (int): Number of trials per session. Default N_TRIALS.
+    - seed (int): Seed of the random generator. Default 23.
+    - overwrite (bool): Whether to regenerate existing data. Default False.
+
+    Returns:
+    - Path: The root of the dataset.
+    """
+    root_dir = Path(root_dir)
+    config = dict(
+        n_subjects=n_subjects,
+        n_sessions=n_sessions,
+        n_trials=n_trials,
+        n_eeg=N_EEG,
+        n_exg=N_EXG,
+        sfreq=SFREQ,
+        seed=seed,
+    )
+    config_file = root_dir / "derivatives" / "synthetic.json"
+    if not overwrite and config_file.exists():
+        with open(config_file) as f:
+            if json.load(f) == config:
+                return root_dir
+
+    rng = np.random.default_rng(seed)
+    n_times = int(round((TMAX - TMIN) * SFREQ)) + 1
+    n_baseline = BASELINE_LEN * SFREQ + 1
+
+    for n_s in range(1, n_subjects + 1):
+        num_s = sub_name(n_s)
+        for n_b in range(1, n_sessions + 1):
+            sub_dir = root_dir / "derivatives" / num_s / f"ses-0{n_b}"
+            sub_dir.mkdir(parents=True, exist_ok=True)
+            base_name = sub_dir / f"{num_s}_ses-0{n_b}"
+
+            raw_events = make_protocol_events(n_trials, seed=seed + 10 * n_s + n_b)
+            Y = derivative_events(raw_events, n_b)
+            events = np.column_stack(
+                (np.arange(len(Y)) * n_times, np.zeros(len(Y), int), Y[:, 1] + 31)
+            )
+            event_id = dict(Arriba=31, Abajo=32, Derecha=33, Izquierda=34)
+
+            for datatype, n_channels in (("eeg", N_EEG), ("exg", N_EXG)):
+                data = rng.standard_normal((len(Y), n_channels, n_times)) * 1e-5
+                epochs = mne.EpochsArray(
+                    data,
+                    make_info(datatype),
+                    events=events,
+                    tmin=TMIN,
+                    event_id=event_id,
+                    verbose="WARNING",
+                )
+                epochs.save(
+                    f"{base_name}_{datatype}-epo.fif",
+                    fmt="double",
+                    overwrite=True,
+                    verbose="WARNING",
+                )
+                del epochs, data
+
+            data = rng.standard_normal((1, N_EEG + N_EXG + 1, n_baseline)) * 1e-5
+            data[:, -1] = 0
+            baseline = mne.EpochsArray(
+                data,
+                make_info("baseline"),
+                events=np.array([[0, 0, 13]]),
+                event_id=dict(Baseline=13),
+                verbose="WARNING",
+            )
+            baseline.save(
+                f"{base_name}_baseline-epo.fif",
+                fmt="double",
+                overwrite=True,
+                verbose="WARNING",
+            )
+
+            # Events as in the published derivatives (pickled array)
+            with open(f"{base_name}_events.dat", "wb") as f:
+                pickle.dump(Y, f)
+
+            report = dict(Age=30, Gender="F", Recording_time=0, Ans_R=0, Ans_W=0)
+            report["EMG_trials"] = np.sort(
+                rng.choice(len(Y), size=len(Y) // 20, replace=False)
+            )
+            with open(f"{base_name}_report.pkl", "wb") as f:
+                pickle.dump(report, f, pickle.HIGHEST_PROTOCOL)
+
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+
+    return root_dir
+
+
+def write_bdf(
+    file_name: Path,
+    ch_names: list,
+    sfreq: int,
+    records: Iterator[np.ndarray],
+    n_records: int,
+    stim_channel: str = "Status",
+) -> None:
+    """
+    Write a BioSemi BDF file, one data record (1 s) at a time.
+
+    Parameters:
+    - file_name (Path): The BDF file.
+    - ch_names (list): Channel names.
+    - sfreq (int): Sampling frequency (samples per record).
+    - records (Iterator[np.ndarray]): Data records (n_channels, sfreq),
+      in uV, except the stim channel (integer trigger values).
+    - n_records (int): Number of data records.
+    - stim_channel (str): Name of the stim channel. Default "Status".
+
+    Returns:
+    - None
+    """
+    n_channels = len(ch_names)
+    is_stim = np.array([name == stim_channel for name in ch_names])
+    dig_min, dig_max = BDF_DIGITAL_RANGE
+    phys_min, phys_max = BDF_PHYSICAL_RANGE
+    gain = np.where(is_stim, 1.0, (dig_max - dig_min) / (phys_max - phys_min))
+
+    def field(value, width):
+        return f"{value:<{width}}".encode("ascii")[:width]
+
+    def fields(values, width):
+        return b"".join(field(value, width) for value in values)
+
+    header = b"".join(
+        (
+            b"\xffBIOSEMI",
+            field("Synthetic", 80),
+            field("Synthetic Inner Speech recording", 80),
+            field("01.01.20", 8),
+            field("00.00.00", 8),
+            field(256 * (n_channels + 1), 8),
+            field("24BIT", 44),
+            field(n_records, 8),
+            field(1, 8),
+            field(n_channels, 4),
+            fields(ch_names, 16),
+            fields(
+                ["Triggers and Status" if s else "Active Electrode" for s in is_stim],
+                80,
+            ),
+            fields(["Boolean" if s else "uV" for s in is_stim], 8),
+            fields([dig_min if s else phys_min for s in is_stim], 8),
+            fields([dig_max if s else phys_max for s in is_stim], 8),
+            fields([dig_min] * n_channels, 8),
+            fields([dig_max] * n_channels, 8),
+            fields(["No filtering" if s else "HP:DC; LP:208 Hz" for s in is_stim], 80),
+            fields([sfreq] * n_channels, 8),
+            fields([""] * n_channels, 32),
+        )
+    )
+
+    with open(file_name, "wb") as f:
+        f.write(header)
+        for record in records:
+            digital = np.clip(np.round(record * gain[:, np.newaxis]), dig_min, dig_max)
+            # Little-endian 24 bit samples, channel after channel
+            samples = digital.astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3]
+            f.write(samples.tobytes())
+
+
+def make_status(events: pd.DataFrame, n_times: int) -> np.ndarray:
+    """
+    Build the Status channel of a recording from its event sequence.
+
+    Parameters:
+    - events (pd.DataFrame): Raw events (see make_protocol_events).
+    - n_times (int): Number of samples of the recording.
+
+    Returns:
+    - np.ndarray: Status values: STATUS_INIT at the start of the
+      recording, then a pulse of PULSE_LEN samples for every event.
+    """
+    status = np.zeros(n_times, dtype=np.int32)
+    for time, code in zip(events["Time"], events["Code"]):
+        if code == STATUS_INIT:
+            status[time : time + STATUS_INIT_LEN] = code
+        else:
+            status[time : time + PULSE_LEN] = code
+
+    return status
+
+
+def write_raw_recordings(
+    data_dir: Path,
+    n_subjects: int = N_SUBJECTS,
+    n_sessions: int = N_SESSIONS,
+    n_trials: int = N_TRIALS,
+    missing: Optional[list] = None,
+    seed: int = 23,
+    overwrite: bool = False,
+) -> Path:
+    """
+    Write synthetic raw BDF recordings for every subject and session, with
+    the layout of the OpenNeuro dataset.
+
+    Existing recordings generated with the same configuration are reused
+    unless overwrite is True.
+
+    Parameters:
+    - data_dir (Path): Root of the synthetic dataset.
+    - n_subjects (int): Number of subjects. Default N_SUBJECTS.
+    - n_sessions (int): Number of sessions per subject. Default N_SESSIONS.
+    - n_trials (int): Number of trials per session. Default N_TRIALS.
+    - missing (list): Event codes dropped from every session (see
+      make_protocol_events). Default None.
+    - seed (int): Seed of the random generator. Default 23.
+    - overwrite (bool): Whether to regenerate existing data. Default False.
+
+    Returns:
+    - Path: The root of the dataset.
+    """
+    data_dir = Path(data_dir)
+    config = dict(
+        n_subjects=n_subjects,
+        n_sessions=n_sessions,
+        n_trials=n_trials,
+        missing=list(missing or []),
+        n_eeg=N_EEG,
+        n_exg=N_EXG,
+        sfreq=RAW_SFREQ,
+        seed=seed,
+    )
+    config_file = data_dir / "synthetic.json"
+    if not overwrite and config_file.exists():
+        with open(config_file) as f:
+            if json.load(f) == config:
+                return data_dir
+
+    montage = mne.channels.make_standard_montage("biosemi128")
+    ch_names = (
+        montage.ch_names[:N_EEG] + [f"EXG{k}" for k in range(1, N_EXG + 1)] + ["Status"]
+    )
+    rng = np.random.default_rng(seed)
+    line = 5 * np.sin(2 * np.pi * 50 * np.arange(RAW_SFREQ) / RAW_SFREQ)
+
+    def records(status):
+        for start in range(0, len(status), RAW_SFREQ):
+            # Background activity and power line noise (uV)
+            record = rng.standard_normal((len(ch_names), RAW_SFREQ)) * 10 + line
+            record[-1] = status[start : start + RAW_SFREQ]
+            yield record
+
+    for n_s in range(1, n_subjects + 1):
+        num_s = sub_name(n_s)
+        for n_b in range(1, n_sessions + 1):
+            eeg_dir = data_dir / num_s / f"ses-0{n_b}" / "eeg"
+            eeg_dir.mkdir(parents=True, exist_ok=True)
+
+            events = make_protocol_events(
+                n_trials, missing=missing, seed=seed + 10 * n_s + n_b
+            )
+            # Whole records, with 2 s after the protocol end
+            n_records = int(np.ceil(events["Time"].iloc[-1] / RAW_SFREQ)) + 2
+            status = make_status(events, n_records * RAW_SFREQ)
+
+            write_bdf(
+                eeg_dir / f"{num_s}_ses-0{n_b}_task-innerspeech_eeg.bdf",
+                ch_names,
+                RAW_SFREQ,
+                records(status),
+                n_records,
+            )
+
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+
+    return data_dir
+
+
+def _pick_missing(codes: np.ndarray, keep: np.ndarray, code: int, rng) -> Optional[int]:
+    # Random occurrence of a code whose neighbours are kept, so the event
+    # correction sees a single missing event at that position. None if no
+    # occurrence can be dropped
+    if code not in RECOVERABLE_CODES:
+        raise ValueError(f"Missing code {code} can not be corrected")
+
+    candidates = np.flatnonzero((codes == code) & keep)
+    candidates = [
+        i
+        for i in candidates
+        if 0 < i < len(codes) - 1 and keep[i - 1] and keep[i + 1]
+        # Missing end of run is only detected before an inter-run rest
+        and (code != 16 or codes[i + 1] == 51)
+    ]
+    if len(candidates) == 0:
+        return None
+
+    return rng.choice(candidates)
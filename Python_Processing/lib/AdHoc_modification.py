@@ -9,7 +9,8 @@ Ad hoc correction subject 3:
     Subject S03 inform in block 1 he did not realice the inner speech paradigm.
     Instaed he perform the visualized paradigm.
 """
-import pandas as pd
+import pickle
+import numpy as np
 from pathlib import Path
 
 
@@ -45,48 +46,42 @@ def adhoc_subject_3(root_dir: Path, verbose: bool = True) -> None:
     if not file_path.exists():
         raise FileNotFoundError(f"Events file not found: {file_path}")
 
-    # Load events data using pandas (preserving column structure)
-    events_df = pd.read_csv(file_path, index_col=0)
+    # Load events data (pickled array, see lib.preprocessing.save_events)
+    with open(file_path, "rb") as input_file:
+        events = np.array(pickle.load(input_file))
     
     if verbose:
         print(f"Loaded events data from: {file_path}")
-        print(f"Data shape: {events_df.shape}")
-        print(f"Columns: {list(events_df.columns)}")
+        print(f"Data shape: {events.shape}")
 
     # Check if we have enough rows for the correction
-    if len(events_df) < 120:
-        raise ValueError(f"Expected at least 120 rows, got {len(events_df)}")
-
-    # Identify the code column (assuming it's the third column or named 'Code')
-    code_column = None
-    if 'condition' in events_df.columns:
-        code_column = 'condition'
-    elif events_df.shape[1] >= 3:
-        # Assume third column is the code if no 'Code' column found
-        code_column = events_df.columns[2]
-    else:
+    if len(events) < 120:
+        raise ValueError(f"Expected at least 120 rows, got {len(events)}")
+
+    # Columns: time, class, condition and block
+    if events.ndim != 2 or events.shape[1] < 3:
         raise ValueError("Could not identify code column in events data")
+    code_column = 2
 
     if verbose:
-        original_counts = events_df[code_column].value_counts().sort_index()
+        codes, counts = np.unique(events[:, code_column], return_counts=True)
         print("Original code distribution:")
-        for code, count in original_counts.items():
+        for code, count in zip(codes, counts):
             print(f"  condition {code}: {count} trials")
 
     # Apply correction: change codes for trials 80-119 (40 trials) to 2
-    # Note: DataFrame indexing is 0-based, so rows 80-119 correspond to indices 80-119
-    events_df.loc[80:119, code_column] = 2
+    events[80:120, code_column] = 2
 
     if verbose:
-        updated_counts = events_df[code_column].value_counts().sort_index()
+        codes, counts = np.unique(events[:, code_column], return_counts=True)
         print("Updated code distribution:")
-        for code, count in updated_counts.items():
+        for code, count in zip(codes, counts):
             print(f"  condition {code}: {count} trials")
 
     # Validate the correction
-    code_0_count = (events_df[code_column] == 0).sum()
-    code_1_count = (events_df[code_column] == 1).sum() 
-    code_2_count = (events_df[code_column] == 2).sum()
+    code_0_count = (events[:, code_column] == 0).sum()
+    code_1_count = (events[:, code_column] == 1).sum() 
+    code_2_count = (events[:, code_column] == 2).sum()
 
     expected_0 = 40  # Pronounced trials
     expected_1 = 40  # Imagined trials  
@@ -107,7 +102,8 @@ def adhoc_subject_3(root_dir: Path, verbose: bool = True) -> None:
         raise ValueError(error_msg)
 
     # Save the corrected data back to the same file
-    events_df.to_csv(file_path, index=False)
+    with open(file_path, "wb") as output:
+        pickle.dump(events, output, pickle.HIGHEST_PROTOCOL)
     
     if verbose:
         print(f"✓ Corrected data saved to: {file_path}")
@@ -24,6 +24,8 @@ import numpy as np
 import pickle
 from lib.data_processing import calculate_power_windowed
 from lib.data_extractions import extract_block_data_from_subject, extract_report
+from lib.report_store import update_report_table
+from lib.filter_bank import filter_epochs
 import pathlib as Path
 
 
@@ -102,7 +104,7 @@ def EMG_control_single_th(
                 root_dir, N_S, datatype, N_B
             )
 
-            X_baseline.filter(low_f, high_f)
+            filter_epochs(X_baseline, low_f, high_f)
 
             FC = int(X_baseline.info["sfreq"])
             # =============================================================================
@@ -152,7 +154,7 @@ def EMG_control_single_th(
             EMG, Y = extract_block_data_from_subject(root_dir, N_S, datatype, N_B)
 
             # Filter in the same band
-            EMG.filter(low_f, high_f)
+            filter_epochs(EMG, low_f, high_f)
 
             # Copy data
             EMG_EXG7 = EMG.copy()
@@ -235,18 +237,23 @@ def EMG_control_single_th(
                 "for Subject " + str(N_S) + " in Session " + str(N_B),
             )  # noqa
 
-            # Update Report
-            report = extract_report(root_dir, N_B, N_S)
-
-            report["EMG_trials"] = R_EMG[:, 0]
-            report["Power_EXG7"] = R_EMG[:, 1]
-            report["Power_EXG8"] = R_EMG[:, 2]
+            # EMG control results
+            emg_report = dict(
+                EMG_trials=R_EMG[:, 0],
+                Power_EXG7=R_EMG[:, 1],
+                Power_EXG8=R_EMG[:, 2],
+                Baseline_EXG7_mean=mean_Base_energy_7,
+                Baseline_EXG8_mean=mean_Base_energy_8,
+                Baseline_EXG7_std=std_Base_energy_7,
+                Baseline_EXG8_std=std_Base_energy_8,
+            )
 
-            report["Baseline_EXG7_mean"] = mean_Base_energy_7
-            report["Baseline_EXG8_mean"] = mean_Base_energy_8
+            # Update only the EMG columns of the dataset-level report table
+            update_report_table(root_dir, N_S, N_B, emg_report)
 
-            report["Baseline_EXG7_std"] = std_Base_energy_7
-            report["Baseline_EXG8_std"] = std_Base_energy_8
+            # Update Report
+            report = extract_report(root_dir, N_B, N_S)
+            report.update(emg_report)
 
             # Save report
             file_name = (
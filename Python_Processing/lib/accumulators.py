@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+
+"""
+Running averages of ERP, TFR and PSD estimates.
+
+The accumulators consume trials subject by subject (or in batches of
+fixed size) and keep only running sums, so averaging over the whole
+dataset never requires stacking every subject's trials in memory.
+"""
+
+import mne
+import numpy as np
+from typing import Optional
+from lib.psd_engine import array_psd
+from lib.tfr_engine import array_morlet
+from lib.tfr_storage import make_average_tfr
+
+
+class TFRAccumulator:
+    """
+    Running average of Morlet power and inter-trial coherence (ITC).
+
+    For every trial, the complex wavelet transform ``z`` is computed and
+    ``|z| ** 2`` (power) and ``z / |z|`` (phase) are added to running sums.
+    The averages are the same as those of
+    ``tfr_morlet(average=True, return_itc=True)``.
+
+    Parameters:
+    - sfreq (float): Sampling frequency of the data.
+    - freqs (np.ndarray): Frequencies of interest.
+    - n_cycles (float | np.ndarray): Number of cycles of the wavelets.
+    - tmin (float): Start time of the trials. Default 0.
+    - use_fft (bool): Whether to convolve with the FFT (cached wavelet
+      spectra of lib.tfr_engine). Default False.
+    - zero_mean (bool): Whether the wavelets have zero mean. Default True.
+    - decim (int): Decimation factor of the output. Default 1.
+    - batch_size (int): Maximum number of trials transformed at once.
+      Default 32.
+    - n_jobs (int): Number of jobs of the wavelet transform. Default 1.
+    """
+
+    def __init__(
+        self,
+        sfreq: float,
+        freqs: np.ndarray,
+        n_cycles,
+        tmin: float = 0.0,
+        use_fft: bool = False,
+        zero_mean: bool = True,
+        decim: int = 1,
+        batch_size: int = 32,
+        n_jobs: int = 1,
+    ):
+        self.sfreq = sfreq
+        self.freqs = np.asarray(freqs)
+        self.n_cycles = n_cycles
+        self.tmin = tmin
+        self.use_fft = use_fft
+        self.zero_mean = zero_mean
+        self.decim = decim
+        self.batch_size = batch_size
+        self.n_jobs = n_jobs
+
+        self.power_sum = None
+        self.phase_sum = None
+        self.n_times = None
+        self.count = 0
+
+    def add(self, X: np.ndarray) -> None:
+        """
+        Add trials to the running sums.
+
+        Parameters:
+        - X (np.ndarray): Trials (n_trials, n_channels, n_times).
+        """
+        for start in range(0, len(X), self.batch_size):
+            batch = np.asarray(X[start : start + self.batch_size])
+            tfr = array_morlet(
+                batch,
+                sfreq=self.sfreq,
+                freqs=self.freqs,
+                n_cycles=self.n_cycles,
+                zero_mean=self.zero_mean,
+                use_fft=self.use_fft,
+                decim=self.decim,
+                n_jobs=self.n_jobs,
+            )
+            self.add_complex(tfr, n_times=batch.shape[-1])
+
+    def add_complex(self, tfr: np.ndarray, n_times: Optional[int] = None) -> None:
+        """
+        Add trial-level complex TFRs to the running sums.
+
+        Parameters:
+        - tfr (np.ndarray): Complex TFRs (n_trials, n_channels, n_freqs,
+          n_times).
+        - n_times (int): Number of samples of the trials before decimation.
+        """
+        power = np.abs(tfr)
+        # Zero coefficients have no phase, as in MNE
+        phase = tfr / np.where(power == 0, 1, power)
+        power **= 2
+
+        self.add_sums(
+            power.sum(axis=0, dtype=np.float64),
+            phase.sum(axis=0, dtype=np.complex128),
+            len(tfr),
+            n_times=n_times,
+        )
+
+    def add_sums(
+        self,
+        power_sum: np.ndarray,
+        phase_sum: np.ndarray,
+        count: int,
+        n_times: Optional[int] = None,
+    ) -> None:
+        """
+        Add precomputed sums over trials to the running sums.
+
+        Parameters:
+        - power_sum (np.ndarray): Sum of the power of the trials
+          (n_channels, n_freqs, n_times).
+        - phase_sum (np.ndarray): Sum of the unit phase vectors of the
+          trials (n_channels, n_freqs, n_times).
+        - count (int): Number of trials in the sums.
+        - n_times (int): Number of samples of the trials before decimation.
+        """
+        if count == 0:
+            return
+
+        if self.power_sum is None:
+            self.power_sum = np.array(power_sum, dtype=np.float64)
+            self.phase_sum = np.array(phase_sum, dtype=np.complex128)
+            self.n_times = n_times
+        else:
+            self.power_sum += power_sum
+            self.phase_sum += phase_sum
+        self.count += count
+
+    @property
+    def power(self) -> np.ndarray:
+        """Average power (n_channels, n_freqs, n_times)."""
+        return self.power_sum / self.count
+
+    @property
+    def itc(self) -> np.ndarray:
+        """Inter-trial coherence (n_channels, n_freqs, n_times)."""
+        return np.abs(self.phase_sum) / self.count
+
+    @property
+    def times(self) -> np.ndarray:
+        """Time points of the (decimated) output."""
+        n_times = self.power_sum.shape[-1] * self.decim
+        if self.n_times is not None:
+            n_times = self.n_times
+        return (self.tmin + np.arange(n_times) / self.sfreq)[:: self.decim]
+
+    def to_average_tfr(self, info: mne.Info) -> tuple:
+        """
+        Build MNE objects with the averages.
+
+        Parameters:
+        - info (mne.Info): Measurement info of the channels.
+
+        Returns:
+        - tuple: Power and ITC as AverageTFR objects.
+        """
+        if self.count == 0:
+            raise ValueError("No trials have been added to the accumulator")
+
+        power = make_average_tfr(info, self.power, self.times, self.freqs, self.count)
+        itc = make_average_tfr(info, self.itc, self.times, self.freqs, self.count)
+
+        return power, itc
+
+
+class PSDAccumulator:
+    """
+    Running average of Welch or multitaper power spectral densities.
+
+    Parameters:
+    - sfreq (float): Sampling frequency of the data.
+    - method (str): "welch" or "multitaper". Default "welch".
+    - fmin (float): Minimum frequency of interest. Default 0.
+    - fmax (float): Maximum frequency of interest. Default inf.
+    - n_fft (int): Length of the FFT (Welch only). Default 256.
+    - n_overlap (int): Overlap between segments (Welch only). Default 0.
+    - bandwidth (float): Bandwidth of the tapers (multitaper only).
+      Default None.
+    - batch_size (int): Maximum number of trials processed at once.
+      Default 64.
+    """
+
+    def __init__(
+        self,
+        sfreq: float,
+        method: str = "welch",
+        fmin: float = 0,
+        fmax: float = np.inf,
+        n_fft: int = 256,
+        n_overlap: int = 0,
+        bandwidth: Optional[float] = None,
+        batch_size: int = 64,
+    ):
+        self.sfreq = sfreq
+        self.method = method
+        self.fmin = fmin
+        self.fmax = fmax
+        self.n_fft = n_fft
+        self.n_overlap = n_overlap
+        self.bandwidth = bandwidth
+        self.batch_size = batch_size
+
+        self.psd_sum = None
+        self.freqs = None
+        self.count = 0
+
+    def add(self, X: np.ndarray) -> None:
+        """
+        Add trials to the running sum.
+
+        Parameters:
+        - X (np.ndarray): Trials (n_trials, n_channels, n_times).
+        """
+        for start in range(0, len(X), self.batch_size):
+            batch = np.asarray(X[start : start + self.batch_size])
+            psds, freqs = array_psd(
+                batch,
+                self.sfreq,
+                method=self.method,
+                fmin=self.fmin,
+                fmax=self.fmax,
+                n_fft=self.n_fft,
+                n_overlap=self.n_overlap,
+                bandwidth=self.bandwidth,
+            )
+            self.add_psd(psds, freqs)
+
+    def add_psd(self, psds: np.ndarray, freqs: np.ndarray) -> None:
+        """
+        Add trial-level PSDs to the running sum.
+
+        Parameters:
+        - psds (np.ndarray): PSDs (n_trials, n_channels, n_freqs).
+        - freqs (np.ndarray): Frequencies of the PSDs.
+        """
+        if self.psd_sum is None:
+            self.psd_sum = psds.sum(axis=0, dtype=np.float64)
+            self.freqs = freqs
+        else:
+            self.psd_sum += psds.sum(axis=0)
+        self.count += len(psds)
+
+    @property
+    def psd(self) -> np.ndarray:
+        """Average PSD (n_channels, n_freqs)."""
+        return self.psd_sum / self.count
+
+
+class ERPAccumulator:
+    """
+    Running average (and spread) of event related potentials.
+
+    Keeps the channel x time sum, sum of squares and number of trials.
+
+    Parameters:
+    - tmin (float): Start time of the trials. Default 0.
+    """
+
+    def __init__(self, tmin: float = 0.0):
+        self.tmin = tmin
+
+        self.data_sum = None
+        self.square_sum = None
+        self.count = 0
+
+    def add(self, X: np.ndarray) -> None:
+        """
+        Add trials to the running sums.
+
+        Parameters:
+        - X (np.ndarray): Trials (n_trials, n_channels, n_times).
+        """
+        if len(X) == 0:
+            return
+
+        X = np.asarray(X, dtype=np.float64)
+        if self.data_sum is None:
+            self.data_sum = X.sum(axis=0)
+            self.square_sum = np.einsum("ijk,ijk->jk", X, X)
+        else:
+            self.data_sum += X.sum(axis=0)
+            self.square_sum += np.einsum("ijk,ijk->jk", X, X)
+        self.count += len(X)
+
+    @property
+    def mean(self) -> np.ndarray:
+        """Average over trials (n_channels, n_times)."""
+        return self.data_sum / self.count
+
+    @property
+    def std(self) -> np.ndarray:
+        """Standard deviation over trials (n_channels, n_times)."""
+        mean = self.mean
+        var = (self.square_sum - self.count * mean**2) / max(self.count - 1, 1)
+        return np.sqrt(np.maximum(var, 0))
+
+    @property
+    def sem(self) -> np.ndarray:
+        """Standard error of the mean (n_channels, n_times)."""
+        return self.std / np.sqrt(self.count)
+
+    def to_evoked(self, info: mne.Info, comment: Optional[str] = None) -> mne.Evoked:
+        """
+        Build the average as an Evoked object.
+
+        Parameters:
+        - info (mne.Info): Measurement info of the channels.
+        - comment (str): Comment of the Evoked. Default None.
+
+        Returns:
+        - mne.Evoked: The average, with nave set to the number of trials.
+        """
+        if self.count == 0:
+            raise ValueError("No trials have been added to the accumulator")
+
+        return mne.EvokedArray(
+            self.mean,
+            info,
+            tmin=self.tmin,
+            comment=comment,
+            nave=self.count,
+            verbose="WARNING",
+        )
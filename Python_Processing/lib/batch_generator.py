@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cross-validation batches read lazily from the derivatives.
+
+A trial index lists, for every selected trial, its subject, session,
+position in the session file and class label (groups of conditions and
+classes, as in lib.data_processing.transform_for_classificator). Splits
+(leave-one-subject-out, leave-one-session-out or stratified k-fold) are
+computed on the index, and the trials of every fold are read from disk
+batch by batch, so no fold is ever held in memory as a whole:
+
+    trial_index = build_trial_index(root_dir, [1, 2, 3], classes, conditions)
+    for n_fold, train, test in iter_cv_batches(root_dir, trial_index, "subject"):
+        for X, y, groups in train:
+            ...
+
+Sessions are read with MNE without preloading, or from NumPy memory maps
+written once to a cache folder (memmap_dir).
+"""
+
+import numpy as np
+import mne
+from pathlib import Path
+from typing import Iterator, Optional
+from lib.data_extractions import get_emg_trials, load_events
+from lib.data_processing import (
+    filter_by_class,
+    filter_by_condition,
+    split_trial_in_time,
+)
+from lib.utils import sub_name
+
+# Split methods of cv_splits
+CV_METHODS = ("subject", "session", "stratified")
+
+
+def build_trial_index(
+    root_dir: Path,
+    n_s_list: list,
+    classes: list,
+    conditions: list,
+    n_b_list: tuple = (1, 2, 3),
+    exclude_emg: bool = False,
+) -> dict:
+    """
+    List the trials of every class group, reading only the events.
+
+    Parameters:
+    - root_dir (Path): The root directory containing the data.
+    - n_s_list (list): List of subject numbers.
+    - classes (list): List of classes for each group (e.g. [["Up"],
+      ["Down"]]).
+    - conditions (list): List of conditions for each group (e.g.
+      [["Inner"], ["Inner"]]).
+    - n_b_list (tuple): Block numbers. Default (1, 2, 3).
+    - exclude_emg (bool): If True, skip the EMG contaminated trials.
+      Default False.
+
+    Returns:
+    - dict: Arrays with one row per trial: "subject", "session", "trial"
+      (position in the session file), "label" (group number) and "events".
+    """
+    if len(conditions) < 1 or len(classes) < 1:
+        raise ValueError("You have to select classes and conditions")
+    if len(conditions) != len(classes):
+        raise ValueError("Incorrect number of conditions or classes")
+
+    parts = {key: [] for key in ("subject", "session", "trial", "label", "events")}
+    for n_s in n_s_list:
+        for n_b in n_b_list:
+            Y = np.asarray(load_events(Path(root_dir), n_s, n_b))
+            trials = np.arange(len(Y))
+            if exclude_emg:
+                trials = np.setdiff1d(trials, get_emg_trials(root_dir, n_s, n_b))
+
+            for n_group, (group_cond, group_cls) in enumerate(zip(conditions, classes)):
+                if len(group_cond) < 1 or len(group_cond) != len(group_cls):
+                    raise ValueError("Incorrect number of conditions or classes")
+
+                for condition, class_label in zip(group_cond, group_cls):
+                    index, Y_aux = filter_by_condition(trials, Y[trials], condition)
+                    index, _ = filter_by_class(index, Y_aux, class_label)
+
+                    parts["subject"].append(np.full(len(index), n_s))
+                    parts["session"].append(np.full(len(index), n_b))
+                    parts["trial"].append(index)
+                    parts["label"].append(np.full(len(index), n_group))
+                    parts["events"].append(Y[index])
+
+    return {key: np.concatenate(value) for key, value in parts.items()}
+
+
+def cv_splits(
+    trial_index: dict,
+    method: str = "subject",
+    n_splits: int = 5,
+    shuffle: bool = True,
+    random_state: Optional[int] = 23,
+) -> Iterator[tuple]:
+    """
+    Split the trial index for cross validation.
+
+    Parameters:
+    - trial_index (dict): Trial index (see build_trial_index).
+    - method (str): "subject" (leave one subject out), "session" (leave
+      one session out, the same session of every subject) or "stratified"
+      (k-fold with the class proportions of the whole index). Default
+      "subject".
+    - n_splits (int): Number of folds of "stratified". Default 5.
+    - shuffle (bool): Shuffle the trials of every class before assigning
+      the folds of "stratified". Default True.
+    - random_state (int): Seed of the shuffling. Default 23.
+
+    Yields:
+    - tuple: Train and test rows of the trial index.
+    """
+    rows = np.arange(len(trial_index["label"]))
+
+    if method in ("subject", "session"):
+        groups = trial_index[method]
+        values = np.unique(groups)
+        if len(values) < 2:
+            raise ValueError(f"Leave-one-{method}-out needs at least 2 {method}s")
+        for value in values:
+            test = groups == value
+            yield rows[~test], rows[test]
+
+    elif method == "stratified":
+        labels = trial_index["label"]
+        rng = np.random.default_rng(random_state)
+        folds = np.empty(len(rows), dtype=int)
+        for label in np.unique(labels):
+            label_rows = rows[labels == label]
+            if len(label_rows) < n_splits:
+                raise ValueError(
+                    f"Class {label} has {len(label_rows)} trials, "
+                    f"less than n_splits={n_splits}"
+                )
+            if shuffle:
+                label_rows = rng.permutation(label_rows)
+            # Round robin over the folds, so every fold gets its share
+            folds[label_rows] = np.arange(len(label_rows)) % n_splits
+        for n_fold in range(n_splits):
+            test = folds == n_fold
+            yield rows[~test], rows[test]
+
+    else:
+        raise ValueError(f"Invalid split method '{method}', use one of {CV_METHODS}")
+
+
+def iter_batches(
+    root_dir: Path,
+    trial_index: dict,
+    rows: np.ndarray,
+    datatype: str = "eeg",
+    batch_size: int = 64,
+    window: Optional[tuple] = None,
+    fs: int = 256,
+    shuffle: bool = False,
+    random_state: Optional[int] = None,
+    memmap_dir: Optional[Path] = None,
+) -> Iterator[tuple]:
+    """
+    Read the trials of some rows of the trial index, batch by batch.
+
+    Rows are read session by session, so only the trials of a batch are in
+    memory. Shuffling permutes the sessions and the trials within each
+    session.
+
+    Parameters:
+    - root_dir (Path): The root directory containing the data.
+    - trial_index (dict): Trial index (see build_trial_index).
+    - rows (np.ndarray): Rows of the trial index to read (e.g. a fold).
+    - datatype (str): The type of data ("eeg" or "exg"). Default "eeg".
+    - batch_size (int): Number of trials per batch. Default 64.
+    - window (tuple): Window length and step (s). If given, the trials of
+      every batch are split in time (see split_trial_in_time). Default
+      None.
+    - fs (int): Sampling frequency of the data, for windowing. Default 256.
+    - shuffle (bool): Shuffle the sessions and trials. Default False.
+    - random_state (int): Seed of the shuffling. Default None.
+    - memmap_dir (Path): Folder of the memory-mapped sessions, written on
+      first use. Default None (read the epochs files).
+
+    Yields:
+    - tuple: Trials (X), labels (y) and groups (subject and session of
+      every trial).
+    """
+    datatype = datatype.lower()
+    if datatype not in ("eeg", "exg"):
+        raise ValueError("Invalid Datatype")
+
+    rows = _session_order(trial_index, np.asarray(rows), shuffle, random_state)
+    subjects = trial_index["subject"]
+    sessions = trial_index["session"]
+    # Last session read, which following batches usually continue
+    reader = dict()
+
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start : start + batch_size]
+        groups = np.column_stack((subjects[batch], sessions[batch]))
+
+        # Runs of trials of the same session
+        change = np.flatnonzero(np.any(groups[1:] != groups[:-1], axis=1)) + 1
+        X = np.concatenate(
+            [
+                _read_trials(
+                    root_dir,
+                    datatype,
+                    *groups[run[0]],
+                    trial_index["trial"][batch[run]],
+                    reader,
+                    memmap_dir,
+                )
+                for run in np.split(np.arange(len(batch)), change)
+            ]
+        )
+        y = trial_index["label"][batch]
+
+        if window is not None:
+            X, meta = split_trial_in_time(
+                X, np.column_stack((y, groups)), window[0], window[1], fs
+            )
+            y, groups = meta[:, 0], meta[:, 1:]
+
+        yield X, y, groups
+
+
+def iter_cv_batches(
+    root_dir: Path,
+    trial_index: dict,
+    method: str = "subject",
+    n_splits: int = 5,
+    random_state: Optional[int] = 23,
+    **batch_options,
+) -> Iterator[tuple]:
+    """
+    Cross-validation folds with lazily read train and test batches.
+
+    Parameters:
+    - root_dir (Path): The root directory containing the data.
+    - trial_index (dict): Trial index (see build_trial_index).
+    - method (str): Split method (see cv_splits). Default "subject".
+    - n_splits (int): Number of folds of "stratified". Default 5.
+    - random_state (int): Seed of the splits and of the shuffling of the
+      train batches. Default 23.
+    - **batch_options: Options of iter_batches (datatype, batch_size,
+      window, fs, memmap_dir). Train batches are shuffled.
+
+    Yields:
+    - tuple: Fold number, train batches and test batches (generators of
+      iter_batches).
+    """
+    splits = cv_splits(trial_index, method, n_splits, random_state=random_state)
+    for n_fold, (train, test) in enumerate(splits):
+        train_batches = iter_batches(
+            root_dir,
+            trial_index,
+            train,
+            shuffle=True,
+            random_state=random_state,
+            **batch_options,
+        )
+        test_batches = iter_batches(root_dir, trial_index, test, **batch_options)
+        yield n_fold, train_batches, test_batches
+
+
+def _session_order(
+    trial_index: dict, rows: np.ndarray, shuffle: bool, random_state
+) -> np.ndarray:
+    # Rows grouped by session, in file order or shuffled by blocks
+    subjects = trial_index["subject"][rows]
+    sessions = trial_index["session"][rows]
+    if not shuffle:
+        return rows[np.lexsort((trial_index["trial"][rows], sessions, subjects))]
+
+    rng = np.random.default_rng(random_state)
+    _, session_ids = np.unique(
+        np.column_stack((subjects, sessions)), axis=0, return_inverse=True
+    )
+    session_ids = np.ravel(session_ids)
+    session_rank = rng.permutation(session_ids.max() + 1)[session_ids]
+    return rows[np.lexsort((rng.random(len(rows)), session_rank))]
+
+
+def _read_trials(
+    root_dir: Path,
+    datatype: str,
+    n_s: int,
+    n_b: int,
+    trials: np.ndarray,
+    reader: dict,
+    memmap_dir: Optional[Path],
+) -> np.ndarray:
+    # Read some trials of a session, in the given order
+    key = (int(n_s), int(n_b))
+    if reader.get("key") != key:
+        reader.clear()
+        reader["key"] = key
+        reader["data"] = _open_session(root_dir, datatype, n_s, n_b, memmap_dir)
+
+    # Files are read in increasing trial order
+    unique, inverse = np.unique(trials, return_inverse=True)
+    data = reader["data"]
+    if isinstance(data, np.ndarray):
+        X = data[unique]
+    else:
+        with mne.utils.use_log_level("WARNING"):
+            X = data[unique].get_data()
+
+    return X[np.ravel(inverse)]
+
+
+def _open_session(
+    root_dir: Path, datatype: str, n_s: int, n_b: int, memmap_dir: Optional[Path]
+):
+    # Epochs without preloading, or the memory map of the session
+    num_s = sub_name(n_s)
+    file_name = (
+        Path(root_dir)
+        / "derivatives"
+        / num_s
+        / f"ses-0{n_b}"
+        / f"{num_s}_ses-0{n_b}_{datatype}-epo.fif"
+    )
+    if memmap_dir is None:
+        return mne.read_epochs(file_name, preload=False, verbose="WARNING")
+
+    map_name = Path(memmap_dir) / f"{num_s}_ses-0{n_b}_{datatype}.npy"
+    if not map_name.exists() or map_name.stat().st_mtime < file_name.stat().st_mtime:
+        map_name.parent.mkdir(parents=True, exist_ok=True)
+        data = mne.read_epochs(file_name, verbose="WARNING")._data
+        # Written next to the destination and swapped in
+        tmp_name = map_name.with_suffix(".tmp.npy")
+        np.save(tmp_name, data)
+        tmp_name.replace(map_name)
+        del data
+
+    return np.load(map_name, mmap_mode="r")
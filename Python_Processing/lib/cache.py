@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+"""
+In-process cache of the objects read from disk.
+
+Entries are keyed by the resolved file path, its modification time and
+size (plus the reader and its optional arguments), so a file that changes
+on disk is read again. The cache is bounded by the memory size of the cached
+objects and evicts the least recently used entries first.
+
+Cached objects are shared: their arrays are made read-only, so every
+caller gets the same object without a memory copy and an in-place change
+(e.g. ``apply_baseline``) raises instead of corrupting the cache. Callers
+that modify what they get ask for a copy (``copy=True``).
+"""
+
+import copy
+import os
+import sys
+import numpy as np
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Callable
+
+# Default memory budget of a cache (bytes)
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+
+class FileCache:
+    """
+    Memory-size-aware LRU cache of objects read from files.
+
+    Parameters:
+    - max_bytes (int): Memory budget of the cached objects. Objects larger
+      than the budget are never cached. Default DEFAULT_MAX_BYTES.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, file_name: Path, loader: Callable, *args, copy: bool = False):
+        """
+        Get the object read from a file, reading it only on a cache miss.
+
+        Parameters:
+        - file_name (Path): The file to read.
+        - loader (Callable): Reader called as ``loader(file_name, *args)``.
+        - *args: Extra reader arguments, part of the cache key (with the
+          reader).
+        - copy (bool): Return a writable copy instead of the cached object.
+          Default False.
+
+        Returns:
+        - object: The cached object, with read-only arrays, or its copy.
+        """
+        path = str(Path(file_name).resolve())
+        stat = os.stat(path)
+        key = (path, f"{loader.__module__}.{loader.__qualname__}", args)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _copy(entry[1]) if copy else entry[1]
+            self.misses += 1
+
+        value = loader(file_name, *args)
+        n_bytes = _size_of(value)
+        _set_read_only(value)
+
+        with self._lock:
+            # Drop the entry of an outdated version of the file
+            self._remove(key)
+            if n_bytes <= self.max_bytes:
+                self._entries[key] = (version, value, n_bytes)
+                self.n_bytes += n_bytes
+                while self.n_bytes > self.max_bytes:
+                    self._remove(next(iter(self._entries)))
+                    self.evictions += 1
+
+        return _copy(value) if copy else value
+
+    def clear(self) -> None:
+        """Remove every entry and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.n_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        """
+        Get the cache statistics.
+
+        Returns:
+        - dict: Hits, misses, evictions, number of entries and bytes used.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.n_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _remove(self, key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.n_bytes -= entry[2]
+
+
+# Caches of the TFR and report readers (lib.data_extractions)
+TFR_CACHE = FileCache()
+REPORT_CACHE = FileCache(max_bytes=64 * 1024**2)
+
+
+def cache_stats() -> dict:
+    """
+    Get the statistics of the reader caches.
+
+    Returns:
+    - dict: Statistics of the TFR and report caches.
+    """
+    return {"tfr": TFR_CACHE.stats(), "report": REPORT_CACHE.stats()}
+
+
+def clear_caches() -> None:
+    """Empty the reader caches."""
+    TFR_CACHE.clear()
+    REPORT_CACHE.clear()
+
+
+def _copy(value):
+    # Writable copy (MNE objects have their own deep copy)
+    if hasattr(value, "copy") and not isinstance(value, (dict, list)):
+        return value.copy()
+    return copy.deepcopy(value)
+
+
+def _set_read_only(value, _seen=None) -> None:
+    # Lock the arrays of an object, as walked by _size_of
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return
+    _seen.add(id(value))
+
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, dict):
+        for v in value.values():
+            _set_read_only(v, _seen)
+    elif isinstance(value, (list, tuple, set)):
+        for v in value:
+            _set_read_only(v, _seen)
+    elif isinstance(getattr(value, "data", None), np.ndarray):
+        _set_read_only(value.data, _seen)
+
+
+def _size_of(value, _seen=None) -> int:
+    # Approximate memory size: array buffers plus container overhead
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            _size_of(k, _seen) + _size_of(v, _seen) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(_size_of(v, _seen) for v in value)
+    if hasattr(value, "data") and isinstance(value.data, np.ndarray):
+        return value.data.nbytes + sys.getsizeof(value)
+    return sys.getsizeof(value)
@@ -8,14 +8,40 @@ Utilitys from extract, read and load data from Inner Speech Dataset
 """
 
 import mne
-import gc
+import logging
 import os
+import time
 import numpy as np
 import pandas as pd
 import pickle
 from mne.io import Raw
 from pathlib import Path
-from lib.utils import sub_name, unify_names
+from typing import Iterator, Optional
+from lib.utils import progress_bar, sub_name, unify_names
+from lib.cache import REPORT_CACHE, TFR_CACHE
+from lib.filter_bank import StreamingFilter, get_filter_kernel, get_notch_kernel
+from lib.report_store import get_session_report, report_table_path
+from lib.tfr_storage import (
+    chunked_tfr_name,
+    make_average_tfr,
+    read_chunked_band,
+    read_chunked_tfr,
+)
+
+logger = logging.getLogger(__name__)
+
+# Folder of the PSDs saved by PSD_representation.py and read by
+# Plotting/PSD_plot_PSD.py (ds003626 next to Python_Processing)
+PSD_DIR = Path(__file__).resolve().parents[2] / "ds003626"
+
+# Parameters of the PSDs of the published figure
+FIGURE_PSD_PARAMS = dict(
+    method="multitaper",
+    bandwidth=1,
+    tmin=1,
+    tmax=3,
+    subjects=[1, 2, 3, 4, 5, 6, 7, 8, 9, 10],
+)
 
 
 def extract_subject_from_bdf(data_dir: Path, n_s: int, n_b: int) -> tuple[Raw, str]:
@@ -44,7 +70,141 @@ def extract_subject_from_bdf(data_dir: Path, n_s: int, n_b: int) -> tuple[Raw, s
     return raw_data, num_s
 
 
-def extract_data_from_subject(root_dir: Path, n_s: int, datatype: str) -> tuple:
+def iter_trials_from_bdf(
+    data_dir: Path,
+    n_s: int,
+    n_b: int,
+    events,
+    event_id: tuple = (31, 32, 33, 34),
+    tmin: float = -0.5,
+    tmax: float = 4,
+    ref_channels: Optional[list] = ("EXG1", "EXG2"),
+    notch_freq: Optional[float] = 50,
+    l_freq: Optional[float] = 0.5,
+    h_freq: Optional[float] = 100,
+    decim: int = 1,
+    detrend: Optional[int] = 0,
+    chunk_duration: float = 1.0,
+) -> Iterator[tuple]:
+    """
+    Stream the trials of a BDF recording one by one.
+
+    The BDF file is opened lazily and read in chunks of ``chunk_duration``
+    seconds. Each chunk is re-referenced and filtered with the FIR kernels
+    of the offline pipeline (lib.filter_bank), streamed with overlap-save
+    convolution and corrected for their linear-phase delay, so the trials
+    match the epochs of InnerSpeech_preprocessing.py. A trial is yielded
+    as soon as its last sample has been filtered, that is half the kernel
+    lengths (about 3.3 s per filter at 0.5 Hz) after it was read, so
+    memory is bounded by one trial plus the kernels and one chunk.
+
+    Parameters:
+    - data_dir (Path): The root directory containing the raw data.
+    - n_s (int): The subject number.
+    - n_b (int): The block number.
+    - events (array-like): Corrected events (Time, Trigger, Code), e.g. the
+      output of event_correction.
+    - event_id (tuple): Event codes of the trials. Default (31, 32, 33, 34).
+    - tmin (float): Start of the trial relative to the event, in seconds.
+    - tmax (float): End of the trial relative to the event, in seconds.
+    - ref_channels (list): Reference channels. None to keep the reference.
+    - notch_freq (float): Power line frequency. None to skip the notch.
+    - l_freq (float): Low cut-off frequency. None for a low-pass filter.
+    - h_freq (float): High cut-off frequency. None for a high-pass filter.
+    - decim (int): Decimation factor applied to each trial. Default 1.
+    - detrend (int): Order of the detrending of each trial before the
+      decimation (0 removes the mean, as the offline epochs). None to
+      skip it. Default 0.
+    - chunk_duration (float): Length of the chunks read from disk, in
+      seconds. Default 1.
+
+    Yields:
+    - tuple: The trial data (channels x samples) and its event row.
+    """
+    num_s = sub_name(n_s)
+    file_name = (
+        data_dir
+        / f"{num_s}/ses-0{n_b}/eeg/{num_s}_ses-0{n_b}_task-innerspeech_eeg.bdf"  # noqa
+    )
+    raw = mne.io.read_raw_bdf(input_fname=file_name, preload=False, verbose="WARNING")
+
+    sfreq = raw.info["sfreq"]
+    picks = mne.pick_types(raw.info, eeg=True, stim=False, exclude=[])
+    ch_names = [raw.ch_names[p] for p in picks]
+    ref_idx = [ch_names.index(ch) for ch in ref_channels] if ref_channels else []
+
+    # Notch and band-pass kernels of the offline pipeline, applied in order
+    kernels = []
+    if notch_freq is not None:
+        kernels.append(get_notch_kernel(sfreq, notch_freq))
+    if l_freq is not None or h_freq is not None:
+        kernels.append(get_filter_kernel(sfreq, l_freq, h_freq))
+    filters = [StreamingFilter(kernel, raw.n_times) for kernel in kernels]
+
+    # Trials sorted by time, as (first sample, last sample, event row)
+    events = np.asarray(events)
+    events = events[np.isin(events[:, 2], event_id)]
+    events = events[np.argsort(events[:, 0], kind="stable")]
+    start_offset = int(round(tmin * sfreq))
+    stop_offset = int(round(tmax * sfreq)) + 1
+    trials = [
+        (
+            int(ev[0]) - raw.first_samp + start_offset,
+            int(ev[0]) - raw.first_samp + stop_offset,
+            ev,
+        )
+        for ev in events
+    ]
+    trials = [tr for tr in trials if tr[0] >= 0 and tr[1] <= raw.n_times]
+
+    if not trials:
+        return
+
+    chunk_len = max(int(round(chunk_duration * sfreq)), 1)
+    # Samples read ahead of the last trial, to complete its filtering
+    last_read = min(trials[-1][1] + sum(f.delay for f in filters), raw.n_times)
+
+    # Filtered samples not yet consumed: buffer[:, i] is sample buf_start + i
+    buffer = np.empty((len(picks), 0))
+    buf_start = 0
+    stop = 0
+    n_trial = 0
+
+    for start in range(0, last_read, chunk_len):
+        chunk = raw.get_data(
+            picks=picks, start=start, stop=min(start + chunk_len, last_read)
+        )
+
+        # Re-reference
+        if ref_idx:
+            chunk -= chunk[ref_idx].mean(axis=0, keepdims=True)
+
+        # Filter, the output lags the chunk by the delays of the kernels
+        for streaming_filter in filters:
+            chunk = streaming_filter.push(chunk)
+
+        buffer = np.concatenate((buffer, chunk), axis=1)
+        stop += chunk.shape[1]
+
+        # Yield every trial that is complete
+        while n_trial < len(trials) and trials[n_trial][1] <= stop:
+            t_start, t_stop, ev = trials[n_trial]
+            trial = buffer[:, t_start - buf_start : t_stop - buf_start]
+            if detrend is not None:
+                trial = mne.filter.detrend(trial, detrend, axis=-1)
+            yield trial[:, ::decim].copy(), ev
+            n_trial += 1
+
+        # Keep only what the pending trials still need
+        keep_from = trials[n_trial][0] if n_trial < len(trials) else stop
+        keep_from = min(max(keep_from, buf_start), stop)
+        buffer = buffer[:, keep_from - buf_start :]
+        buf_start = keep_from
+
+
+def extract_data_from_subject(
+    root_dir: Path, n_s: int, datatype: str, exclude_emg: bool = False
+) -> tuple:
     """
     Load all blocks for one subject and stack the results in X.
 
@@ -52,6 +212,8 @@ def extract_data_from_subject(root_dir: Path, n_s: int, datatype: str) -> tuple:
     - root_dir (str): The root directory containing the data.
     - n_s (int): The subject number.
     - datatype (str): The type of data to extract ("eeg", "exg", or "baseline")
+    - exclude_emg (bool): If True, the EMG contaminated trials are never read
+      from disk. Ignored for "baseline". Default False.
 
     Returns:
     - tuple: A tuple containing the stacked data (X) and events (Y).
@@ -70,22 +232,23 @@ def extract_data_from_subject(root_dir: Path, n_s: int, datatype: str) -> tuple:
         if datatype == "eeg":
             # Load data and events
             file_name = f"{root_dir}/derivatives/{num_s}/ses-0{n_b}/{num_s}_ses-0{n_b}_eeg-epo.fif"  # noqa
-            X = mne.read_epochs(file_name, verbose="WARNING")
-            data[n_b] = X._data
 
         elif datatype == "exg":
             file_name = f"{root_dir}/derivatives/{num_s}/ses-0{n_b}/{num_s}_ses-0{n_b}_exg-epo.fif"  # noqa
-            X = mne.read_epochs(file_name, verbose="WARNING")
-            data[n_b] = X._data
 
         elif datatype == "baseline":
             file_name = f"{root_dir}/derivatives/{num_s}/ses-0{n_b}/{num_s}_ses-0{n_b}_baseline-epo.fif"  # noqa
-            X = mne.read_epochs(file_name, verbose="WARNING")
-            data[n_b] = X._data
 
         else:
             raise ValueError("Invalid Datatype")
 
+        if exclude_emg and datatype != "baseline":
+            X, keep = _read_epochs_without_emg(root_dir, n_s, n_b, file_name)
+            y[n_b] = np.asarray(y[n_b])[keep]
+        else:
+            X = mne.read_epochs(file_name, verbose="WARNING")
+        data[n_b] = X._data
+
     X_stacked = np.vstack((data[1], data[2], data[3]))
     Y_stacked = np.vstack((y[1], y[2], y[3]))
 
@@ -93,7 +256,7 @@ def extract_data_from_subject(root_dir: Path, n_s: int, datatype: str) -> tuple:
 
 
 def extract_block_data_from_subject(
-    root_dir: Path, n_s: int, datatype: str, n_b: int
+    root_dir: Path, n_s: int, datatype: str, n_b: int, exclude_emg: bool = False
 ) -> tuple:
     """
     Load selected block from one subject.
@@ -103,6 +266,8 @@ def extract_block_data_from_subject(
     - n_s (int): The subject number.
     - datatype (str): The type of data to extract ("eeg", "exg", or "baseline")
     - n_b (int): The block number.
+    - exclude_emg (bool): If True, the EMG contaminated trials are never read
+      from disk. Ignored for "baseline". Default False.
 
     Returns:
     - tuple: A tuple containing the loaded data (X) and events (Y).
@@ -121,24 +286,83 @@ def extract_block_data_from_subject(
     if datatype == "eeg":
         # Load EEG data
         file_name = sub_dir / f"{num_s}_ses-0{n_b}_eeg-epo.fif"
-        X = mne.read_epochs(file_name, verbose="WARNING")
 
     elif datatype == "exg":
         # Load EXG data
         file_name = sub_dir / f"{num_s}_ses-0{n_b}_exg-epo.fif"
-        X = mne.read_epochs(file_name, verbose="WARNING")
 
     elif datatype == "baseline":
         # Load Baseline data
         file_name = sub_dir / f"{num_s}_ses-0{n_b}_baseline-epo.fif"
-        X = mne.read_epochs(file_name, verbose="WARNING")
 
     else:
         raise ValueError("Invalid Datatype")
 
+    if exclude_emg and datatype != "baseline":
+        X, keep = _read_epochs_without_emg(root_dir, n_s, n_b, file_name)
+        y = np.asarray(y)[keep]
+    else:
+        X = mne.read_epochs(file_name, verbose="WARNING")
+
     return X, y
 
 
+def get_emg_trials(root_dir: Path, n_s: int, n_b: int) -> np.ndarray:
+    """
+    Get the trials tagged as EMG contaminated by the EMG control.
+
+    The dataset-level report table is consulted first, falling back to
+    the session report file if the session or its EMG results are not in
+    the table.
+
+    Parameters:
+    - root_dir (str): The root directory containing the data.
+    - n_s (int): The subject number.
+    - n_b (int): The block number.
+
+    Returns:
+    - np.ndarray: Indexes of the contaminated trials within the block.
+
+    Raises:
+    - ValueError: If no report has EMG control results for the session.
+    """
+    emg_trials = None
+    if report_table_path(root_dir).exists():
+        report = get_session_report(root_dir, n_s, n_b)
+        if report is not None:
+            emg_trials = report.get("EMG_trials")
+
+    if emg_trials is None:
+        report = extract_report(Path(root_dir), n_b, n_s)
+        emg_trials = report.get("EMG_trials")
+
+    if emg_trials is None:
+        raise ValueError(
+            f"No EMG control results for subject {n_s}, session {n_b}: "
+            "run EMG_control_single_th before excluding the EMG trials"
+        )
+
+    return np.asarray(emg_trials, dtype=int)
+
+
+def _read_epochs_without_emg(
+    root_dir: Path, n_s: int, n_b: int, file_name
+) -> tuple:
+    """
+    Read only the epochs not tagged as EMG contaminated.
+
+    Returns:
+    - tuple: The loaded epochs and the indexes of the kept trials.
+    """
+    X = mne.read_epochs(file_name, preload=False, verbose="WARNING")
+
+    keep = np.setdiff1d(np.arange(len(X)), get_emg_trials(root_dir, n_s, n_b))
+    X = X[keep]
+    X.load_data()
+
+    return X, keep
+
+
 def extract_report(root_dir: Path, n_b: int, n_s: int):
     """
     Extract a report for a specific block and subject.
@@ -158,48 +382,262 @@ def extract_report(root_dir: Path, n_b: int, n_s: int):
     sub_dir = root_dir / "derivatives" / num_s / f"ses-0{n_b}"
     file_name = sub_dir / f"{num_s}_ses-0{n_b}_report.pkl"
 
-    with open(file_name, "rb") as input_file:
-        report = pickle.load(input_file)
+    # Reports are cached until the file changes, and copied since callers
+    # update them
+    report = REPORT_CACHE.get(file_name, _read_pickle, copy=True)
 
     return report
 
 
+def _read_pickle(file_name: Path):
+    with open(file_name, "rb") as input_file:
+        return pickle.load(input_file)
+
+
 def extract_tfr(
-    trf_dir: Path, cond: str, class_label: str, tfr_method: str, trf_type: str
+    trf_dir: Path,
+    cond: str,
+    class_label: str,
+    tfr_method: str,
+    trf_type: str,
+    copy: bool = True,
 ) -> mne.time_frequency:
     """
     Extract Time-Frequency Representation (TFR) data.
 
+    TFRs are cached in memory (lib.cache.TFR_CACHE) until the file changes.
+    A copy of the cached TFR is returned by default. With copy=False the
+    cached TFR itself is shared: its data is read-only, but methods that
+    change it in place (crop, pick, drop_channels, ...) would change it
+    for every later call, so only use it to read the TFR.
+
     Parameters:
     - trf_dir (str): The directory containing the TFR data.
     - cond (str): The condition.
     - class_label (str): The class label.
     - tfr_method (str): The TFR method used.
     - trf_type (str): The type of TRF.
+    - copy (bool): Return a copy of the cached TFR. False shares the
+      cached TFR, to be read only. Default True.
 
     Returns:
     - mne.time_frequency.tfr.TFR: The extracted TFR data.
     """
+    fname = _tfr_file_name(Path(trf_dir), cond, class_label, tfr_method, trf_type)
+
+    trf = TFR_CACHE.get(fname, _read_tfr, copy=copy)
+
+    return trf
+
+
+def _read_tfr(fname: Path):
+    trf = mne.time_frequency.read_tfrs(fname)
+    # Older MNE versions return a list of TFRs
+    if isinstance(trf, list):
+        trf = trf[0]
+    return trf
+
+
+def extract_tfr_range(
+    trf_dir: Path,
+    cond: str,
+    class_label: str,
+    tfr_method: str,
+    trf_type: str,
+    fmin: Optional[float] = None,
+    fmax: Optional[float] = None,
+    tmin: Optional[float] = None,
+    tmax: Optional[float] = None,
+    copy: bool = True,
+) -> mne.time_frequency:
+    """
+    Extract a frequency/time range of a Time-Frequency Representation
+    (TFR), reading only that range from the chunked TFR file.
+
+    If the chunked file does not exist, the whole TFR is read and cropped.
+    Cached ranges are copied or shared as in extract_tfr.
+
+    Parameters:
+    - trf_dir (Path): The directory containing the TFR data.
+    - cond (str): The condition.
+    - class_label (str): The class label.
+    - tfr_method (str): The TFR method used.
+    - trf_type (str): The type of TRF.
+    - fmin (float): Lowest frequency. Default the first one.
+    - fmax (float): Highest frequency. Default the last one.
+    - tmin (float): First time point. Default the first one.
+    - tmax (float): Last time point. Default the last one.
+    - copy (bool): Return a copy of the cached range. False shares the
+      cached range, to be read only. Default True.
+
+    Returns:
+    - mne.time_frequency.tfr.TFR: The TFR restricted to the range.
+    """
+    fname = _tfr_file_name(Path(trf_dir), cond, class_label, tfr_method, trf_type)
+
+    if chunked_tfr_name(fname).exists():
+        return TFR_CACHE.get(
+            chunked_tfr_name(fname),
+            read_chunked_tfr,
+            fmin,
+            fmax,
+            tmin,
+            tmax,
+            copy=copy,
+        )
+
+    # Copied, since it is cropped in place
+    trf = extract_tfr(
+        Path(trf_dir), cond, class_label, tfr_method, trf_type, copy=True
+    )
+
+    return trf.crop(tmin=tmin, tmax=tmax, fmin=fmin, fmax=fmax)
+
+
+def extract_tfr_band(
+    trf_dir: Path,
+    cond: str,
+    class_label: str,
+    tfr_method: str,
+    trf_type: str,
+    fmin: float,
+    fmax: float,
+    tmin: Optional[float] = None,
+    tmax: Optional[float] = None,
+    copy: bool = True,
+) -> mne.time_frequency:
+    """
+    Extract the average of a frequency band of a Time-Frequency
+    Representation (TFR), using the band averages stored in the chunked
+    TFR file.
+
+    Parameters:
+    - trf_dir (Path): The directory containing the TFR data.
+    - cond (str): The condition.
+    - class_label (str): The class label.
+    - tfr_method (str): The TFR method used.
+    - trf_type (str): The type of TRF.
+    - fmin (float): Lowest frequency of the band.
+    - fmax (float): Highest frequency of the band.
+    - tmin (float): First time point. Default the first one.
+    - tmax (float): Last time point. Default the last one.
+    - copy (bool): Return a copy of the cached band. False shares the
+      cached band, to be read only. Default True.
+
+    Returns:
+    - mne.time_frequency.tfr.TFR: TFR with a single frequency holding the
+      band average.
+    """
+    fname = _tfr_file_name(Path(trf_dir), cond, class_label, tfr_method, trf_type)
+
+    if chunked_tfr_name(fname).exists():
+        return TFR_CACHE.get(
+            chunked_tfr_name(fname),
+            read_chunked_band,
+            fmin,
+            fmax,
+            tmin,
+            tmax,
+            copy=copy,
+        )
+
+    # Only read, to average the band
+    trf = extract_tfr_range(
+        trf_dir,
+        cond,
+        class_label,
+        tfr_method,
+        trf_type,
+        fmin,
+        fmax,
+        tmin,
+        tmax,
+        copy=False,
+    )
+
+    return make_average_tfr(
+        trf.info,
+        trf.data.mean(axis=1, keepdims=True),
+        trf.times,
+        np.array([trf.freqs.mean()]),
+        trf.nave,
+        trf.method,
+        f"{fmin}-{fmax} Hz",
+    )
+
+
+def _tfr_file_name(
+    trf_dir: Path, cond: str, class_label: str, tfr_method: str, trf_type: str
+) -> Path:
     # Unify names as stored
     cond, class_label = unify_names(cond, class_label)
+    return trf_dir / f"{tfr_method}_{cond}_{class_label}_{trf_type}-tfr.h5"
 
-    fname = trf_dir / f"{tfr_method}_{cond}_{class_label}_{trf_type}-tfr.h5"
 
-    trf = mne.time_frequency.read_tfrs(fname)[0]
+def extract_psd(psd_dir: Path, cond: str, class_label: str) -> dict:
+    """
+    Extract the averaged Power Spectral Density (PSD) of a condition and
+    class, as saved by PSD_representation.py.
 
-    return trf
+    Parameters:
+    - psd_dir (Path): The directory containing the PSD data.
+    - cond (str): The condition.
+    - class_label (str): The class label.
+
+    Returns:
+    - dict: PSDs ("psds", (n_channels, n_freqs)), frequencies ("freqs"),
+      channel names ("ch_names"), number of averaged trials ("nave"), PSD
+      method ("method") and the parameters they were computed with:
+      "subjects", time window ("tmin", "tmax"), multitaper "bandwidth" and
+      Welch "n_fft" and "n_overlap" (None if not stored).
+    """
+    fname = _psd_file_name(Path(psd_dir), cond, class_label)
+
+    with np.load(fname) as f:
+        psd = {
+            "psds": f["psds"],
+            "freqs": f["freqs"],
+            "ch_names": [str(name) for name in f["ch_names"]],
+            "nave": int(f["nave"]),
+            "method": str(f["method"]),
+            "subjects": None,
+        }
+        if "subjects" in f.files:
+            psd["subjects"] = [int(n_s) for n_s in f["subjects"]]
+        for key in ("tmin", "tmax", "bandwidth", "n_fft", "n_overlap"):
+            value = float(f[key]) if key in f.files else np.nan
+            psd[key] = None if np.isnan(value) else value
+
+    return psd
+
+
+def _psd_file_name(psd_dir: Path, cond: str, class_label: str) -> Path:
+    # Unify names as stored
+    cond, class_label = unify_names(cond, class_label)
+    return psd_dir / f"PSD_{cond}_{class_label}_psd.npz"
 
 
 def extract_data_multisubject(
-    root_dir: Path, n_s_list: list, datatype: str = "eeg"
+    root_dir: Path,
+    n_s_list: list,
+    datatype: str = "eeg",
+    exclude_emg: bool = False,
+    progress: bool = False,
 ) -> tuple:
     """
     Load all blocks for a list of subjects and stack the results.
 
+    The loading throughput (MB/s and trials/s) is logged at INFO level
+    (see lib.utils.set_log_level).
+
     Parameters:
     - root_dir (str): The root directory containing the data.
     - n_s_list (list): List of subject numbers.
     - datatype (str): The type of data to extract ("eeg", "exg", or "baseline")
+    - exclude_emg (bool): If True, the EMG contaminated trials are never read
+      from disk. Ignored for "baseline". Default False.
+    - progress (bool): Show a progress bar over the sessions (requires
+      tqdm). Default False.
 
     Returns:
     - tuple: Tuple containing the stacked data (X) and events (Y) if applicable
@@ -209,53 +647,58 @@ def extract_data_multisubject(
     tmp_list_Y = []
     rows = []
     total_elem = len(n_s_list) * 3  # assume 3 sessions per subject
-    s = 0
     datatype = datatype.lower()
+    start_time = time.perf_counter()
 
-    for n_s in n_s_list:
-        print("Iteration ", s)
-        print("Subject ", n_s)
-        for n_b in n_b_arr:
-            num_s = sub_name(n_s)
-
-            base_file_name = (
-                f"{root_dir}/derivatives/{num_s}/ses-0{n_b}/{num_s}_ses-0{n_b}"  # noqa
-            )
-            events_file_name = f"{base_file_name}_events.dat"
-            data_tmp_Y = np.load(events_file_name, allow_pickle=True)
-            tmp_list_Y.append(data_tmp_Y)
-            print("Inner iteration ", n_b)
-
-            if datatype == "eeg" or datatype == "exg" or datatype == "baseline":  # noqa
-                # Load data and events
-                data_tmp_X = None
-
-                if datatype == "eeg":
-                    eeg_file_name = f"{base_file_name}_eeg-epo.fif"
-                    data_tmp_X = mne.read_epochs(eeg_file_name, verbose="WARNING")._data  # noqa
-                elif datatype == "exg":
-                    exg_file_name = f"{base_file_name}_exg-epo.fif"
-                    data_tmp_X = mne.read_epochs(exg_file_name, verbose="WARNING")._data  # noqa
-                elif datatype == "baseline":
-                    baseline_file_name = f"{base_file_name}_baseline-epo.fif"
-                    data_tmp_X = mne.read_epochs(
-                        baseline_file_name, verbose="WARNING"
-                    )._data  # noqa
-
-                if data_tmp_X is not None:
-                    rows.append(data_tmp_X.shape[0])
-                    # assume same number of channels, time steps, and column
-                    # labels in every subject and session
-                    if s == 0 and n_b == 1:
-                        chann = data_tmp_X.shape[1]
-                        steps = data_tmp_X.shape[2]
-                        columns = data_tmp_Y.shape[1]
-
-                    tmp_list_X.append(data_tmp_X)
-                else:
-                    raise ValueError("Invalid Datatype")
+    sessions = progress_bar(
+        [(n_s, n_b) for n_s in n_s_list for n_b in n_b_arr],
+        enabled=progress,
+        desc=f"Loading {datatype}",
+        unit="session",
+    )
+    for n_s, n_b in sessions:
+        num_s = sub_name(n_s)
+        logger.debug("Loading session %d of subject %s", n_b, n_s)
 
-        s += 1
+        base_file_name = (
+            f"{root_dir}/derivatives/{num_s}/ses-0{n_b}/{num_s}_ses-0{n_b}"  # noqa
+        )
+        events_file_name = f"{base_file_name}_events.dat"
+        data_tmp_Y = np.load(events_file_name, allow_pickle=True)
+
+        if datatype == "eeg" or datatype == "exg" or datatype == "baseline":  # noqa
+            # Load data and events
+            data_tmp_X = None
+
+            if datatype == "eeg" or datatype == "exg":
+                epo_file_name = f"{base_file_name}_{datatype}-epo.fif"
+                if exclude_emg:
+                    epochs, keep = _read_epochs_without_emg(
+                        root_dir, n_s, n_b, epo_file_name
+                    )
+                    data_tmp_X = epochs._data
+                    data_tmp_Y = np.asarray(data_tmp_Y)[keep]
+                else:
+                    data_tmp_X = mne.read_epochs(epo_file_name, verbose="WARNING")._data  # noqa
+            elif datatype == "baseline":
+                baseline_file_name = f"{base_file_name}_baseline-epo.fif"
+                data_tmp_X = mne.read_epochs(
+                    baseline_file_name, verbose="WARNING"
+                )._data  # noqa
+
+            if data_tmp_X is not None:
+                tmp_list_Y.append(data_tmp_Y)
+                rows.append(data_tmp_X.shape[0])
+                # assume same number of channels, time steps, and column
+                # labels in every subject and session
+                if len(rows) == 1:
+                    chann = data_tmp_X.shape[1]
+                    steps = data_tmp_X.shape[2]
+                    columns = data_tmp_Y.shape[1]
+
+                tmp_list_X.append(data_tmp_X)
+            else:
+                raise ValueError("Invalid Datatype")
 
     x = np.empty((sum(rows), chann, steps))
     y = np.empty((sum(rows), columns))
@@ -263,7 +706,6 @@ def extract_data_multisubject(
 
     # Put elements of the list into numpy array
     for i in range(total_elem):
-        print("Saving element {} into array ".format(i))
         x[offset : offset + rows[i], :, :] = tmp_list_X[0]
 
         if datatype == "eeg" or datatype == "exg":
@@ -271,12 +713,21 @@ def extract_data_multisubject(
             y[offset : offset + rows[i], :] = tmp_list_Y[0]
 
         offset += rows[i]
+        # Free every session as soon as it is copied (reference counting)
         del tmp_list_X[0]
         del tmp_list_Y[0]
-        gc.collect()
 
-    print("X shape", x.shape)
-    print("Y shape", y.shape)
+    elapsed = time.perf_counter() - start_time
+    logger.info(
+        "Loaded %d %s trials of %d subjects %s in %.2f s: %.1f MB/s, %.0f trials/s",
+        x.shape[0],
+        datatype,
+        len(n_s_list),
+        x.shape,
+        elapsed,
+        x.nbytes / 1024**2 / elapsed,
+        x.shape[0] / elapsed,
+    )
 
     if datatype == "eeg" or datatype == "exg":
         # For eeg and exg types, there is a predefined label that is returned
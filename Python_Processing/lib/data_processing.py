@@ -7,9 +7,13 @@ Data processing
 """
 
 # Imports
+import logging
+import time
 import numpy as np
 from typing import Tuple
 
+logger = logging.getLogger(__name__)
+
 
 def calculate_power_windowed(
     signal_data: np.ndarray,
@@ -276,7 +280,10 @@ def split_trial_in_time(
     Returns:
     - tuple: A tuple containing the split X and Y arrays.
     """
-    print("Input X shape:", X.shape)
+    # Timed only when the shapes are logged
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if debug:
+        start_time = time.perf_counter()
     n_trials, n_channels, t_max = X.shape
 
     # Window parameters
@@ -302,5 +309,13 @@ def split_trial_in_time(
     X_final = np.array(x_windows)
     Y_final = np.array(y_windows)
 
-    print("Output X shape:", X_final.shape)
+    if debug:
+        elapsed = time.perf_counter() - start_time
+        logger.debug(
+            "Split X %s into %s in %.3f s: %.0f trials/s",
+            X.shape,
+            X_final.shape,
+            elapsed,
+            n_trials / elapsed if elapsed > 0 else float("inf"),
+        )
     return X_final, Y_final
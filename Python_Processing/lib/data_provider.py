@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""
+Grouped data provider for the analysis scripts.
+
+Each subject is read from disk once and split into every requested
+condition/class group by index, instead of reloading the subject for
+every cell of the condition/class grid.
+"""
+
+import numpy as np
+from pathlib import Path
+from typing import Iterator
+from lib.data_extractions import extract_data_from_subject
+from lib.data_processing import filter_by_condition, filter_by_class
+
+
+def group_indices(Y: np.ndarray, conditions: list, classes: list) -> dict:
+    """
+    Get the trial indexes of every condition/class group.
+
+    Parameters:
+    - Y (np.ndarray): Events of the trials.
+    - conditions (list): Conditions (e.g. ["All", "Inner"]).
+    - classes (list): Classes (e.g. ["All", "Up"]).
+
+    Returns:
+    - dict: Trial indexes keyed by (condition, class).
+    """
+    Y = np.asarray(Y)
+    index = np.arange(len(Y))
+
+    groups = dict()
+    for cond in conditions:
+        index_cond, Y_cond = filter_by_condition(index, Y, cond)
+        for class_label in classes:
+            index_class, _ = filter_by_class(index_cond, Y_cond, class_label)
+            groups[(cond, class_label)] = index_class
+
+    return groups
+
+
+def iter_grouped_subjects(
+    root_dir: Path,
+    n_s_list: list,
+    datatype: str,
+    conditions: list,
+    classes: list,
+    exclude_emg: bool = False,
+) -> Iterator[tuple]:
+    """
+    Load each subject once and yield its data with the group indexes.
+
+    Parameters:
+    - root_dir (Path): The root directory containing the data.
+    - n_s_list (list): List of subject numbers.
+    - datatype (str): The type of data to extract ("eeg" or "exg").
+    - conditions (list): Conditions of the groups.
+    - classes (list): Classes of the groups.
+    - exclude_emg (bool): If True, skip the EMG contaminated trials.
+
+    Yields:
+    - tuple: Subject number, data (X), events (Y) and the trial indexes of
+      every group, keyed by (condition, class).
+    """
+    for n_s in n_s_list:
+        X, Y = extract_data_from_subject(
+            Path(root_dir), n_s, datatype, exclude_emg=exclude_emg
+        )
+        Y = np.asarray(Y)
+
+        yield n_s, X, Y, group_indices(Y, conditions, classes)
+
+
+def extract_grouped_data(
+    root_dir: Path,
+    n_s_list: list,
+    datatype: str,
+    conditions: list,
+    classes: list,
+    exclude_emg: bool = False,
+) -> dict:
+    """
+    Load the trials of every condition/class group for a list of subjects,
+    reading each subject only once.
+
+    Note that overlapping groups (e.g. "All" and "Inner") hold their own
+    copy of the shared trials.
+
+    Parameters:
+    - root_dir (Path): The root directory containing the data.
+    - n_s_list (list): List of subject numbers.
+    - datatype (str): The type of data to extract ("eeg" or "exg").
+    - conditions (list): Conditions of the groups.
+    - classes (list): Classes of the groups.
+    - exclude_emg (bool): If True, skip the EMG contaminated trials.
+
+    Returns:
+    - dict: Stacked data (X) and events (Y) keyed by (condition, class).
+    """
+    X_parts = dict()
+    Y_parts = dict()
+
+    for _, X, Y, groups in iter_grouped_subjects(
+        root_dir, n_s_list, datatype, conditions, classes, exclude_emg
+    ):
+        for key, index in groups.items():
+            X_parts.setdefault(key, []).append(X[index])
+            Y_parts.setdefault(key, []).append(Y[index])
+        del X
+
+    return {
+        key: (np.concatenate(X_parts[key]), np.concatenate(Y_parts[key]))
+        for key in X_parts
+    }
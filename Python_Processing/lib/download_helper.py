@@ -4,9 +4,17 @@ Provides functions to clone the dataset, get specific files,
 list available files, and explore dataset structure.
 """
 
+import os
+import re
+import json
+import stat
+import fnmatch
+import hashlib
 import subprocess
 import shutil
 import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Optional, Union, Iterable, Tuple
 from datalad import api as dl
@@ -20,6 +28,10 @@ def get_derivatives(
     sessions: Optional[Union[str, List[str]]] = "all",
     verbose: bool = False,
     progress: bool = False,
+    jobs: int = 4,
+    materialize: str = "copy",
+    verify: bool = False,
+    source: Optional[str] = None,
 ) -> None:
     """
     Download derivative files from the Inner Speech OpenNeuro dataset and
@@ -69,11 +81,51 @@ def get_derivatives(
         If True, display a progress bar showing file-level download
         progress. This is recommended when downloading large files.
 
+    jobs : int, default=4
+        Number of files fetched concurrently by DataLad. Files are
+        downloaded in batches of ``jobs``; while one batch is copied into
+        the visible directory the next one is already being fetched, and
+        each batch is dropped from the hidden cache in a single call.
+
+    materialize : {"copy", "reflink", "hardlink", "move", "auto"}, default="copy"
+        How a fetched file is placed into the visible directory.
+
+        - "copy"     : byte copy of the file (every byte is written twice)
+        - "reflink"  : copy-on-write clone (btrfs, XFS, ...); no data copied
+        - "hardlink" : hard link to the annexed object. The file stays
+          read-only, as the object, until the object is dropped from the
+          hidden cache with its batch; it is then made writable
+        - "move"     : hard link to the annexed object, whose key is
+          immediately dropped from the hidden cache (``git annex
+          dropkey``), so the file is writable right away
+        - "auto"     : try "reflink", then "hardlink", then "copy"
+
+        Reflinks, hard links and moves only work when the hidden cache and
+        the visible directory share a filesystem; otherwise the file is
+        copied. Files sharing their git-annex key with another requested
+        file (identical content) are never hard linked or moved, so that
+        visible files never share their data.
+
+    verify : bool, default=False
+        If True, files already present in the visible directory are
+        checked against the checksum of their git-annex key and
+        downloaded again if they are incomplete or corrupted. Files whose
+        size and modification time did not change since their last
+        successful check are not hashed again.
+
+    source : str, optional
+        URL or path of the DataLad dataset to clone into the hidden cache.
+        Defaults to the OpenNeuro GitHub mirror. A local dataset can be
+        used to run the downloader offline.
+
     Notes
     -----
     - The visible dataset directory will contain only regular files
       following the BIDS derivatives structure.
     - Repeated calls are safe and will only download missing files.
+    - Files are written under a temporary ``.part`` name, checked against
+      their git-annex checksum and atomically renamed, so an interrupted
+      download never leaves a file that looks complete.
     """
 
     # ------------------------------------------------------------------
@@ -88,6 +140,7 @@ def get_derivatives(
     # ------------------------------------------------------------------
     hidden_dataset_path = _ensure_hidden_dataset(
         dataset_id="ds003626",
+        source=source,
         verbose=verbose,
     )
     # ------------------------------------------------------------------
@@ -117,49 +170,34 @@ def get_derivatives(
     # ------------------------------------------------------------------
     ds = dl.Dataset(hidden_dataset_path)
 
-    # Ensure derivative subdataset metadata is installed
-    ds.get(
-        "derivatives",
-        recursive=True,
-        get_data=False,
-        on_failure="ignore",
-        result_renderer="disabled",
-    )
-
-    derivatives_root = hidden_dataset_path / "derivatives"
+    # Ensure derivative subdataset metadata is installed (only once)
+    if not (hidden_dataset_path / "derivatives" / ".git").exists():
+        ds.get(
+            "derivatives",
+            recursive=True,
+            get_data=False,
+            on_failure="ignore",
+            result_renderer="disabled",
+        )
 
     # ------------------------------------------------------------------
     # Collect candidate files first (for progress bar support)
     # ------------------------------------------------------------------
-    candidate_files = []
+    manifest = _load_manifest(hidden_dataset_path)
 
     for ft in file_types:
         if ft not in type_to_pattern:
             raise ValueError(f"Unknown file type: {ft}")
 
-        fname_pattern = type_to_pattern[ft]
-
-        subj_dirs = (
-            list(derivatives_root.glob("sub-*"))
-            if subjects == "all"
-            else [derivatives_root / f"sub-{s}" for s in subjects]
-        )
-
-        for subj_dir in subj_dirs:
-            if not subj_dir.exists():
-                continue
-
-            ses_dirs = (
-                list(subj_dir.glob("ses-*"))
-                if sessions == "all"
-                else [subj_dir / f"ses-{s}" for s in sessions]
-            )
-
-            for ses_dir in ses_dirs:
-                if not ses_dir.exists():
-                    continue
-
-                candidate_files.extend(ses_dir.glob(fname_pattern))
+    entries = _query_manifest(
+        manifest,
+        layout="derivatives/sub-*/ses-*/{name}",
+        patterns=[type_to_pattern[ft] for ft in file_types],
+        subjects=subjects,
+        sessions=sessions,
+    )
+    candidate_files = [hidden_dataset_path / e["path"] for e in entries]
+    keys = {Path(e["path"]): e["key"] for e in entries}
 
     if not candidate_files and verbose:
         print("No matching derivative files found.")
@@ -168,40 +206,19 @@ def get_derivatives(
     # ------------------------------------------------------------------
     # Download + copy files
     # ------------------------------------------------------------------
-    iterator = candidate_files
-    if progress:
-        iterator = tqdm(iterator, desc="Downloading derivatives", unit="file")
-
-    for file in iterator:
-        rel = file.relative_to(hidden_dataset_path)
-        dest = dataset_path / rel
-
-        # Skip if file already exists in destination
-        if dest.exists():
-            if verbose and not progress:
-                print(f"Skipping, file already in destination: {rel}")
-            continue
-
-        if verbose and not progress:
-            print(f"Getting: {rel}")
-
-        # Materialize file
-        ds.get(str(rel), on_failure="ignore", result_renderer="disabled")
-
-        # Copy real file (dereference symlink)
-        dest = dataset_path / rel
-        dest.parent.mkdir(parents=True, exist_ok=True)
-        real_file = hidden_dataset_path / rel
-
-        shutil.copyfile(real_file, dest, follow_symlinks=True)
-
-        # Drop content from hidden dataset
-        ds.drop(
-            str(rel),
-            reckless="availability",
-            on_failure="ignore",
-            result_renderer="disabled",
-        )
+    _download_files(
+        ds,
+        hidden_dataset_path,
+        dataset_path,
+        candidate_files,
+        keys=keys,
+        jobs=jobs,
+        materialize=materialize,
+        verify=verify,
+        verbose=verbose,
+        progress=progress,
+        desc="Downloading derivatives",
+    )
 
     if verbose:
         print("\n✓ Derivative files downloaded.")
@@ -213,6 +230,10 @@ def get_raw_eeg(
     sessions: Optional[Union[str, List[str]]] = "all",
     verbose: bool = False,
     progress: bool = False,
+    jobs: int = 4,
+    materialize: str = "copy",
+    verify: bool = False,
+    source: Optional[str] = None,
 ) -> None:
     """
     Download raw EEG recordings from the Inner Speech OpenNeuro dataset
@@ -250,6 +271,22 @@ def get_raw_eeg(
         If True, display a progress bar showing file-level download
         progress. This is recommended for large raw EEG files.
 
+    jobs : int, default=4
+        Number of files fetched concurrently by DataLad. See
+        ``get_derivatives``.
+
+    materialize : {"copy", "reflink", "hardlink", "move", "auto"}, default="copy"
+        How a fetched file is placed into the visible directory. See
+        ``get_derivatives``.
+
+    verify : bool, default=False
+        If True, recheck files already present in the visible directory
+        and download again the corrupted ones. See ``get_derivatives``.
+
+    source : str, optional
+        URL or path of the DataLad dataset to clone into the hidden cache.
+        Defaults to the OpenNeuro GitHub mirror.
+
     Notes
     -----
     - Raw EEG files are stored under the ``eeg/`` directory of each
@@ -271,6 +308,7 @@ def get_raw_eeg(
     # ------------------------------------------------------------------
     hidden_dataset_path = _ensure_hidden_dataset(
         dataset_id="ds003626",
+        source=source,
         verbose=verbose,
     )
 
@@ -291,30 +329,17 @@ def get_raw_eeg(
     # ------------------------------------------------------------------
     # Collect candidate files
     # ------------------------------------------------------------------
-    candidate_files = []
-
-    subj_dirs = (
-        list(hidden_dataset_path.glob("sub-*"))
-        if subjects == "all"
-        else [hidden_dataset_path / f"sub-{s}" for s in subjects]
+    manifest = _load_manifest(hidden_dataset_path)
+
+    entries = _query_manifest(
+        manifest,
+        layout="sub-*/ses-*/eeg/{name}",
+        patterns=["*.bdf"],
+        subjects=subjects,
+        sessions=sessions,
     )
-
-    for subj_dir in subj_dirs:
-        if not subj_dir.exists():
-            continue
-
-        ses_dirs = (
-            list(subj_dir.glob("ses-*"))
-            if sessions == "all"
-            else [subj_dir / f"ses-{s}" for s in sessions]
-        )
-
-        for ses_dir in ses_dirs:
-            eeg_dir = ses_dir / "eeg"
-            if not eeg_dir.exists():
-                continue
-
-            candidate_files.extend(eeg_dir.glob("*.bdf"))
+    candidate_files = [hidden_dataset_path / e["path"] for e in entries]
+    keys = {Path(e["path"]): e["key"] for e in entries}
 
     if not candidate_files and verbose:
         print("No raw EEG files found.")
@@ -323,41 +348,676 @@ def get_raw_eeg(
     # ------------------------------------------------------------------
     # Download + copy files
     # ------------------------------------------------------------------
-    iterator = candidate_files
-    if progress:
-        iterator = tqdm(iterator, desc="Downloading raw EEG", unit="file")
+    _download_files(
+        ds,
+        hidden_dataset_path,
+        dataset_path,
+        candidate_files,
+        keys=keys,
+        jobs=jobs,
+        materialize=materialize,
+        verify=verify,
+        verbose=verbose,
+        progress=progress,
+        desc="Downloading raw EEG",
+    )
+
+    if verbose:
+        print("\n✓ Raw EEG files downloaded.")
+
+
+def _download_files(
+    ds: "dl.Dataset",
+    hidden_dataset_path: Path,
+    dataset_path: Path,
+    candidate_files: List[Path],
+    keys: Optional[dict] = None,
+    jobs: int = 4,
+    materialize: str = "copy",
+    verify: bool = False,
+    verbose: bool = False,
+    progress: bool = False,
+    desc: str = "Downloading",
+) -> None:
+    """
+    Fetch, copy and drop files from the hidden DataLad dataset.
+
+    Files missing from the visible directory are processed in batches of
+    ``jobs`` files as a three stage pipeline: the batch is fetched with
+    ``jobs`` parallel DataLad jobs, each file is copied into the visible
+    directory in a background thread as soon as DataLad reports it
+    fetched (while the rest of the batch and the next batch are still
+    being fetched), and once copied the whole batch is dropped from the
+    hidden cache in a single call. At most two batches are present in the
+    cache at a time. Files sharing a git-annex key (identical content) are
+    only dropped once all of them are copied, as dropping one file drops
+    the content of all of them.
+
+    Each file is written to ``<name>.part``, verified against the
+    checksum encoded in its git-annex key and then atomically renamed to
+    its final name.
+
+    Parameters
+    ----------
+    ds : datalad.api.Dataset
+        Hidden DataLad dataset.
+
+    hidden_dataset_path : pathlib.Path
+        Path to the hidden DataLad dataset.
+
+    dataset_path : pathlib.Path
+        Path to the visible dataset directory.
+
+    candidate_files : list of pathlib.Path
+        Files inside the hidden dataset to download.
+
+    keys : dict, optional
+        git-annex keys of the candidate files, keyed by path relative to
+        the hidden dataset. Missing keys are looked up from the files.
+
+    jobs : int, default=4
+        Number of files fetched concurrently (and batch size).
+
+    materialize : str, default="copy"
+        How files are placed into the visible directory. See
+        ``_materialize_file``.
+
+    verify : bool, default=False
+        If True, files already present in the visible directory are
+        verified (in parallel) and downloaded again if they do not match
+        their git-annex key.
 
-    for file in iterator:
+    verbose : bool, default=False
+        If True, print which files are skipped and downloaded.
+
+    progress : bool, default=False
+        If True, display a file-level progress bar.
+
+    desc : str, default="Downloading"
+        Progress bar description.
+    """
+    if jobs < 1:
+        raise ValueError("jobs must be a positive integer.")
+
+    if materialize not in _MATERIALIZE_METHODS:
+        raise ValueError(
+            f"Invalid materialize method '{materialize}'. "
+            f"Allowed values are: {sorted(_MATERIALIZE_METHODS)}."
+        )
+
+    # Files verified in previous calls: visible path -> [size, mtime_ns, key]
+    cache_file = (
+        hidden_dataset_path.parent / f"{hidden_dataset_path.name}_verified.json"
+    )
+    verified = _load_verified_cache(cache_file)
+
+    known_keys = keys or {}
+    keys = {}
+    for file in candidate_files:
         rel = file.relative_to(hidden_dataset_path)
+        keys[rel] = known_keys[rel] if rel in known_keys else _annex_key(file)
 
-        dest = dataset_path / rel
+    # ------------------------------------------------------------------
+    # Skip files already present in destination
+    # ------------------------------------------------------------------
+    pending_rel = []
+    existing_rel = []
+    for rel in keys:
+        if (dataset_path / rel).exists():
+            existing_rel.append(rel)
+        else:
+            pending_rel.append(rel)
+
+    if verify and existing_rel:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            checks = pool.map(
+                lambda rel: _verify_file(
+                    dataset_path / rel, keys[rel], verified.get(str(dataset_path / rel))
+                ),
+                existing_rel,
+            )
+            checks = list(checks)
 
-        # Skip if file already exists in destination
-        if dest.exists():
-            if verbose and not progress:
+        for rel, ok in zip(existing_rel, checks):
+            if ok:
+                _record_verified(verified, dataset_path / rel, keys[rel])
+            else:
+                if verbose and not progress:
+                    print(f"Corrupted or incomplete, downloading again: {rel}")
+                verified.pop(str(dataset_path / rel), None)
+                (dataset_path / rel).unlink()
+                pending_rel.append(rel)
+        _save_verified_cache(cache_file, verified)
+
+    if verbose and not progress:
+        for rel in existing_rel:
+            if rel not in pending_rel:
                 print(f"Skipping, file already in destination: {rel}")
-            continue
 
-        if verbose and not progress:
-            print(f"Getting: {rel}")
+    pbar = None
+    if progress:
+        pbar = tqdm(total=len(candidate_files), desc=desc, unit="file")
+        pbar.update(len(candidate_files) - len(pending_rel))
+
+    batches = [pending_rel[i : i + jobs] for i in range(0, len(pending_rel), jobs)]
 
-        ds.get(str(rel), on_failure="ignore", result_renderer="disabled")
+    failed = []
 
+    # Files still to be copied per git-annex key
+    remaining = Counter(keys[rel] for rel in pending_rel)
+
+    # Method used to place each file, hard linked files are made writable
+    # once their annexed object is dropped
+    methods = {}
+
+    def _copy(rel: Path) -> bool:
         dest = dataset_path / rel
+        part = dest.with_name(dest.name + ".part")
         dest.parent.mkdir(parents=True, exist_ok=True)
-        real_file = hidden_dataset_path / rel
 
-        shutil.copyfile(real_file, dest, follow_symlinks=True)
+        # Leftover of an interrupted download
+        if part.exists():
+            part.unlink()
+
+        try:
+            methods[rel] = _materialize_file(
+                hidden_dataset_path / rel,
+                part,
+                materialize,
+                key=keys[rel],
+                shared=keys[rel] is not None and remaining[keys[rel]] > 1,
+            )
+        except OSError:
+            return False
+
+        if not _verify_file(part, keys[rel]):
+            part.unlink()
+            return False
+
+        os.replace(part, dest)
+        return True
 
+    def _finish(batch: List[Path], futures: dict) -> None:
+        # Wait for the copies, then drop the whole batch from the cache
+        for rel in batch:
+            if futures[rel].result():
+                _record_verified(verified, dataset_path / rel, keys[rel])
+            else:
+                failed.append(rel)
+            if pbar is not None:
+                pbar.update(1)
+            remaining[keys[rel]] -= 1
+
+        # Keep the content still needed by the files of later batches
+        droppable = [
+            rel for rel in batch if keys[rel] is None or remaining[keys[rel]] == 0
+        ]
+        if not droppable:
+            return
         ds.drop(
-            str(rel),
+            [str(rel) for rel in droppable],
             reckless="availability",
             on_failure="ignore",
             result_renderer="disabled",
         )
 
-    if verbose:
-        print("\n✓ Raw EEG files downloaded.")
+        # Hard links left alone by the drop are no longer annexed objects
+        for rel in droppable:
+            dest = dataset_path / rel
+            if methods.get(rel) == "hardlink" and dest.exists():
+                if dest.stat().st_nlink == 1:
+                    dest.chmod(dest.stat().st_mode | stat.S_IWUSR)
+                elif verbose and not progress:
+                    print(f"Read-only, still linked to the hidden cache: {rel}")
+
+    # DataLad reports resolved paths
+    hidden_root = hidden_dataset_path.resolve()
+
+    in_flight = None
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            for batch in batches:
+                if verbose and not progress:
+                    for rel in batch:
+                        print(f"Getting: {rel}")
+
+                # Materialize batch (overlaps with the previous batch copies),
+                # copying every file as soon as it is fetched
+                futures = {}
+                for res in ds.get(
+                    [str(rel) for rel in batch],
+                    jobs=jobs,
+                    on_failure="ignore",
+                    result_renderer="disabled",
+                    return_type="generator",
+                ):
+                    if res.get("action") != "get" or res.get("type") != "file":
+                        continue
+                    try:
+                        rel = Path(res["path"]).relative_to(hidden_root)
+                    except ValueError:
+                        continue
+                    if rel in batch and rel not in futures:
+                        futures[rel] = pool.submit(_copy, rel)
+
+                # Files without a result (failed gets fail the copy)
+                for rel in batch:
+                    if rel not in futures:
+                        futures[rel] = pool.submit(_copy, rel)
+
+                if in_flight is not None:
+                    _finish(*in_flight)
+                in_flight = (batch, futures)
+
+            if in_flight is not None:
+                _finish(*in_flight)
+    finally:
+        if pbar is not None:
+            pbar.close()
+        if batches:
+            _save_verified_cache(cache_file, verified)
+
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} file(s) could not be downloaded or failed the "
+            f"checksum verification: {[str(rel) for rel in failed]}. "
+            "Run the download again to retry them."
+        )
+
+
+def _load_manifest(hidden_dataset_path: Path) -> dict:
+    """
+    Load the file manifest of the hidden DataLad dataset.
+
+    The manifest lists every file of the dataset (and of its installed
+    subdatasets) with its size and git-annex key. It is cached next to
+    the hidden dataset and only rebuilt when the git HEAD of the dataset
+    or of one of its subdatasets changes, so repeated calls do not walk
+    the dataset tree.
+
+    Parameters
+    ----------
+    hidden_dataset_path : pathlib.Path
+        Path to the hidden DataLad dataset.
+
+    Returns
+    -------
+    manifest : dict
+        ``{"heads": {repo: commit}, "files": [{"path", "size", "key"}]}``
+        with paths relative to the hidden dataset, in POSIX form.
+    """
+    manifest_file = (
+        hidden_dataset_path.parent / f"{hidden_dataset_path.name}_manifest.json"
+    )
+
+    heads = {
+        ".": _git_head(hidden_dataset_path),
+        "derivatives": _git_head(hidden_dataset_path / "derivatives"),
+    }
+
+    if manifest_file.exists():
+        try:
+            with open(manifest_file) as f:
+                manifest = json.load(f)
+            if heads["."] is not None and manifest.get("heads") == heads:
+                return manifest
+        except (OSError, ValueError):
+            pass
+
+    files = []
+    for dirpath, dirnames, filenames in os.walk(hidden_dataset_path):
+        # Skip git/DataLad metadata
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+
+        for fname in filenames:
+            if fname.startswith("."):
+                continue
+            path = Path(dirpath) / fname
+            key = _annex_key(path) if path.is_symlink() else None
+            size, _, _ = _parse_annex_key(key)
+            if size is None:
+                size = path.lstat().st_size
+            files.append(
+                {
+                    "path": path.relative_to(hidden_dataset_path).as_posix(),
+                    "size": size,
+                    "key": key,
+                }
+            )
+
+    manifest = {"heads": heads, "files": files}
+
+    tmp_file = manifest_file.with_name(manifest_file.name + ".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_file, manifest_file)
+
+    return manifest
+
+
+def _query_manifest(
+    manifest: dict,
+    layout: str,
+    patterns: List[str],
+    subjects: Union[List[str], str] = "all",
+    sessions: Union[List[str], str] = "all",
+) -> List[dict]:
+    """
+    Select manifest entries by subject, session and filename pattern.
+
+    Parameters
+    ----------
+    manifest : dict
+        Manifest returned by ``_load_manifest``.
+
+    layout : str
+        Path layout of the wanted files, with ``sub-*`` and ``ses-*``
+        components and a ``{name}`` placeholder for the filename, e.g.
+        ``"derivatives/sub-*/ses-*/{name}"``.
+
+    patterns : list of str
+        Filename patterns (``fnmatch`` syntax). A file matching any of
+        them is selected.
+
+    subjects, sessions : list of str or "all"
+        Normalized identifiers, as returned by ``_normalize_inputes``.
+
+    Returns
+    -------
+    entries : list of dict
+        Selected manifest entries, sorted by path.
+    """
+    layout_parts = layout.split("/")
+    selected = []
+
+    for entry in manifest["files"]:
+        parts = entry["path"].split("/")
+        if len(parts) != len(layout_parts):
+            continue
+
+        ok = True
+        for part, expected in zip(parts, layout_parts):
+            if expected == "sub-*":
+                ok = part.startswith("sub-") and (
+                    subjects == "all" or part[4:] in subjects
+                )
+            elif expected == "ses-*":
+                ok = part.startswith("ses-") and (
+                    sessions == "all" or part[4:] in sessions
+                )
+            elif expected == "{name}":
+                ok = any(fnmatch.fnmatch(part, p) for p in patterns)
+            else:
+                ok = part == expected
+            if not ok:
+                break
+
+        if ok:
+            selected.append(entry)
+
+    return sorted(selected, key=lambda e: e["path"])
+
+
+def _git_head(repo_path: Path) -> Optional[str]:
+    # Current commit of a git repository, None if it is not installed
+    if not (repo_path / ".git").exists():
+        return None
+
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=repo_path,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return result.stdout.strip()
+
+
+# git-annex key: BACKEND[-sSIZE][-mMTIME][-SCHUNK-CNUM]--NAME
+_ANNEX_KEY = re.compile(
+    r"^(?P<backend>[A-Z0-9_]+?)(?P<fields>(-[smSC]\d+)*)--(?P<name>.+)$"
+)
+
+_ANNEX_HASHES = {
+    "MD5": "md5",
+    "SHA1": "sha1",
+    "SHA224": "sha224",
+    "SHA256": "sha256",
+    "SHA384": "sha384",
+    "SHA512": "sha512",
+    "SHA3_224": "sha3_224",
+    "SHA3_256": "sha3_256",
+    "SHA3_384": "sha3_384",
+    "SHA3_512": "sha3_512",
+}
+
+
+def _annex_key(path: Path) -> Optional[str]:
+    """
+    Get the git-annex key of a file in the hidden dataset.
+
+    Locked files are symlinks whose target ends with the key. For
+    unlocked files the key is looked up with ``git annex lookupkey``.
+    Returns None for files not managed by git-annex.
+    """
+    if path.is_symlink():
+        return Path(os.readlink(path)).name
+
+    try:
+        result = subprocess.run(
+            ["git", "annex", "lookupkey", path.name],
+            cwd=path.parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return result.stdout.strip() or None
+
+
+def _parse_annex_key(
+    key: Optional[str],
+) -> Tuple[Optional[int], Optional[str], Optional[str]]:
+    """
+    Extract size, hash algorithm and digest from a git-annex key.
+
+    Unknown fields are returned as None (e.g. keys of the URL backend have
+    no checksum).
+    """
+    if not key:
+        return None, None, None
+
+    match = _ANNEX_KEY.match(key)
+    if match is None:
+        return None, None, None
+
+    size = None
+    for field in match.group("fields").split("-"):
+        if field.startswith("s"):
+            size = int(field[1:])
+
+    backend = match.group("backend")
+    if backend.endswith("E"):
+        # Extension backends append the file extension to the digest
+        backend = backend[:-1]
+
+    algorithm = _ANNEX_HASHES.get(backend)
+    if algorithm is None:
+        return size, None, None
+
+    digest = match.group("name").split(".")[0].lower()
+
+    return size, algorithm, digest
+
+
+def _verify_file(path: Path, key: Optional[str], cached: Optional[list] = None) -> bool:
+    """
+    Check a file against its git-annex key.
+
+    The size is checked first; the file is only hashed if the size
+    matches and the file changed since it was last verified (``cached``
+    holds its ``[size, mtime_ns, key]`` at that time).
+    """
+    st = path.stat()
+    if cached is not None and cached == [st.st_size, st.st_mtime_ns, key]:
+        return True
+
+    size, algorithm, digest = _parse_annex_key(key)
+
+    if size is not None and st.st_size != size:
+        return False
+
+    if algorithm is None:
+        return True
+
+    h = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+
+    return h.hexdigest() == digest
+
+
+def _record_verified(verified: dict, path: Path, key: Optional[str]) -> None:
+    st = path.stat()
+    verified[str(path)] = [st.st_size, st.st_mtime_ns, key]
+
+
+def _load_verified_cache(cache_file: Path) -> dict:
+    if not cache_file.exists():
+        return {}
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_verified_cache(cache_file: Path, verified: dict) -> None:
+    tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(verified, f)
+    os.replace(tmp_file, cache_file)
+
+
+_MATERIALIZE_METHODS = ("auto", "copy", "reflink", "hardlink", "move")
+
+# ioctl request number of FICLONE on Linux
+_FICLONE = 0x40049409
+
+
+def _materialize_file(
+    src: Path,
+    dest: Path,
+    method: str = "copy",
+    key: Optional[str] = None,
+    shared: bool = False,
+) -> str:
+    """
+    Place a fetched annexed file at ``dest`` as a regular file.
+
+    Annexed objects are never made writable: a hard linked file stays
+    read-only until its object is dropped, and a moved file is only made
+    writable once its key has been dropped from the hidden cache.
+
+    Parameters
+    ----------
+    src : pathlib.Path
+        File inside the hidden DataLad dataset (usually a symlink to the
+        annexed object).
+
+    dest : pathlib.Path
+        Destination path in the visible directory.
+
+    method : {"copy", "reflink", "hardlink", "move", "auto"}, default="copy"
+        Preferred method. Reflinks, hard links and moves fall back to a
+        copy when they are not possible (e.g. different filesystems).
+
+    key : str, optional
+        git-annex key of the file. Files without key are not hard linked
+        or moved.
+
+    shared : bool, default=False
+        Whether the key is shared with other requested files. Such files
+        are not hard linked or moved, but reflinked or copied.
+
+    Returns
+    -------
+    method : str
+        The method that was actually used.
+    """
+    # Annexed object behind the symlink
+    obj = src.resolve()
+
+    # Only objects of a single requested file can be linked or moved
+    linkable = key is not None and not shared
+
+    if method == "auto":
+        attempts = ["reflink", "hardlink"] if linkable else ["reflink"]
+    elif method == "copy":
+        attempts = []
+    elif method in ("hardlink", "move") and not linkable:
+        attempts = ["reflink"]
+    else:
+        attempts = [method]
+
+    for attempt in attempts:
+        try:
+            if attempt == "reflink":
+                _reflink(obj, dest)
+                # New inode, independent of the read-only annexed object
+                dest.chmod(dest.stat().st_mode | stat.S_IWUSR)
+            elif attempt in ("hardlink", "move"):
+                os.link(obj, dest)
+        except (OSError, ImportError):
+            continue
+
+        if attempt == "move":
+            if not _annex_dropkey(src, key):
+                dest.unlink()
+                break
+            # The object is gone from the annex, the file is ours
+            dest.chmod(dest.stat().st_mode | stat.S_IWUSR)
+
+        return attempt
+
+    shutil.copyfile(obj, dest)
+    return "copy"
+
+
+def _annex_dropkey(src: Path, key: str) -> bool:
+    # Remove the content of a key from the hidden cache and record it in
+    # the git-annex location log
+    try:
+        subprocess.run(
+            ["git", "annex", "dropkey", "--force", key],
+            cwd=src.parent,
+            capture_output=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return False
+
+    return True
+
+
+def _reflink(src: Path, dest: Path) -> None:
+    # Copy-on-write clone of src (Linux FICLONE)
+    import fcntl
+
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdest:
+        try:
+            fcntl.ioctl(fdest.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            fdest.close()
+            dest.unlink()
+            raise
 
 
 def _normalize_inputes(
@@ -499,13 +1159,15 @@ def _check_datalad_installed() -> bool:
 
 def _ensure_hidden_dataset(
     dataset_id: str,
+    source: Optional[str] = None,
     verbose: bool = False,
 ) -> Path:
     """
     Ensure that the hidden DataLad dataset exists in /tmp.
 
-    If the dataset does not exist or is empty, it is cloned.
-    If it already exists and contains data, it is reused.
+    If the dataset does not exist or is empty, it is cloned from
+    ``source`` (by default, the OpenNeuro GitHub mirror of
+    ``dataset_id``). If it already exists and contains data, it is reused.
 
     Returns
     -------
@@ -527,8 +1189,11 @@ def _ensure_hidden_dataset(
     if verbose:
         print("Cloning DataLad dataset into hidden cache...")
 
+    if source is None:
+        source = f"https://github.com/OpenNeuroDatasets/{dataset_id}.git"
+
     ds = dl.clone(
-        source=f"https://github.com/OpenNeuroDatasets/{dataset_id}.git",
+        source=source,
         path=hidden_dataset_path,
         result_renderer="disabled",
     )
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""
+Event Related Potentials of every condition/class group.
+
+Each subject is loaded once and its trials are added to one running ERP
+accumulator per group, so the trials of all subjects are never held in
+memory at the same time.
+"""
+
+import mne
+from pathlib import Path
+from lib.accumulators import ERPAccumulator
+from lib.data_provider import iter_grouped_subjects
+
+
+def compute_grouped_erps(
+    root_dir: Path,
+    n_s_list: list,
+    datatype: str,
+    conditions: list,
+    classes: list,
+    info: mne.Info,
+    tmin: float,
+    exclude_emg: bool = False,
+    return_sem: bool = False,
+) -> dict:
+    """
+    Compute the ERP of every condition/class group over a list of subjects.
+
+    Parameters:
+    - root_dir (Path): The root directory containing the data.
+    - n_s_list (list): List of subject numbers.
+    - datatype (str): The type of data to extract ("eeg" or "exg").
+    - conditions (list): Conditions of the groups.
+    - classes (list): Classes of the groups.
+    - info (mne.Info): Measurement info of the channels.
+    - tmin (float): Start time of the epochs.
+    - exclude_emg (bool): If True, skip the EMG contaminated trials.
+    - return_sem (bool): If True, also return the standard error of the
+      mean of every group (e.g. for confidence bands). Default False.
+
+    Returns:
+    - dict: Evoked objects keyed by (condition, class). If return_sem is
+      True, (Evoked, standard error Evoked) tuples.
+    """
+    accumulators = {
+        (cond, cl): ERPAccumulator(tmin=tmin) for cl in classes for cond in conditions
+    }
+
+    for _, X, _, groups in iter_grouped_subjects(
+        root_dir, n_s_list, datatype, conditions, classes, exclude_emg
+    ):
+        for key, index in groups.items():
+            accumulators[key].add(X[index])
+        del X
+
+    erps = dict()
+    for (cond, cl), accumulator in accumulators.items():
+        comment = f"{cond} - {cl}"
+        evoked = accumulator.to_evoked(info, comment=comment)
+        if return_sem:
+            sem = mne.EvokedArray(
+                accumulator.sem,
+                info,
+                tmin=tmin,
+                comment=f"{comment} (SEM)",
+                nave=accumulator.count,
+                verbose="WARNING",
+            )
+            erps[(cond, cl)] = (evoked, sem)
+        else:
+            erps[(cond, cl)] = evoked
+
+    return erps
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+"""
+Headless figure export for the plotting scripts.
+
+A figure is described by a spec: the output file, a drawing function that
+returns the figure and its parameters, and the input files it depends on.
+Specs are rendered with the non-interactive Agg backend (in a worker
+pool if requested), every figure is closed right after it is saved, and
+figures whose inputs, parameters and drawing code did not change since
+the last export are skipped. The hash of the inputs is stored in a
+``.inputs.json`` sidecar next to every figure.
+
+Scripts exporting with n_jobs > 1 must keep their module-level code under
+``if __name__ == "__main__":``, since the workers may import the script
+again to find the drawing functions.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+
+def figure_spec(
+    file_name: str,
+    draw: Callable,
+    params: Optional[dict] = None,
+    inputs: tuple = (),
+    savefig_kwargs: Optional[dict] = None,
+    rc_params: Optional[dict] = None,
+) -> dict:
+    """
+    Describe a figure to export.
+
+    Parameters:
+    - file_name (str): Output file of the figure.
+    - draw (Callable): Module-level function called as ``draw(**params)``
+      that returns the figure.
+    - params (dict): Parameters of draw. Arrays and MNE objects are hashed
+      by their data.
+    - inputs (tuple): Files read to build the figure (e.g. TFR or PSD
+      files). They are hashed by path, size and modification time.
+    - savefig_kwargs (dict): Keyword arguments of savefig.
+    - rc_params (dict): Matplotlib rcParams used while drawing.
+
+    Returns:
+    - dict: The figure spec.
+    """
+    return {
+        "file_name": str(file_name),
+        "draw": draw,
+        "params": params or dict(),
+        "inputs": tuple(str(f) for f in inputs),
+        "savefig_kwargs": savefig_kwargs or dict(),
+        "rc_params": rc_params or dict(),
+    }
+
+
+def spec_hash(spec: dict) -> str:
+    """
+    Hash the drawing code, parameters and inputs of a figure spec.
+
+    The drawing code is the source of the module defining the drawing
+    function, so editing the function or the helpers next to it exports
+    the figure again.
+
+    Parameters:
+    - spec (dict): The figure spec.
+
+    Returns:
+    - str: Hexadecimal digest.
+    """
+    digest = hashlib.sha1()
+    _update_code_hash(digest, spec["draw"])
+    _update_hash(digest, spec["params"])
+    _update_hash(digest, spec["savefig_kwargs"])
+    _update_hash(digest, spec["rc_params"])
+
+    for file_name in spec["inputs"]:
+        stat = os.stat(file_name)
+        digest.update(
+            f"{Path(file_name).resolve()}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+        )
+
+    return digest.hexdigest()
+
+
+def is_up_to_date(spec: dict) -> bool:
+    """
+    Check whether the figure of a spec exists and was exported with the
+    same inputs and parameters.
+
+    Parameters:
+    - spec (dict): The figure spec.
+
+    Returns:
+    - bool: True if the figure can be skipped.
+    """
+    file_name = Path(spec["file_name"])
+    sidecar = _sidecar_name(file_name)
+    if not file_name.exists() or not sidecar.exists():
+        return False
+
+    try:
+        with open(sidecar) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    return saved.get("hash") == spec_hash(spec)
+
+
+def export_figures(specs: list, n_jobs: int = 1, force: bool = False) -> dict:
+    """
+    Render and save the figures of a list of specs.
+
+    Parameters:
+    - specs (list): Figure specs from figure_spec.
+    - n_jobs (int): Number of worker processes. Default 1.
+    - force (bool): Export even the figures that are up to date.
+      Default False.
+
+    Returns:
+    - dict: The exported ("saved") and skipped ("skipped") file names.
+    """
+    # Hashed here, since the workers see the functions of the script under
+    # another module name
+    pending = []
+    hashes = []
+    skipped = []
+    for spec in specs:
+        if not force and is_up_to_date(spec):
+            skipped.append(spec["file_name"])
+        else:
+            pending.append(spec)
+            hashes.append(spec_hash(spec))
+
+    if n_jobs == 1 or len(pending) <= 1:
+        saved = [_export_figure(spec, h) for spec, h in zip(pending, hashes)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(pending))) as pool:
+            saved = list(pool.map(_export_figure, pending, hashes))
+
+    return {"saved": saved, "skipped": skipped}
+
+
+def _export_figure(spec: dict, digest: str) -> str:
+    # Headless rendering: the figure is never shown and always closed
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    file_name = Path(spec["file_name"])
+    file_name.parent.mkdir(parents=True, exist_ok=True)
+
+    with plt.rc_context(spec["rc_params"]):
+        fig = spec["draw"](**spec["params"])
+        try:
+            fig.savefig(file_name, **spec["savefig_kwargs"])
+        finally:
+            plt.close(fig)
+
+    with open(_sidecar_name(file_name), "w") as f:
+        json.dump({"hash": digest}, f)
+
+    return str(file_name)
+
+
+def _sidecar_name(file_name: Path) -> Path:
+    return file_name.with_name(file_name.name + ".inputs.json")
+
+
+def _update_code_hash(digest, func) -> None:
+    # Name of a function and source of its module (or of the function when
+    # the module has no source file)
+    digest.update(f"{func.__module__}.{func.__qualname__}".encode())
+    try:
+        source = inspect.getsource(inspect.getmodule(func) or func)
+    except (OSError, TypeError):
+        source = ""
+    digest.update(source.encode())
+
+
+def _update_hash(digest, value) -> None:
+    # Hash data by content and everything else by its representation
+    if isinstance(value, np.ndarray):
+        digest.update(str((value.dtype, value.shape)).encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        for key in sorted(value, key=str):
+            digest.update(str(key).encode())
+            _update_hash(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _update_hash(digest, item)
+    elif callable(value):
+        _update_code_hash(digest, value)
+    elif isinstance(getattr(value, "data", None), np.ndarray):
+        # MNE objects (Evoked, AverageTFR, ...)
+        digest.update(type(value).__name__.encode())
+        _update_hash(digest, np.asarray(value.data))
+        for attr in ("times", "freqs", "ch_names"):
+            if hasattr(value, attr):
+                _update_hash(digest, np.asarray(getattr(value, attr)))
+    else:
+        digest.update(repr(value).encode())
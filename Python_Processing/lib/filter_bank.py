@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+
+"""
+Filter bank shared by the preprocessing and the EMG control.
+
+The FIR kernels are designed with MNE (same defaults as ``Raw.filter`` and
+``Raw.notch_filter``) once per (sampling frequency, band), cached in
+memory and on disk, and applied with overlap-add FFT convolution (FFT
+length tuned to the kernel, as MNE does) to a few channels at a time,
+each chunk written back in place. StreamingFilter applies the same
+kernels to signals read in chunks, with overlap-save convolution.
+"""
+
+import os
+import tempfile
+import numpy as np
+import mne
+from pathlib import Path
+from typing import Optional
+from scipy import fft as sp_fft
+from scipy.signal import oaconvolve
+
+# Kernels designed in this process, keyed by (kind, sfreq, l_freq, h_freq)
+_KERNELS = dict()
+
+# Signals filtered at once: bounds the extra memory to a few copies of
+# CHUNK_SIZE channels instead of copies of the whole recording
+CHUNK_SIZE = 4
+
+# Folder of the on-disk kernel cache
+FILTER_CACHE_DIR = Path(tempfile.gettempdir()) / "inner_speech_filters"
+
+
+def get_filter_kernel(
+    sfreq: float,
+    l_freq: Optional[float],
+    h_freq: Optional[float],
+    cache_dir: Optional[Path] = FILTER_CACHE_DIR,
+) -> np.ndarray:
+    """
+    Get the zero-phase FIR kernel of a band-pass, high-pass or low-pass
+    filter, as designed by ``mne.filter.create_filter`` with its defaults.
+
+    Parameters:
+    - sfreq (float): Sampling frequency of the data.
+    - l_freq (float): Low cut-off frequency. None for a low-pass filter.
+    - h_freq (float): High cut-off frequency. None for a high-pass filter.
+    - cache_dir (Path): Folder of the on-disk cache. None to disable it.
+
+    Returns:
+    - np.ndarray: The filter kernel (odd length, linear phase).
+    """
+    return _get_kernel(("pass", sfreq, l_freq, h_freq), cache_dir)
+
+
+def get_notch_kernel(
+    sfreq: float,
+    freq: float,
+    cache_dir: Optional[Path] = FILTER_CACHE_DIR,
+) -> np.ndarray:
+    """
+    Get the zero-phase FIR kernel of a notch filter, with the band-stop
+    design used by ``mne.filter.notch_filter`` (notch width ``freq / 200``
+    and 1 Hz transition band).
+
+    Parameters:
+    - sfreq (float): Sampling frequency of the data.
+    - freq (float): Frequency to remove.
+    - cache_dir (Path): Folder of the on-disk cache. None to disable it.
+
+    Returns:
+    - np.ndarray: The filter kernel (odd length, linear phase).
+    """
+    return _get_kernel(("notch", sfreq, freq, None), cache_dir)
+
+
+def apply_kernel(
+    data: np.ndarray,
+    kernel: np.ndarray,
+    pad: str = "reflect_limited",
+    chunk_size: int = CHUNK_SIZE,
+) -> np.ndarray:
+    """
+    Apply a zero-phase FIR kernel along the last axis of the data.
+
+    The signals are padded at both ends (as MNE does) and convolved with
+    overlap-add FFT convolution, ``chunk_size`` signals at a time.
+
+    Parameters:
+    - data (np.ndarray): Signals to filter (..., n_times).
+    - kernel (np.ndarray): Odd length, linear phase FIR kernel.
+    - pad (str): "reflect_limited" (odd reflection, MNE default for Raw)
+      or "edge" (MNE default for Epochs).
+    - chunk_size (int): Number of signals filtered at once. Default
+      CHUNK_SIZE.
+
+    Returns:
+    - np.ndarray: The filtered signals, with the same shape as data.
+    """
+    shape = data.shape
+    signals = data.reshape(-1, shape[-1])
+    n_times = shape[-1]
+
+    n_edge = max(min(len(kernel), n_times) - 1, 0)
+    delay = (len(kernel) - 1) // 2
+    n_fft = _fft_length(len(kernel), n_times + 2 * n_edge)
+    kernel_fft = sp_fft.rfft(kernel, n_fft)
+
+    out = np.empty(signals.shape, dtype=np.result_type(signals, kernel))
+    for start in range(0, signals.shape[0], chunk_size):
+        block = signals[start : start + chunk_size]
+        if pad == "edge":
+            block = np.pad(block, ((0, 0), (n_edge, n_edge)), mode="edge")
+        elif pad == "reflect_limited":
+            block = _pad_reflect_limited(block, n_edge)
+        else:
+            raise ValueError(f"Invalid pad '{pad}'")
+        out[start : start + chunk_size] = _overlap_add(
+            block, kernel_fft, n_fft, len(kernel), n_edge + delay, n_times
+        )
+
+    return out.reshape(shape)
+
+
+def filter_raw(
+    raw: mne.io.BaseRaw, l_freq: Optional[float], h_freq: Optional[float]
+) -> mne.io.BaseRaw:
+    """
+    Band-pass filter the data channels of a preloaded Raw in place.
+
+    Parameters:
+    - raw (mne.io.BaseRaw): Preloaded raw data.
+    - l_freq (float): Low cut-off frequency. None for a low-pass filter.
+    - h_freq (float): High cut-off frequency. None for a high-pass filter.
+
+    Returns:
+    - mne.io.BaseRaw: The filtered raw data.
+    """
+    kernel = get_filter_kernel(raw.info["sfreq"], l_freq, h_freq)
+    _filter_picks(raw._data, _data_picks(raw.info), kernel, "reflect_limited")
+    _update_info_band(raw.info, l_freq, h_freq)
+
+    return raw
+
+
+def notch_filter_raw(raw: mne.io.BaseRaw, freq: float) -> mne.io.BaseRaw:
+    """
+    Notch filter the data channels of a preloaded Raw in place.
+
+    Parameters:
+    - raw (mne.io.BaseRaw): Preloaded raw data.
+    - freq (float): Frequency to remove (power line frequency).
+
+    Returns:
+    - mne.io.BaseRaw: The filtered raw data.
+    """
+    kernel = get_notch_kernel(raw.info["sfreq"], freq)
+    _filter_picks(raw._data, _data_picks(raw.info), kernel, "reflect_limited")
+
+    return raw
+
+
+def filter_epochs(
+    epochs: mne.BaseEpochs, l_freq: Optional[float], h_freq: Optional[float]
+) -> mne.BaseEpochs:
+    """
+    Band-pass filter the data channels of preloaded Epochs in place.
+
+    Parameters:
+    - epochs (mne.BaseEpochs): Preloaded epochs.
+    - l_freq (float): Low cut-off frequency. None for a low-pass filter.
+    - h_freq (float): High cut-off frequency. None for a high-pass filter.
+
+    Returns:
+    - mne.BaseEpochs: The filtered epochs.
+    """
+    kernel = get_filter_kernel(epochs.info["sfreq"], l_freq, h_freq)
+    _filter_picks(epochs._data, _data_picks(epochs.info), kernel, "edge")
+    _update_info_band(epochs.info, l_freq, h_freq)
+
+    return epochs
+
+
+class StreamingFilter:
+    """
+    Zero-phase FIR filter of signals received in consecutive chunks.
+
+    Each chunk is convolved with overlap-save FFT convolution, keeping the
+    last ``len(kernel) - 1`` input samples for the next chunk. The output
+    is delayed by the half length of the kernel, so the linear-phase delay
+    is removed and output sample j is aligned with input sample j. The
+    ends of the signal are padded as apply_kernel does ("reflect_limited"),
+    so the concatenated outputs equal apply_kernel on the whole signal.
+
+    Parameters:
+    - kernel (np.ndarray): Odd length, linear phase FIR kernel.
+    - n_times (int): Total number of samples of the signals.
+    """
+
+    def __init__(self, kernel: np.ndarray, n_times: int):
+        self.kernel = np.asarray(kernel)
+        self.n_times = n_times
+        self.delay = (len(self.kernel) - 1) // 2
+        n_edge = max(min(len(self.kernel), n_times) - 1, 0)
+        self._n_pad = min(self.delay, n_edge, n_times - 1)
+        # Input received, output produced and padded input not consumed
+        self.n_in = 0
+        self.n_out = 0
+        self._buffer = None
+
+    def push(self, chunk: np.ndarray) -> np.ndarray:
+        """
+        Filter the next samples of the signals.
+
+        Parameters:
+        - chunk (np.ndarray): Next input samples (n_signals, n_samples).
+
+        Returns:
+        - np.ndarray: The output samples completed by this chunk
+          (n_signals, n_completed), following the previous outputs. Empty
+          until ``delay`` samples after the first one have been received.
+        """
+        self.n_in += chunk.shape[-1]
+        if self._buffer is None:
+            self._buffer = chunk
+        else:
+            self._buffer = np.concatenate((self._buffer, chunk), axis=-1)
+
+        if self.n_out == 0 and self._buffer.shape[-1] == self.n_in:
+            # Left padding, once the samples it reflects have been received
+            if self.n_in <= self._n_pad and self.n_in < self.n_times:
+                return self._buffer[:, :0]
+            self._buffer = np.concatenate(
+                (self._pad(self._buffer[:, :1], self._buffer[:, 1:], -1), self._buffer),
+                axis=-1,
+            )
+        if self.n_in >= self.n_times:
+            # Right padding, at the end of the signals
+            self._buffer = np.concatenate(
+                (self._buffer, self._pad(self._buffer[:, -1:], self._buffer, 1)),
+                axis=-1,
+            )
+
+        n_ready = self._buffer.shape[-1] - 2 * self.delay
+        if n_ready <= 0:
+            return self._buffer[:, :0]
+        out = oaconvolve(self._buffer, self.kernel[np.newaxis, :], "valid", axes=-1)
+        self._buffer = self._buffer[:, n_ready:]
+        self.n_out += n_ready
+
+        return out
+
+    def _pad(self, edge: np.ndarray, x: np.ndarray, side: int) -> np.ndarray:
+        # delay samples of odd reflection about the edge sample (side -1 for
+        # the start, 1 for the end), zeros beyond the reflected samples
+        n_ref = self._n_pad
+        if side < 0:
+            ref = 2 * edge - x[:, n_ref - 1 :: -1] if n_ref else x[:, :0]
+            zeros = np.zeros(x.shape[:-1] + (self.delay - n_ref,), dtype=x.dtype)
+            return np.concatenate((zeros, ref), axis=-1)
+        ref = 2 * edge - x[:, -2 : -n_ref - 2 : -1] if n_ref else x[:, :0]
+        zeros = np.zeros(x.shape[:-1] + (self.delay - n_ref,), dtype=x.dtype)
+        return np.concatenate((ref, zeros), axis=-1)
+
+
+def _filter_picks(
+    data: np.ndarray, picks: np.ndarray, kernel: np.ndarray, pad: str
+) -> None:
+    # Filter the picked channels (axis -2) in place, CHUNK_SIZE signals at
+    # a time, so that only one chunk of the data is copied at once
+    if data.ndim == 2:
+        for start in range(0, len(picks), CHUNK_SIZE):
+            rows = picks[start : start + CHUNK_SIZE]
+            data[rows] = apply_kernel(data[rows], kernel, pad=pad)
+        return
+
+    # Epochs: chunks of whole epochs, as the epochs are short
+    n_epochs = max(CHUNK_SIZE // max(len(picks), 1), 1)
+    for start in range(0, len(data), n_epochs):
+        epochs = slice(start, start + n_epochs)
+        data[epochs, picks] = apply_kernel(data[epochs, picks], kernel, pad=pad)
+
+
+def _fft_length(n_h: int, n_x: int) -> int:
+    # FFT length of the overlap-add, minimizing the cost of MNE
+    # (mne.filter._overlap_add_filter) for a kernel of n_h samples
+    min_fft = 2 * n_h - 1
+    if n_x < min_fft:
+        return sp_fft.next_fast_len(min_fft)
+
+    n_fft = 2 ** np.arange(
+        np.ceil(np.log2(min_fft)), np.ceil(np.log2(n_x)) + 1, dtype=int
+    )
+    cost = np.ceil(n_x / (n_fft - n_h + 1)) * n_fft * (np.log2(n_fft) + 1)
+    cost += 4e-5 * n_fft * n_x
+
+    return int(n_fft[np.argmin(cost)])
+
+
+def _overlap_add(
+    x: np.ndarray,
+    kernel_fft: np.ndarray,
+    n_fft: int,
+    n_h: int,
+    start: int,
+    n_out: int,
+) -> np.ndarray:
+    # Samples [start, start + n_out) of the full convolution of the signals
+    # x (n_signals, n_x) with a kernel of n_h samples (real FFT kernel_fft),
+    # by overlap-add of n_fft blocks
+    n_seg = n_fft - n_h + 1
+    n_x = x.shape[-1]
+
+    y = np.zeros((x.shape[0], n_x + n_h - 1), dtype=x.dtype)
+    for seg in range(0, n_x, n_seg):
+        block = sp_fft.rfft(x[:, seg : seg + n_seg], n_fft) * kernel_fft
+        block = sp_fft.irfft(block, n_fft)
+        stop = min(seg + n_fft, y.shape[-1])
+        y[:, seg:stop] += block[:, : stop - seg]
+
+    return y[:, start : start + n_out]
+
+
+def _get_kernel(key: tuple, cache_dir: Optional[Path]) -> np.ndarray:
+    if key in _KERNELS:
+        return _KERNELS[key]
+
+    kind, sfreq, l_freq, h_freq = key
+    file_name = None
+    if cache_dir is not None:
+        # Designs may change between MNE versions
+        file_name = (
+            Path(cache_dir)
+            / f"{kind}_{sfreq:g}_{l_freq}_{h_freq}_mne{mne.__version__}.npy"
+        )
+
+    if file_name is not None and file_name.exists():
+        kernel = np.load(file_name)
+    else:
+        kernel = _design_kernel(kind, sfreq, l_freq, h_freq)
+        if file_name is not None:
+            file_name.parent.mkdir(parents=True, exist_ok=True)
+            tmp_name = file_name.with_name(f"{file_name.stem}.{os.getpid()}.npy")
+            np.save(tmp_name, kernel)
+            os.replace(tmp_name, file_name)
+
+    _KERNELS[key] = kernel
+    return kernel
+
+
+def _design_kernel(
+    kind: str, sfreq: float, l_freq: Optional[float], h_freq: Optional[float]
+) -> np.ndarray:
+    if kind == "notch":
+        freq = l_freq
+        notch_width = freq / 200.0
+        trans_bandwidth = 1.0
+        # Band-stop filter (l_freq > h_freq), as in mne.filter.notch_filter
+        return mne.filter.create_filter(
+            None,
+            sfreq,
+            l_freq=freq + notch_width / 2.0 + trans_bandwidth / 2.0,
+            h_freq=freq - notch_width / 2.0 - trans_bandwidth / 2.0,
+            l_trans_bandwidth=trans_bandwidth / 2.0,
+            h_trans_bandwidth=trans_bandwidth / 2.0,
+            verbose="WARNING",
+        )
+
+    return mne.filter.create_filter(None, sfreq, l_freq, h_freq, verbose="WARNING")
+
+
+def _pad_reflect_limited(x: np.ndarray, n_edge: int) -> np.ndarray:
+    # Odd reflection of the first/last samples, zeros beyond the signal
+    if n_edge == 0:
+        return x
+
+    n_times = x.shape[-1]
+    n_ref = min(n_edge, n_times - 1)
+    zeros = np.zeros(x.shape[:-1] + (n_edge - n_ref,), dtype=x.dtype)
+    left = 2 * x[:, :1] - x[:, n_ref:0:-1]
+    right = 2 * x[:, -1:] - x[:, -2 : -n_ref - 2 : -1]
+
+    return np.concatenate((zeros, left, x, right, zeros), axis=-1)
+
+
+def _data_picks(info: mne.Info) -> np.ndarray:
+    return mne.pick_types(
+        info, eeg=True, eog=True, emg=True, ecg=True, stim=False, exclude=[]
+    )
+
+
+def _update_info_band(
+    info: mne.Info, l_freq: Optional[float], h_freq: Optional[float]
+) -> None:
+    # Keep the filter settings of the data up to date, as MNE does
+    unlock = info._unlock() if hasattr(info, "_unlock") else _NoLock()
+    with unlock:
+        if l_freq is not None and (
+            info["highpass"] is None or l_freq > info["highpass"]
+        ):
+            info["highpass"] = float(l_freq)
+        if h_freq is not None and (info["lowpass"] is None or h_freq < info["lowpass"]):
+            info["lowpass"] = float(h_freq)
+
+
+class _NoLock:
+    # Older MNE versions do not lock the measurement info
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+"""
+Timing and memory of the stages of the preprocessing.
+
+A StageLog records, for every stage of a recording (subject, block), the
+wall time, CPU time, peak resident memory and the bytes read and written
+by the process. Records are appended to a CSV file as soon as a stage
+ends, so an interrupted run keeps its measures, and summarized per stage
+at the end. A disabled log hands out a no-op context and leaves decorated
+functions untouched, so the instrumentation can stay in the scripts.
+"""
+
+import contextlib
+import csv
+import functools
+import sys
+import time
+import pandas as pd
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Columns of the stage records (CSV file)
+STAGE_COLUMNS = [
+    "start",
+    "subject",
+    "block",
+    "stage",
+    "wall_time",
+    "cpu_time",
+    "peak_rss_mb",
+    "read_mb",
+    "write_mb",
+]
+
+# Shared no-op context of the disabled logs
+_NO_STAGE = contextlib.nullcontext()
+
+
+class StageLog:
+    """
+    Log of the stages of a pipeline.
+
+    Stages must not be nested: the peak memory of a stage is measured from
+    its start (on Linux), which resets the peak of an enclosing stage.
+
+    Parameters:
+    - file_name (Path): CSV file the records are appended to. Default None
+      (records only kept in memory).
+    - enabled (bool): Whether to measure the stages. Default True.
+    - verbose (bool): Whether to print every stage when it ends. Default
+      False.
+    """
+
+    def __init__(
+        self,
+        file_name: Optional[Path] = None,
+        enabled: bool = True,
+        verbose: bool = False,
+    ):
+        self.file_name = None if file_name is None else Path(file_name)
+        self.enabled = enabled
+        self.verbose = verbose
+        self.records = []
+        self.subject = None
+        self.block = None
+
+    def set_recording(self, n_s: Optional[int], n_b: Optional[int]) -> None:
+        """
+        Set the recording (subject, block) of the following stages.
+
+        Parameters:
+        - n_s (int): The subject number.
+        - n_b (int): The block number.
+
+        Returns:
+        - None
+        """
+        self.subject = n_s
+        self.block = n_b
+
+    def stage(self, name: str):
+        """
+        Measure a stage of the current recording.
+
+        Parameters:
+        - name (str): Name of the stage.
+
+        Returns:
+        - Context manager of the stage.
+        """
+        if not self.enabled:
+            return _NO_STAGE
+        return self._measure(name)
+
+    def timed(self, name: Optional[str] = None) -> Callable:
+        """
+        Decorator measuring every call of a function as a stage.
+
+        Parameters:
+        - name (str): Name of the stage. Default the function name.
+
+        Returns:
+        - Callable: The decorator.
+        """
+
+        def decorator(func):
+            if not self.enabled:
+                return func
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self._measure(name or func.__name__):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Summarize the recorded stages.
+
+        Returns:
+        - pd.DataFrame: Per stage (in order of appearance): number of
+          calls, total and mean wall time (s), total CPU time (s), share of
+          the total wall time (%), maximum peak RSS (MB) and total bytes
+          read and written (MB).
+        """
+        records = pd.DataFrame(self.records, columns=STAGE_COLUMNS)
+        summary = records.groupby("stage", sort=False).agg(
+            calls=("wall_time", "size"),
+            wall_time=("wall_time", "sum"),
+            mean_wall_time=("wall_time", "mean"),
+            cpu_time=("cpu_time", "sum"),
+            peak_rss_mb=("peak_rss_mb", "max"),
+            read_mb=("read_mb", "sum"),
+            write_mb=("write_mb", "sum"),
+        )
+        summary.insert(
+            3, "wall_share", 100 * summary["wall_time"] / summary["wall_time"].sum()
+        )
+
+        return summary
+
+    def report(self) -> str:
+        """
+        Format the summary of the recorded stages.
+
+        Returns:
+        - str: Table of the summary.
+        """
+        if not self.records:
+            return "No stages recorded"
+
+        return self.summary().to_string(float_format=lambda x: f"{x:.2f}")
+
+    @contextlib.contextmanager
+    def _measure(self, name: str) -> Iterator[None]:
+        _reset_peak_rss()
+        read_start, write_start = _io_counters()
+        start = datetime.now().isoformat(timespec="seconds")
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - wall
+            cpu_time = time.process_time() - cpu
+            read_end, write_end = _io_counters()
+            record = [
+                start,
+                self.subject,
+                self.block,
+                name,
+                wall_time,
+                cpu_time,
+                _peak_rss_mb(),
+                _delta_mb(read_start, read_end),
+                _delta_mb(write_start, write_end),
+            ]
+            self._add(record)
+
+    def _add(self, record: list) -> None:
+        self.records.append(record)
+
+        if self.file_name is not None:
+            new_file = not self.file_name.exists()
+            self.file_name.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.file_name, "a", newline="") as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(STAGE_COLUMNS)
+                writer.writerow(record)
+
+        if self.verbose:
+            print(
+                f"{record[3]}: {record[4]:.2f} s wall, {record[5]:.2f} s CPU, "
+                f"{record[6]} MB peak"
+            )
+
+
+def _reset_peak_rss() -> None:
+    # Reset the peak RSS of the process (Linux >= 4.0), so the peak of a
+    # stage does not include the previous stages
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> Optional[float]:
+    # Peak resident memory since the last reset, else of the whole process
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    if sys.platform == "darwin":
+        peak /= 1024
+    return round(peak / 1024, 1)
+
+
+def _io_counters() -> tuple:
+    # Bytes read and written by the process (Linux only), including reads
+    # served from the page cache
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(":") for line in f)
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _delta_mb(start: Optional[int], end: Optional[int]) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return round((end - start) / 1024**2, 1)
@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+
+"""
+Stages of the preprocessing of a recording (InnerSpeech_preprocessing.py).
+
+Each stage is a function, and preprocess_recording and finish_dataset
+chain them, so the preprocessing script and the benchmarks run the same
+code.
+"""
+
+import pickle
+import mne
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Optional
+from lib.AdHoc_modification import adhoc_subject_3
+from lib.data_extractions import (
+    extract_subject_from_bdf,
+    get_age_gender,
+    get_events_from_raw,
+)
+from lib.EMG_Control import EMG_control_single_th
+from lib.events_analysis import (
+    add_block_tag,
+    add_condition_tag,
+    check_baseline_tags,
+    cognitive_control_check,
+    delete_trigger_column,
+    event_correction,
+    standardize_labels,
+)
+from lib.filter_bank import filter_raw, notch_filter_raw
+from lib.instrumentation import StageLog
+from lib.report_store import update_report_table
+from lib.utils import ensure_dir
+
+# External channels of the BioSemi recordings
+EXG_CHANNELS = ["EXG1", "EXG2", "EXG3", "EXG4", "EXG5", "EXG6", "EXG7", "EXG8"]
+
+# Trial epochs around the cue (s)
+EPOCH_TMIN = -0.5
+EPOCH_TMAX = 4
+
+
+def correct_events(rawdata: mne.io.BaseRaw, n_s: int, n_b: int) -> tuple:
+    """
+    Extract the events of a recording and correct the missing ones.
+
+    Parameters:
+    - rawdata (mne.io.BaseRaw): The recording.
+    - n_s (int): The subject number.
+    - n_b (int): The block number.
+
+    Returns:
+    - tuple: The corrected events (pd.DataFrame) and their MNE array.
+    """
+    events = get_events_from_raw(rawdata, n_s, n_b)
+    # Check and Correct baseline tags
+    events = check_baseline_tags(events)
+    # Check and Correct event
+    events = event_correction(events=events)
+
+    event_array = np.array(events.to_numpy(), dtype=int)
+
+    return events, event_array
+
+
+def filter_recording(
+    rawdata: mne.io.BaseRaw,
+    ref_channels: list,
+    notch: bool = True,
+    band_pass: bool = True,
+    low_cut: Optional[float] = 0.5,
+    high_cut: Optional[float] = 100,
+    line_freq: float = 50,
+) -> mne.io.BaseRaw:
+    """
+    Re-reference, notch and band-pass filter a recording in place.
+
+    Parameters:
+    - rawdata (mne.io.BaseRaw): The preloaded recording.
+    - ref_channels (list): Reference channels.
+    - notch (bool): Whether to remove the power line. Default True.
+    - band_pass (bool): Whether to band-pass filter. Default True.
+    - low_cut (float): Low cut-off frequency. Default 0.5.
+    - high_cut (float): High cut-off frequency. Default 100.
+    - line_freq (float): Power line frequency. Default 50.
+
+    Returns:
+    - mne.io.BaseRaw: The filtered recording.
+    """
+    rawdata.set_eeg_reference(ref_channels=ref_channels)
+    if notch:
+        # Notch filter (kernel designed once and shared by all recordings)
+        rawdata = notch_filter_raw(rawdata, freq=line_freq)
+
+    if band_pass:
+        rawdata = filter_raw(rawdata, low_cut, high_cut)
+
+    return rawdata
+
+
+def epoch_trials(
+    rawdata: mne.io.BaseRaw,
+    event_array: np.ndarray,
+    event_id: dict,
+    picks,
+    decim: int,
+    baseline: Optional[tuple] = None,
+) -> mne.Epochs:
+    """
+    Epoch and decimate the trials of a recording.
+
+    Parameters:
+    - rawdata (mne.io.BaseRaw): The filtered recording.
+    - event_array (np.ndarray): The corrected events.
+    - event_id (dict): Trial tags of every class.
+    - picks: Channels to keep.
+    - decim (int): Decimation factor.
+    - baseline (tuple): Baseline correction interval. Default None.
+
+    Returns:
+    - mne.Epochs: The trials.
+    """
+    return mne.Epochs(
+        rawdata,
+        event_array,
+        event_id=event_id,
+        tmin=EPOCH_TMIN,
+        tmax=EPOCH_TMAX,
+        picks=picks,
+        preload=True,
+        detrend=0,
+        decim=decim,
+        baseline=baseline,
+    )
+
+
+def epoch_baseline(
+    rawdata: mne.io.BaseRaw, event_array: np.ndarray, baseline_id: dict, decim: int
+) -> mne.Epochs:
+    """
+    Extract the resting baseline of a recording (between tags 13 and 14).
+
+    Parameters:
+    - rawdata (mne.io.BaseRaw): The filtered recording.
+    - event_array (np.ndarray): The corrected events.
+    - baseline_id (dict): Tag of the baseline start.
+    - decim (int): Decimation factor.
+
+    Returns:
+    - mne.Epochs: The baseline, with all the channels.
+    """
+    # Calculate the Baseline time
+    t_baseline = (
+        event_array[event_array[:, 2] == 14, 0]
+        - event_array[event_array[:, 2] == 13, 0]
+    ) / rawdata.info["sfreq"]
+    t_baseline = t_baseline[0]
+
+    return mne.Epochs(
+        rawdata,
+        event_array,
+        event_id=baseline_id,
+        tmin=0,
+        tmax=round(t_baseline),
+        picks="all",
+        preload=True,
+        detrend=0,
+        decim=decim,
+        baseline=None,
+    )
+
+
+def apply_ica(
+    epochs: mne.Epochs,
+    epochs_full: mne.Epochs,
+    eog_channels: list,
+    n_components=None,
+    method: str = "infomax",
+    random_state: int = 23,
+    fit_params: Optional[dict] = None,
+) -> mne.preprocessing.ICA:
+    """
+    Remove the ICA components correlated with the external channels.
+
+    Parameters:
+    - epochs (mne.Epochs): EEG trials, cleaned in place.
+    - epochs_full (mne.Epochs): The same trials with the EXG channels.
+    - eog_channels (list): EXG channels used to find the components.
+    - n_components: Number of components. Default None (automatic).
+    - method (str): ICA method. Default "infomax".
+    - random_state (int): Random state. Default 23.
+    - fit_params (dict): ICA fit parameters. Default None.
+
+    Returns:
+    - mne.preprocessing.ICA: The fitted ICA.
+    """
+    ica = mne.preprocessing.ICA(
+        n_components=n_components,
+        random_state=random_state,
+        method=method,
+        fit_params=fit_params,
+    )
+
+    # Fit ICA, calculate components
+    ica.fit(epochs)
+    ica.exclude = []
+
+    # Detect sources by correlation with every EXG channel
+    for ch_name in eog_channels:
+        exg_inds, _ = ica.find_bads_eog(epochs_full, ch_name=ch_name)
+        ica.exclude.extend(exg_inds)
+
+    print("Appling ICA")
+    ica.apply(epochs)
+
+    return ica
+
+
+def save_epochs(epochs: mne.Epochs, file_name: Path) -> None:
+    """
+    Save epochs in double precision.
+
+    Parameters:
+    - epochs (mne.Epochs): The epochs.
+    - file_name (Path): The ``-epo.fif`` file.
+
+    Returns:
+    - None
+    """
+    epochs.save(file_name, fmt="double", split_size="2GB", overwrite=True)
+
+
+def save_events(events: pd.DataFrame, n_b: int, file_name: Path) -> np.ndarray:
+    """
+    Standardize the trial events and save them as read by the loaders.
+
+    Parameters:
+    - events (pd.DataFrame): The corrected events.
+    - n_b (int): The block number.
+    - file_name (Path): The ``_events.dat`` file.
+
+    Returns:
+    - np.ndarray: Trial events: time, class, condition and block.
+    """
+    events = add_condition_tag(events)
+    events = add_block_tag(events, N_B=n_b)
+    events = delete_trigger_column(events)
+    events = standardize_labels(events)
+
+    # Pickled array, read by lib.data_extractions.load_events
+    events = np.array(events.to_numpy(), dtype=int)
+    with open(file_name, "wb") as output:
+        pickle.dump(events, output, pickle.HIGHEST_PROTOCOL)
+
+    return events
+
+
+def preprocess_recording(
+    data_dir: Path,
+    save_dir: Path,
+    n_s: int,
+    n_b: int,
+    event_id: dict,
+    baseline_id: dict,
+    ref_channels: list,
+    decim: int,
+    notch: bool = True,
+    band_pass: bool = True,
+    low_cut: Optional[float] = 0.5,
+    high_cut: Optional[float] = 100,
+    ica: bool = False,
+    ica_params: Optional[dict] = None,
+    stage_log: Optional[StageLog] = None,
+) -> dict:
+    """
+    Preprocess a recording and save its derivatives: report, EXG, baseline
+    and EEG epochs and trial events.
+
+    Parameters:
+    - data_dir (Path): Root of the raw dataset.
+    - save_dir (Path): Root of the derivatives.
+    - n_s (int): The subject number.
+    - n_b (int): The block number.
+    - event_id (dict): Trial tags of every class.
+    - baseline_id (dict): Tag of the baseline start.
+    - ref_channels (list): Reference channels.
+    - decim (int): Decimation factor of the epochs.
+    - notch (bool): Whether to remove the power line. Default True.
+    - band_pass (bool): Whether to band-pass filter. Default True.
+    - low_cut (float): Low cut-off frequency. Default 0.5.
+    - high_cut (float): High cut-off frequency. Default 100.
+    - ica (bool): Whether to remove the EXG related ICA components.
+      Default False.
+    - ica_params (dict): Keyword arguments of apply_ica. Default None.
+    - stage_log (StageLog): Log of the stages. Default None (not timed).
+
+    Returns:
+    - dict: The report of the recording.
+    """
+    if stage_log is None:
+        stage_log = StageLog(enabled=False)
+    stage_log.set_recording(n_s, n_b)
+
+    report = dict(Age=None, Gender="-", Recording_time=None, Ans_R=None, Ans_W=None)
+    # Get Age and Gender
+    report["Age"], report["Gender"] = get_age_gender(n_s)
+
+    # Load data from BDF file
+    with stage_log.stage("read_bdf"):
+        rawdata, num_s = extract_subject_from_bdf(Path(data_dir), n_s, n_b)
+
+    # Get raw events, check and correct them
+    print("Checking Events")
+    with stage_log.stage("events"):
+        events, event_array = correct_events(rawdata, n_s, n_b)
+    # replace the raw events with the new corrected events
+    rawdata.event = event_array
+
+    report["Recording_time"] = int(np.round(rawdata.last_samp / rawdata.info["sfreq"]))
+
+    # Cognitive Control
+    report["Ans_R"], report["Ans_W"] = cognitive_control_check(events)
+    print("Check done")
+
+    # Referencing, notch and band-pass filtering
+    with stage_log.stage("filter"):
+        rawdata = filter_recording(
+            rawdata,
+            ref_channels,
+            notch=notch,
+            band_pass=band_pass,
+            low_cut=low_cut,
+            high_cut=high_cut,
+        )
+
+    # Save report
+    file_path = Path(save_dir) / num_s / f"ses-0{n_b}"
+    base_name = file_path / f"{num_s}_ses-0{n_b}"
+    with stage_log.stage("report"):
+        ensure_dir(str(file_path))
+        with open(f"{base_name}_report.pkl", "wb") as output:
+            pickle.dump(report, output, pickle.HIGHEST_PROTOCOL)
+        # Add session to the dataset-level report table
+        update_report_table(data_dir, n_s, n_b, report)
+
+    print("Processing EXG")
+    with stage_log.stage("epoch_exg"):
+        picks_eog = mne.pick_types(
+            rawdata.info, eeg=False, stim=False, include=EXG_CHANNELS
+        )
+        epochs = epoch_trials(
+            rawdata, event_array, event_id, picks_eog, decim, baseline=(None, 0)
+        )
+    with stage_log.stage("save_exg"):
+        save_epochs(epochs, f"{base_name}_exg-epo.fif")
+    del epochs
+    print("EXG Saved")
+
+    print("Processing Baseline")
+    with stage_log.stage("epoch_baseline"):
+        epochs = epoch_baseline(rawdata, event_array, baseline_id, decim)
+    with stage_log.stage("save_baseline"):
+        save_epochs(epochs, f"{base_name}_baseline-epo.fif")
+    del epochs
+    print("Baseline Saved")
+
+    print("Processing EEG")
+    with stage_log.stage("epoch_eeg"):
+        picks_eeg = mne.pick_types(
+            rawdata.info, eeg=True, exclude=EXG_CHANNELS, stim=False
+        )
+        epochs = epoch_trials(rawdata, event_array, event_id, picks_eeg, decim)
+
+    if ica:
+        # Get a full trials including EXG channels
+        with stage_log.stage("epoch_ica"):
+            picks_vir = mne.pick_types(
+                rawdata.info, eeg=True, include=EXG_CHANNELS, stim=False
+            )
+            epochs_full = epoch_trials(rawdata, event_array, event_id, picks_vir, decim)
+
+        # Liberate Memory for ICA processing
+        del rawdata
+
+        # Remove the components related to the EXG channels
+        with stage_log.stage("ica"):
+            apply_ica(epochs, epochs_full, EXG_CHANNELS[2:], **(ica_params or dict()))
+        del epochs_full
+
+    with stage_log.stage("save_eeg"):
+        save_epochs(epochs, f"{base_name}_eeg-epo.fif")
+    del epochs
+
+    # Standarize and save events
+    with stage_log.stage("save_events"):
+        save_events(events, n_b, f"{base_name}_events.dat")
+
+    return report
+
+
+def finish_dataset(
+    data_dir: Path,
+    n_s_list: list,
+    n_b_list: list,
+    emg_params: dict,
+    adhoc: bool = True,
+    stage_log: Optional[StageLog] = None,
+) -> None:
+    """
+    Dataset-level steps after preprocessing every recording: ad hoc
+    correction of subject 3 and EMG control.
+
+    Parameters:
+    - data_dir (Path): Root of the dataset.
+    - n_s_list (list): List of subject numbers.
+    - n_b_list (list): List of block numbers.
+    - emg_params (dict): Keyword arguments of EMG_control_single_th
+      (low_f, high_f, t_min, t_max, window_len, window_step, std_times,
+      t_min_baseline, t_max_baseline).
+    - adhoc (bool): Whether to apply the ad hoc correction of subject 3,
+      if preprocessed. Default True.
+    - stage_log (StageLog): Log of the stages. Default None (not timed).
+
+    Returns:
+    - None
+    """
+    if stage_log is None:
+        stage_log = StageLog(enabled=False)
+    stage_log.set_recording(None, None)
+
+    if adhoc and 3 in n_s_list:
+        #  Ad Hoc Modifications
+        with stage_log.stage("adhoc"):
+            adhoc_subject_3(root_dir=Path(data_dir))
+
+    # EMG Control
+    with stage_log.stage("emg_control"):
+        EMG_control_single_th(
+            root_dir=Path(data_dir),
+            N_Subj_arr=n_s_list,
+            N_block_arr=n_b_list,
+            **emg_params,
+        )
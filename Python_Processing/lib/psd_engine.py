@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+
+"""
+Batched Welch and multitaper power spectral densities of epoched arrays.
+
+Segment windows and DPSS tapers are computed once per configuration and
+kept in memory. Signals (trial, channel) are processed in chunks, with one
+real FFT over all the segments (or tapers) of the chunk. The outputs are
+the same as ``mne.time_frequency.psd_array_welch`` and
+``psd_array_multitaper`` (non adaptive).
+"""
+
+import numpy as np
+from scipy import fft as sp_fft
+from scipy.signal import get_window
+from scipy.signal.windows import dpss
+from typing import Optional
+
+# Welch windows and DPSS tapers, keyed by their configuration
+_WINDOWS = dict()
+_TAPERS = dict()
+
+
+def get_welch_window(window: str, n_per_seg: int) -> np.ndarray:
+    """
+    Get the segment window of Welch's method.
+
+    Parameters:
+    - window (str): Window name (see scipy.signal.get_window).
+    - n_per_seg (int): Length of the segments.
+
+    Returns:
+    - np.ndarray: The window.
+    """
+    key = (window, int(n_per_seg))
+    if key not in _WINDOWS:
+        _WINDOWS[key] = get_window(window, n_per_seg)
+
+    return _WINDOWS[key]
+
+
+def get_dpss_tapers(
+    n_times: int,
+    sfreq: float,
+    bandwidth: Optional[float] = None,
+    low_bias: bool = True,
+) -> tuple:
+    """
+    Get the DPSS tapers of a multitaper configuration.
+
+    Parameters:
+    - n_times (int): Number of samples of the signals.
+    - sfreq (float): Sampling frequency of the data.
+    - bandwidth (float): Frequency bandwidth of the tapers (Hz). Default
+      None (half bandwidth of 4 frequency bins).
+    - low_bias (bool): Keep only the tapers with concentration ratio
+      above 0.9. Default True.
+
+    Returns:
+    - tuple: Tapers (n_tapers, n_times) and their concentration ratios.
+    """
+    key = (int(n_times), float(sfreq), bandwidth, low_bias)
+
+    if key not in _TAPERS:
+        if bandwidth is None:
+            half_nbw = 4.0
+        else:
+            half_nbw = float(bandwidth) * n_times / (2.0 * sfreq)
+        if half_nbw < 0.5:
+            raise ValueError(
+                f"bandwidth {bandwidth} is too small, use at least "
+                f"{sfreq / n_times} Hz"
+            )
+
+        tapers, ratios = dpss(
+            n_times, half_nbw, int(2 * half_nbw), sym=False, return_ratios=True
+        )
+        if low_bias:
+            keep = ratios > 0.9
+            if not keep.any():
+                keep = ratios == ratios.max()
+            tapers, ratios = tapers[keep], ratios[keep]
+        _TAPERS[key] = (tapers, ratios)
+
+    return _TAPERS[key]
+
+
+def welch_psd(
+    X: np.ndarray,
+    sfreq: float,
+    fmin: float = 0,
+    fmax: float = np.inf,
+    n_fft: int = 256,
+    n_overlap: int = 0,
+    n_per_seg: Optional[int] = None,
+    window: str = "hamming",
+    remove_dc: bool = True,
+    chunk_size: int = 256,
+    n_jobs: int = 1,
+) -> tuple:
+    """
+    Welch power spectral density of every signal.
+
+    Parameters:
+    - X (np.ndarray): Signals (..., n_times), e.g. (n_trials, n_channels,
+      n_times).
+    - sfreq (float): Sampling frequency of the data.
+    - fmin (float): Minimum frequency of interest. Default 0.
+    - fmax (float): Maximum frequency of interest. Default inf.
+    - n_fft (int): Length of the FFT. Default 256.
+    - n_overlap (int): Overlap between segments. Default 0.
+    - n_per_seg (int): Length of the segments. Default n_fft.
+    - window (str): Window of the segments. Default "hamming".
+    - remove_dc (bool): Remove the mean of every segment. Default True.
+    - chunk_size (int): Number of signals transformed at once. Default 256.
+    - n_jobs (int): Number of FFT workers. Default 1.
+
+    Returns:
+    - tuple: PSDs (..., n_freqs) and their frequencies.
+    """
+    X = np.asarray(X)
+    n_times = X.shape[-1]
+    if n_per_seg is None and n_fft > n_times:
+        raise ValueError(
+            f"n_fft ({n_fft}) is longer than the signals ({n_times} samples)"
+        )
+    n_per_seg = n_fft if n_per_seg is None or n_per_seg > n_fft else n_per_seg
+    n_per_seg = min(n_per_seg, n_times)
+    if n_overlap >= n_per_seg:
+        raise ValueError(
+            f"n_overlap ({n_overlap}) must be smaller than n_per_seg ({n_per_seg})"
+        )
+
+    freqs, freq_slice = _freq_slice(n_fft, sfreq, fmin, fmax)
+    win = get_welch_window(window, n_per_seg)
+    scale = 1.0 / (sfreq * (win**2).sum())
+    step = n_per_seg - n_overlap
+
+    signals = X.reshape(-1, n_times)
+    psds = np.empty((len(signals), len(freqs)))
+    for start in range(0, len(signals), chunk_size):
+        chunk = signals[start : start + chunk_size]
+
+        # (signals, segments, samples) view of the Welch segments
+        segments = np.lib.stride_tricks.sliding_window_view(chunk, n_per_seg, axis=-1)[
+            :, ::step
+        ]
+        if remove_dc:
+            segments = segments - segments.mean(axis=-1, keepdims=True)
+
+        spectra = sp_fft.rfft(segments * win, n_fft, axis=-1, workers=n_jobs)
+        spectra = spectra[..., freq_slice]
+        power = spectra.real**2 + spectra.imag**2
+        psds[start : start + chunk_size] = power.mean(axis=1)
+
+    psds *= scale * _one_sided_factor(n_fft, freq_slice)
+
+    return psds.reshape(X.shape[:-1] + (len(freqs),)), freqs
+
+
+def multitaper_psd(
+    X: np.ndarray,
+    sfreq: float,
+    fmin: float = 0,
+    fmax: float = np.inf,
+    bandwidth: Optional[float] = None,
+    low_bias: bool = True,
+    normalization: str = "length",
+    remove_dc: bool = True,
+    chunk_size: int = 64,
+    n_jobs: int = 1,
+) -> tuple:
+    """
+    Multitaper power spectral density of every signal (tapers combined
+    with their concentration ratios).
+
+    Parameters:
+    - X (np.ndarray): Signals (..., n_times), e.g. (n_trials, n_channels,
+      n_times).
+    - sfreq (float): Sampling frequency of the data.
+    - fmin (float): Minimum frequency of interest. Default 0.
+    - fmax (float): Maximum frequency of interest. Default inf.
+    - bandwidth (float): Frequency bandwidth of the tapers (Hz). Default
+      None (half bandwidth of 4 frequency bins).
+    - low_bias (bool): Keep only the tapers with concentration ratio
+      above 0.9. Default True.
+    - normalization (str): "length" (power per sample) or "full" (power
+      per Hz, divided by the sampling frequency). Default "length".
+    - remove_dc (bool): Remove the mean of every signal. Default True.
+    - chunk_size (int): Number of signals transformed at once. Default 64.
+    - n_jobs (int): Number of FFT workers. Default 1.
+
+    Returns:
+    - tuple: PSDs (..., n_freqs) and their frequencies.
+    """
+    if normalization not in ("length", "full"):
+        raise ValueError(f"Invalid normalization '{normalization}'")
+
+    X = np.asarray(X)
+    n_times = X.shape[-1]
+    tapers, ratios = get_dpss_tapers(n_times, sfreq, bandwidth, low_bias)
+    weights = ratios / ratios.sum()
+
+    freqs, freq_slice = _freq_slice(n_times, sfreq, fmin, fmax)
+
+    signals = X.reshape(-1, n_times)
+    psds = np.empty((len(signals), len(freqs)))
+    for start in range(0, len(signals), chunk_size):
+        chunk = signals[start : start + chunk_size]
+        if remove_dc:
+            chunk = chunk - chunk.mean(axis=-1, keepdims=True)
+
+        spectra = sp_fft.rfft(chunk[:, np.newaxis] * tapers, axis=-1, workers=n_jobs)
+        spectra = spectra[..., freq_slice]
+        power = spectra.real**2 + spectra.imag**2
+        psds[start : start + chunk_size] = np.einsum("k,skf->sf", weights, power)
+
+    psds *= _one_sided_factor(n_times, freq_slice)
+    if normalization == "full":
+        psds /= sfreq
+
+    return psds.reshape(X.shape[:-1] + (len(freqs),)), freqs
+
+
+def array_psd(
+    X: np.ndarray,
+    sfreq: float,
+    method: str = "welch",
+    fmin: float = 0,
+    fmax: float = np.inf,
+    n_fft: int = 256,
+    n_overlap: int = 0,
+    bandwidth: Optional[float] = None,
+    n_jobs: int = 1,
+) -> tuple:
+    """
+    Power spectral density of every trial and channel.
+
+    Parameters:
+    - X (np.ndarray): Trials (n_trials, n_channels, n_times).
+    - sfreq (float): Sampling frequency of the data.
+    - method (str): "welch" or "multitaper". Default "welch".
+    - fmin (float): Minimum frequency of interest. Default 0.
+    - fmax (float): Maximum frequency of interest. Default inf.
+    - n_fft (int): Length of the FFT (Welch only). Default 256.
+    - n_overlap (int): Overlap between segments (Welch only). Default 0.
+    - bandwidth (float): Bandwidth of the tapers (multitaper only).
+      Default None.
+    - n_jobs (int): Number of FFT workers. Default 1.
+
+    Returns:
+    - tuple: PSDs (n_trials, n_channels, n_freqs) and their frequencies.
+    """
+    if method == "welch":
+        return welch_psd(
+            X, sfreq, fmin, fmax, n_fft=n_fft, n_overlap=n_overlap, n_jobs=n_jobs
+        )
+    if method == "multitaper":
+        return multitaper_psd(X, sfreq, fmin, fmax, bandwidth=bandwidth, n_jobs=n_jobs)
+
+    raise ValueError(f"Invalid PSD method '{method}'")
+
+
+def _freq_slice(n_fft: int, sfreq: float, fmin: float, fmax: float) -> tuple:
+    # Frequencies of the one-sided spectrum within [fmin, fmax]
+    freqs = sp_fft.rfftfreq(n_fft, 1.0 / sfreq)
+    index = np.flatnonzero((freqs >= fmin) & (freqs <= fmax))
+    if len(index) == 0:
+        raise ValueError(f"No frequencies found between fmin={fmin} and fmax={fmax}")
+    freq_slice = slice(index[0], index[-1] + 1)
+
+    return freqs[freq_slice], freq_slice
+
+
+def _one_sided_factor(n_fft: int, freq_slice: slice) -> np.ndarray:
+    # Power of the negative frequencies, except at DC and Nyquist
+    factor = np.full(n_fft // 2 + 1, 2.0)
+    factor[0] = 1.0
+    if n_fft % 2 == 0:
+        factor[-1] = 1.0
+
+    return factor[freq_slice]
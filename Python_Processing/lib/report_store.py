@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+"""
+Dataset-level report table for the Inner Speech Dataset.
+
+Every session report (demographics, recording time, cognitive control
+answers and EMG control results) is stored as one row of a single
+Parquet table in the derivatives folder. Updates are performed under
+a lock file and written through a temporary file that atomically
+replaces the table, so concurrent writers never clobber each other and
+readers never see a half-written table.
+"""
+
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Optional
+from lib.utils import FileLock, sub_name
+
+REPORT_TABLE_NAME = "reports.parquet"
+
+# Typed columns of the report table. List columns hold one value per
+# EMG contaminated trial, and are null until the EMG control is run.
+REPORT_COLUMNS = {
+    "subject": "int64",
+    "session": "int64",
+    "Age": "Int64",
+    "Gender": "string",
+    "Recording_time": "Int64",
+    "Ans_R": "Int64",
+    "Ans_W": "Int64",
+    "Baseline_EXG7_mean": "float64",
+    "Baseline_EXG8_mean": "float64",
+    "Baseline_EXG7_std": "float64",
+    "Baseline_EXG8_std": "float64",
+}
+REPORT_LIST_COLUMNS = {
+    "EMG_trials": int,
+    "Power_EXG7": float,
+    "Power_EXG8": float,
+}
+
+
+def report_table_path(root_dir: Path) -> Path:
+    """
+    Get the path of the dataset-level report table.
+
+    Parameters:
+    - root_dir (Path): The root directory containing the data.
+
+    Returns:
+    - Path: Path to the report table inside the derivatives folder.
+    """
+    return Path(root_dir) / "derivatives" / REPORT_TABLE_NAME
+
+
+def load_report_table(
+    root_dir: Path,
+    subjects: Optional[list] = None,
+    sessions: Optional[list] = None,
+) -> pd.DataFrame:
+    """
+    Load the report table, optionally restricted to subjects and sessions.
+
+    Parameters:
+    - root_dir (Path): The root directory containing the data.
+    - subjects (list, optional): Subject numbers to keep. Default all.
+    - sessions (list, optional): Session numbers to keep. Default all.
+
+    Returns:
+    - pd.DataFrame: One row per subject/session. Empty if no table exists.
+    """
+    file_name = report_table_path(root_dir)
+
+    if not file_name.exists():
+        return _empty_report_table()
+
+    filters = []
+    if subjects is not None:
+        filters.append(("subject", "in", list(subjects)))
+    if sessions is not None:
+        filters.append(("session", "in", list(sessions)))
+
+    table = pd.read_parquet(file_name, filters=filters or None)
+
+    return _format_report_table(table)
+
+
+def get_session_report(root_dir: Path, n_s: int, n_b: int) -> Optional[dict]:
+    """
+    Get the report of one session from the report table.
+
+    Parameters:
+    - root_dir (Path): The root directory containing the data.
+    - n_s (int): The subject number.
+    - n_b (int): The block number.
+
+    Returns:
+    - dict or None: The session report, or None if it is not in the table.
+      EMG columns are None if the EMG control was not run.
+    """
+    table = load_report_table(root_dir, subjects=[n_s], sessions=[n_b])
+
+    if table.empty:
+        return None
+
+    row = table.iloc[0]
+    report = dict()
+    for column in table.columns:
+        if column in ("subject", "session"):
+            continue
+        value = row[column]
+        if column in REPORT_LIST_COLUMNS:
+            if value is not None:
+                value = np.asarray(value, dtype=REPORT_LIST_COLUMNS[column])
+        elif pd.isna(value):
+            value = None
+        report[column] = value
+
+    return report
+
+
+def update_report_table(
+    root_dir: Path, n_s: int, n_b: int, report: dict, timeout: float = 60.0
+) -> None:
+    """
+    Insert or update the row of one session in the report table.
+
+    Only the keys present in ``report`` are modified; the remaining
+    columns of an existing row are preserved.
+
+    Parameters:
+    - root_dir (Path): The root directory containing the data.
+    - n_s (int): The subject number.
+    - n_b (int): The block number.
+    - report (dict): Report values, keyed by report column name.
+    - timeout (float): Seconds to wait for other writers. Default 60.
+
+    Returns:
+    - None
+    """
+    unknown = set(report) - set(REPORT_COLUMNS) - set(REPORT_LIST_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown report fields: {sorted(unknown)}")
+
+    file_name = report_table_path(root_dir)
+    file_name.parent.mkdir(parents=True, exist_ok=True)
+
+    with FileLock(file_name, timeout):
+        table = load_report_table(root_dir)
+
+        mask = (table["subject"] == n_s) & (table["session"] == n_b)
+        if mask.any():
+            idx = table.index[mask][0]
+        else:
+            row = _empty_report_table()
+            row.loc[0, ["subject", "session"]] = [n_s, n_b]
+            table = pd.concat([table, row], ignore_index=True)
+            idx = table.index[-1]
+
+        for key, value in report.items():
+            if key in REPORT_LIST_COLUMNS and value is not None:
+                value = [REPORT_LIST_COLUMNS[key](v) for v in np.ravel(value)]
+            table.at[idx, key] = value
+
+        table = table.sort_values(["subject", "session"]).reset_index(drop=True)
+        _write_report_table(_format_report_table(table), file_name)
+
+
+def build_report_table(root_dir: Path, n_s_list: list, n_b_list: list) -> None:
+    """
+    Build the report table from the per-session ``_report.pkl`` files.
+
+    Sessions whose report file is missing are skipped.
+
+    Parameters:
+    - root_dir (Path): The root directory containing the data.
+    - n_s_list (list): List of subject numbers.
+    - n_b_list (list): List of block numbers.
+
+    Returns:
+    - None
+    """
+    for n_s in n_s_list:
+        num_s = sub_name(n_s)
+        for n_b in n_b_list:
+            file_name = (
+                Path(root_dir)
+                / "derivatives"
+                / num_s
+                / f"ses-0{n_b}"
+                / f"{num_s}_ses-0{n_b}_report.pkl"
+            )
+            if not file_name.exists():
+                continue
+
+            with open(file_name, "rb") as input_file:
+                report = pickle.load(input_file)
+
+            update_report_table(root_dir, n_s, n_b, report)
+
+
+def _empty_report_table() -> pd.DataFrame:
+    table = pd.DataFrame(
+        {
+            **{col: pd.Series(dtype=dt) for col, dt in REPORT_COLUMNS.items()},
+            **{col: pd.Series(dtype=object) for col in REPORT_LIST_COLUMNS},
+        }
+    )
+    return table
+
+
+def _format_report_table(table: pd.DataFrame) -> pd.DataFrame:
+    # Make sure every column exists and has its declared type
+    for col in list(REPORT_COLUMNS) + list(REPORT_LIST_COLUMNS):
+        if col not in table.columns:
+            table[col] = None
+
+    for col, dtype in REPORT_COLUMNS.items():
+        table[col] = table[col].astype(dtype)
+
+    # Missing list values stay null: an empty list means no tagged trial
+    for col, caster in REPORT_LIST_COLUMNS.items():
+        table[col] = [
+            None if v is None or (np.isscalar(v) and pd.isna(v))
+            else [caster(x) for x in v]
+            for v in table[col]
+        ]
+
+    return table[list(REPORT_COLUMNS) + list(REPORT_LIST_COLUMNS)]
+
+
+def _write_report_table(table: pd.DataFrame, file_name: Path) -> None:
+    # Write next to the destination and atomically swap it in
+    tmp_name = file_name.with_name(f".{file_name.name}.{os.getpid()}.tmp")
+    try:
+        table.to_parquet(tmp_name, index=False)
+        os.replace(tmp_name, file_name)
+    finally:
+        if tmp_name.exists():
+            tmp_name.unlink()
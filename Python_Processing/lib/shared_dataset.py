@@ -0,0 +1,447 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shared-memory registry of the Inner Speech derivatives.
+
+The first process that asks for a session reads it from disk and
+publishes its trials (X) and events (Y) in a shared memory block. Every
+other process on the machine attaches the same block and gets read-only
+NumPy views of it, so N concurrent jobs (analysis scripts, cross
+validation workers) hold a single copy of the data.
+
+The registry is a JSON index in a local folder, updated under a lock
+file. It records every published block and the processes holding it
+(reference counts per process id). Blocks outlive the processes that
+use them, so later jobs find the data already loaded. They are evicted,
+least recently used first, when the registry exceeds its memory budget
+and nobody holds them, or explicitly with SharedDataset.evict.
+
+Within a block the trials are sorted by condition (stable), so the trials
+of a condition are a contiguous, zero-copy slice.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Optional
+from lib.data_extractions import extract_block_data_from_subject
+from lib.data_processing import filter_by_condition
+from lib.utils import FileLock, sub_name
+
+logger = logging.getLogger(__name__)
+
+# Default memory budget of a registry (bytes)
+DEFAULT_MAX_BYTES = 16 * 1024**3
+
+REGISTRY_NAME = "registry.json"
+
+
+class SharedDataset:
+    """
+    Zero-copy access to the derivatives through shared memory.
+
+    Views returned by get and get_subject are read-only and must not be
+    used after the session is released (or the dataset closed).
+
+    Parameters:
+    - root_dir (Path): The root directory containing the data.
+    - registry_dir (Path): Folder of the registry index. Processes using
+      the same folder share the data. Default a folder of the temporary
+      directory, one per root_dir.
+    - max_bytes (int): Memory budget of the published blocks. Default
+      DEFAULT_MAX_BYTES.
+    - timeout (float): Seconds to wait for the registry lock. Default 60.
+    """
+
+    def __init__(
+        self,
+        root_dir: Path,
+        registry_dir: Optional[Path] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        timeout: float = 60.0,
+    ):
+        self.root_dir = Path(root_dir).resolve()
+        self._token = hashlib.sha1(str(self.root_dir).encode()).hexdigest()[:12]
+        if registry_dir is None:
+            registry_dir = (
+                Path(tempfile.gettempdir()) / f"inner_speech_shm_{self._token}"
+            )
+        self.registry_dir = Path(registry_dir)
+        self.registry_dir.mkdir(parents=True, exist_ok=True)
+        self.registry_file = self.registry_dir / REGISTRY_NAME
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        # Blocks attached by this process: key -> [SharedMemory, references,
+        # registry entry]
+        self._handles = dict()
+
+    def get(
+        self,
+        n_s: int,
+        n_b: int,
+        datatype: str = "eeg",
+        condition: str = "All",
+        exclude_emg: bool = False,
+    ) -> tuple:
+        """
+        Get the trials of one session, loading it on first use.
+
+        Every call takes a reference on the session (see release).
+
+        Parameters:
+        - n_s (int): The subject number.
+        - n_b (int): The block number.
+        - datatype (str): The type of data ("eeg" or "exg"). Default "eeg".
+        - condition (str): Condition of the trials ("All", "Pron", "Inner"
+          or "Vis"). Default "All".
+        - exclude_emg (bool): If True, skip the EMG contaminated trials.
+          Default False.
+
+        Returns:
+        - tuple: Read-only views of the trials (X) and their events (Y),
+          sorted by condition.
+        """
+        datatype = datatype.lower()
+        if datatype not in ("eeg", "exg"):
+            raise ValueError("Invalid Datatype")
+
+        key = _block_key(n_s, n_b, datatype, exclude_emg)
+        if key not in self._handles:
+            self._attach(key, n_s, n_b, datatype, exclude_emg)
+        else:
+            self._handles[key][1] += 1
+            with FileLock(self.registry_file, self.timeout):
+                registry = self._read_registry()
+                if key in registry:
+                    _add_holder(registry[key], 1)
+                    self._write_registry(registry)
+
+        X, Y = self._views(key)
+
+        index, _ = filter_by_condition(np.arange(len(Y)), Y, condition)
+        if len(index) == 0:
+            return X[:0], Y[:0]
+        # Trials are sorted by condition: the selection is a slice
+        return X[index[0] : index[-1] + 1], Y[index[0] : index[-1] + 1]
+
+    def get_subject(
+        self,
+        n_s: int,
+        datatype: str = "eeg",
+        condition: str = "All",
+        exclude_emg: bool = False,
+        n_b_list: tuple = (1, 2, 3),
+    ) -> list:
+        """
+        Get the trials of every session of a subject.
+
+        Sessions are not stacked, since stacking would copy them.
+
+        Parameters:
+        - n_s (int): The subject number.
+        - datatype (str): The type of data ("eeg" or "exg"). Default "eeg".
+        - condition (str): Condition of the trials. Default "All".
+        - exclude_emg (bool): If True, skip the EMG contaminated trials.
+          Default False.
+        - n_b_list (tuple): Block numbers. Default (1, 2, 3).
+
+        Returns:
+        - list: (X, Y) views of every session.
+        """
+        return [
+            self.get(n_s, n_b, datatype, condition, exclude_emg) for n_b in n_b_list
+        ]
+
+    def release(
+        self, n_s: int, n_b: int, datatype: str = "eeg", exclude_emg: bool = False
+    ) -> None:
+        """
+        Release one reference on a session taken by get.
+
+        Parameters:
+        - n_s (int): The subject number.
+        - n_b (int): The block number.
+        - datatype (str): The type of data. Default "eeg".
+        - exclude_emg (bool): Whether the EMG trials were skipped. Default
+          False.
+
+        Returns:
+        - None
+        """
+        key = _block_key(n_s, n_b, datatype.lower(), exclude_emg)
+        if key in self._handles:
+            self._release(key, 1)
+
+    def close(self) -> None:
+        """Release every session held by this process."""
+        for key in list(self._handles):
+            self._release(key, self._handles[key][1])
+
+    def evict(self, force: bool = False) -> int:
+        """
+        Remove the blocks that no live process holds.
+
+        Parameters:
+        - force (bool): Remove every block, even if it is held. The
+          holders keep their mapping, but new processes load the data
+          again. Default False.
+
+        Returns:
+        - int: Number of bytes freed.
+        """
+        with FileLock(self.registry_file, self.timeout):
+            registry = self._read_registry()
+            freed = self._evict(registry, force=force)
+            self._write_registry(registry)
+
+        return freed
+
+    def stats(self) -> dict:
+        """
+        Get the registry statistics.
+
+        Returns:
+        - dict: Number of blocks, bytes used, memory budget and the
+          references of every block, keyed by process id.
+        """
+        with FileLock(self.registry_file, self.timeout):
+            registry = self._read_registry()
+
+        return {
+            "entries": len(registry),
+            "bytes": sum(entry["nbytes"] for entry in registry.values()),
+            "max_bytes": self.max_bytes,
+            "holders": {key: entry["holders"] for key, entry in registry.items()},
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _attach(
+        self, key: str, n_s: int, n_b: int, datatype: str, exclude_emg: bool
+    ) -> None:
+        with FileLock(self.registry_file, self.timeout):
+            registry = self._read_registry()
+            if key in registry:
+                self._open(key, registry[key])
+                self._write_registry(registry)
+                return
+
+        # Read outside of the lock, other processes can keep attaching
+        start_time = time.perf_counter()
+        epochs, Y = extract_block_data_from_subject(
+            self.root_dir, n_s, datatype, n_b, exclude_emg=exclude_emg
+        )
+        X = epochs._data
+        Y = np.asarray(Y)
+        order = np.argsort(Y[:, 2], kind="stable")
+        logger.info(
+            "Loaded %s in %.2f s (%.1f MB)",
+            key,
+            time.perf_counter() - start_time,
+            X.nbytes / 1024**2,
+        )
+
+        with FileLock(self.registry_file, self.timeout):
+            registry = self._read_registry()
+            # Unless another process published it meanwhile
+            if key not in registry:
+                entry = _new_entry(_free_name(self._token, key), X, Y)
+                self._evict(registry, entry["nbytes"])
+                shm = _create_shm(entry["shm"], entry["nbytes"])
+                _fill_block(shm, entry, X[order], Y[order])
+                shm.close()
+                registry[key] = entry
+            self._open(key, registry[key])
+            self._write_registry(registry)
+
+    def _open(self, key: str, entry: dict) -> None:
+        # Map a published block and take a reference (registry locked)
+        self._handles[key] = [_open_shm(entry["shm"]), 1, dict(entry)]
+        _add_holder(entry, 1)
+
+    def _views(self, key: str) -> tuple:
+        shm, _, entry = self._handles[key]
+        X = np.ndarray(
+            entry["x_shape"], dtype=entry["x_dtype"], buffer=shm.buf, offset=0
+        )
+        Y = np.ndarray(
+            entry["y_shape"],
+            dtype=entry["y_dtype"],
+            buffer=shm.buf,
+            offset=entry["y_offset"],
+        )
+        X.flags.writeable = False
+        Y.flags.writeable = False
+
+        return X, Y
+
+    def _release(self, key: str, count: int) -> None:
+        handle = self._handles[key]
+        handle[1] -= count
+
+        with FileLock(self.registry_file, self.timeout):
+            registry = self._read_registry()
+            if key in registry:
+                _add_holder(registry[key], -count)
+                self._write_registry(registry)
+
+        if handle[1] <= 0:
+            del self._handles[key]
+            try:
+                handle[0].close()
+            except BufferError:
+                # Views still alive, the mapping goes with the last of them
+                pass
+
+    def _evict(
+        self, registry: dict, n_bytes: Optional[int] = None, force: bool = False
+    ) -> int:
+        # Unlink unused blocks, least recently used first, until n_bytes
+        # more fit in the budget, or all of them if n_bytes is None
+        # (registry locked)
+        used = sum(entry["nbytes"] for entry in registry.values())
+        freed = 0
+        for key in sorted(registry, key=lambda k: registry[k]["last_used"]):
+            if n_bytes is not None and used - freed + n_bytes <= self.max_bytes:
+                break
+            entry = registry[key]
+            _drop_dead_holders(entry)
+            if entry["holders"] and not force:
+                continue
+            _unlink_shm(entry["shm"])
+            freed += entry["nbytes"]
+            del registry[key]
+            logger.info("Evicted %s (%.1f MB)", key, entry["nbytes"] / 1024**2)
+
+        if n_bytes is not None and used - freed + n_bytes > self.max_bytes:
+            logger.warning(
+                "Shared datasets use %.1f MB, over the %.1f MB budget",
+                (used - freed + n_bytes) / 1024**2,
+                self.max_bytes / 1024**2,
+            )
+
+        return freed
+
+    def _read_registry(self) -> dict:
+        if not self.registry_file.exists():
+            return dict()
+        with open(self.registry_file) as f:
+            return json.load(f)
+
+    def _write_registry(self, registry: dict) -> None:
+        # Write next to the destination and atomically swap it in
+        tmp_name = self.registry_file.with_name(
+            f".{self.registry_file.name}.{os.getpid()}.tmp"
+        )
+        with open(tmp_name, "w") as f:
+            json.dump(registry, f)
+        os.replace(tmp_name, self.registry_file)
+
+
+def _block_key(n_s: int, n_b: int, datatype: str, exclude_emg: bool) -> str:
+    key = f"{datatype}_{sub_name(n_s)}_ses-0{n_b}"
+    return key + "_noemg" if exclude_emg else key
+
+
+def _new_entry(name: str, X: np.ndarray, Y: np.ndarray) -> dict:
+    # Y after X, aligned to 8 bytes
+    y_offset = -(-X.nbytes // 8) * 8
+    return {
+        "shm": name,
+        "x_shape": list(X.shape),
+        "x_dtype": X.dtype.str,
+        "y_shape": list(Y.shape),
+        "y_dtype": Y.dtype.str,
+        "y_offset": y_offset,
+        "nbytes": max(y_offset + Y.nbytes, 1),
+        "holders": dict(),
+        "last_used": time.time(),
+    }
+
+
+def _fill_block(shm, entry: dict, X: np.ndarray, Y: np.ndarray) -> None:
+    X_shared = np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)
+    X_shared[:] = X
+    Y_shared = np.ndarray(
+        Y.shape, dtype=Y.dtype, buffer=shm.buf, offset=entry["y_offset"]
+    )
+    Y_shared[:] = Y
+    del X_shared, Y_shared
+
+
+def _add_holder(entry: dict, count: int) -> None:
+    pid = str(os.getpid())
+    holders = entry["holders"]
+    holders[pid] = holders.get(pid, 0) + count
+    if holders[pid] <= 0:
+        del holders[pid]
+    entry["last_used"] = time.time()
+
+
+def _drop_dead_holders(entry: dict) -> None:
+    # References of processes that ended without releasing them
+    for pid in list(entry["holders"]):
+        if not _is_alive(int(pid)):
+            del entry["holders"][pid]
+
+
+def _is_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def _free_name(token: str, key: str) -> str:
+    # Short name (macOS limits POSIX shared memory names to 31 characters),
+    # unique even if a previous block of the same key is still mapped
+    digest = hashlib.sha1(f"{token}{key}{time.time_ns()}".encode()).hexdigest()
+    return f"isd_{digest[:20]}"
+
+
+def _create_shm(name: str, n_bytes: int) -> shared_memory.SharedMemory:
+    shm = shared_memory.SharedMemory(name=name, create=True, size=n_bytes)
+    _untrack(shm)
+    return shm
+
+
+def _open_shm(name: str) -> shared_memory.SharedMemory:
+    shm = shared_memory.SharedMemory(name=name)
+    _untrack(shm)
+    return shm
+
+
+def _unlink_shm(name: str) -> None:
+    # Tracked open, so unlink balances the resource tracker. The memory is
+    # released when the last process unmaps it.
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def _untrack(shm: shared_memory.SharedMemory) -> None:
+    # The registry owns the lifetime of the blocks: do not let the resource
+    # tracker unlink them when the creating (or attaching) process ends.
+    # On Windows a block lives as long as a process maps it.
+    if sys.platform != "win32":
+        resource_tracker.unregister(shm._name, "shared_memory")
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+"""
+FFT-based Morlet wavelet transform.
+
+The spectra of the wavelets are computed once per (sampling frequency,
+number of samples, frequencies, number of cycles) configuration and kept
+in memory. Trials and channels are transformed in chunks: one real FFT
+per signal, then one inverse FFT per frequency for the whole chunk. The
+output is the same as ``mne.time_frequency.tfr_array_morlet``.
+"""
+
+import numpy as np
+from scipy import fft as sp_fft
+from mne.time_frequency import morlet, tfr_array_morlet
+
+# Wavelet spectra, keyed by the transform configuration
+_SPECTRA = dict()
+
+
+def get_wavelet_spectra(
+    sfreq: float,
+    n_times: int,
+    freqs: np.ndarray,
+    n_cycles,
+    zero_mean: bool = True,
+) -> tuple:
+    """
+    Get the FFT of the Morlet wavelets of a transform configuration.
+
+    Parameters:
+    - sfreq (float): Sampling frequency of the data.
+    - n_times (int): Number of samples of the signals.
+    - freqs (np.ndarray): Frequencies of the wavelets.
+    - n_cycles (float | np.ndarray): Number of cycles of the wavelets.
+    - zero_mean (bool): Whether the wavelets have zero mean. Default True.
+
+    Returns:
+    - tuple: FFT length, wavelet spectra (n_freqs, fft length) and the
+      first sample of the "same" convolution output of every wavelet.
+    """
+    freqs = np.atleast_1d(np.asarray(freqs, dtype=float))
+    n_cycles_key = tuple(np.broadcast_to(n_cycles, freqs.shape).tolist())
+    key = (float(sfreq), int(n_times), tuple(freqs.tolist()), n_cycles_key, zero_mean)
+
+    if key not in _SPECTRA:
+        wavelets = morlet(sfreq, freqs, n_cycles=n_cycles, zero_mean=zero_mean)
+        lengths = np.array([len(w) for w in wavelets])
+        if lengths.max() > n_times:
+            raise ValueError(
+                "At least one of the wavelets is longer than the signal "
+                f"({lengths.max()} > {n_times} samples). Use a longer signal "
+                "or shorter wavelets."
+            )
+
+        n_fft = sp_fft.next_fast_len(int(n_times + lengths.max() - 1))
+        spectra = np.array([sp_fft.fft(w, n_fft) for w in wavelets])
+        starts = (lengths - 1) // 2
+        _SPECTRA[key] = (n_fft, spectra, starts)
+
+    return _SPECTRA[key]
+
+
+def morlet_tfr(
+    X: np.ndarray,
+    sfreq: float,
+    freqs: np.ndarray,
+    n_cycles=7.0,
+    zero_mean: bool = True,
+    decim: int = 1,
+    output: str = "complex",
+    chunk_size: int = 64,
+    dtype: type = np.complex128,
+    n_jobs: int = 1,
+) -> np.ndarray:
+    """
+    Morlet wavelet transform of epoched data by FFT convolution.
+
+    Parameters:
+    - X (np.ndarray): Trials (n_trials, n_channels, n_times).
+    - sfreq (float): Sampling frequency of the data.
+    - freqs (np.ndarray): Frequencies of interest.
+    - n_cycles (float | np.ndarray): Number of cycles of the wavelets.
+      Default 7.
+    - zero_mean (bool): Whether the wavelets have zero mean. Default True.
+    - decim (int): Decimation factor of the output. Default 1.
+    - output (str): "complex" or "power". Default "complex".
+    - chunk_size (int): Number of signals (trial, channel) transformed at
+      once, which caps the memory of the FFT buffers. Default 64.
+    - dtype (type): Complex type of the output. Default np.complex128.
+    - n_jobs (int): Number of FFT workers. Default 1.
+
+    Returns:
+    - np.ndarray: TFR (n_trials, n_channels, n_freqs, n_times_decimated).
+    """
+    if output not in ("complex", "power"):
+        raise ValueError(f"Invalid output '{output}'")
+
+    X = np.asarray(X)
+    n_trials, n_channels, n_times = X.shape
+    freqs = np.atleast_1d(freqs)
+    n_fft, spectra, starts = get_wavelet_spectra(
+        sfreq, n_times, freqs, n_cycles, zero_mean
+    )
+
+    times = np.arange(n_times)[::decim]
+    out_dtype = dtype if output == "complex" else np.empty(0, dtype).real.dtype
+    out = np.empty((n_trials * n_channels, len(freqs), len(times)), dtype=out_dtype)
+
+    signals = X.reshape(-1, n_times)
+    for start in range(0, len(signals), chunk_size):
+        chunk = signals[start : start + chunk_size]
+
+        # Full spectrum of the real signals from their real FFT
+        half = sp_fft.rfft(chunk, n_fft, axis=-1, workers=n_jobs)
+        spectrum = np.empty((len(chunk), n_fft), dtype=half.dtype)
+        spectrum[:, : half.shape[-1]] = half
+        spectrum[:, half.shape[-1] :] = np.conj(
+            half[:, 1 : n_fft - half.shape[-1] + 1]
+        )[:, ::-1]
+
+        for k in range(len(freqs)):
+            conv = sp_fft.ifft(spectrum * spectra[k], axis=-1, workers=n_jobs)
+            conv = conv[:, starts[k] + times]
+            if output == "power":
+                conv = conv.real**2 + conv.imag**2
+            out[start : start + chunk_size, k] = conv
+
+    return out.reshape(n_trials, n_channels, len(freqs), len(times))
+
+
+def array_morlet(
+    X: np.ndarray,
+    sfreq: float,
+    freqs: np.ndarray,
+    n_cycles=7.0,
+    zero_mean: bool = True,
+    use_fft: bool = True,
+    decim: int = 1,
+    n_jobs: int = 1,
+) -> np.ndarray:
+    """
+    Complex Morlet TFR of epoched data, with the cached FFT engine if
+    use_fft is True and with MNE direct convolution otherwise.
+
+    Parameters:
+    - X (np.ndarray): Trials (n_trials, n_channels, n_times).
+    - sfreq (float): Sampling frequency of the data.
+    - freqs (np.ndarray): Frequencies of interest.
+    - n_cycles (float | np.ndarray): Number of cycles of the wavelets.
+    - zero_mean (bool): Whether the wavelets have zero mean. Default True.
+    - use_fft (bool): Whether to convolve with the FFT. Default True.
+    - decim (int): Decimation factor of the output. Default 1.
+    - n_jobs (int): Number of jobs. Default 1.
+
+    Returns:
+    - np.ndarray: Complex TFR (n_trials, n_channels, n_freqs, n_times).
+    """
+    if use_fft:
+        return morlet_tfr(
+            X,
+            sfreq,
+            freqs,
+            n_cycles=n_cycles,
+            zero_mean=zero_mean,
+            decim=decim,
+            n_jobs=n_jobs,
+        )
+
+    return tfr_array_morlet(
+        np.asarray(X),
+        sfreq=sfreq,
+        freqs=freqs,
+        n_cycles=n_cycles,
+        zero_mean=zero_mean,
+        use_fft=False,
+        decim=decim,
+        output="complex",
+        n_jobs=n_jobs,
+        verbose="WARNING",
+    )
@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+
+"""
+Time-Frequency Representations over a grid of conditions and classes.
+
+Every subject is loaded once and stored as a NumPy file that the worker
+processes open as a read-only memory map. Each worker computes the TFR of
+one condition/class cell, taking only the trials of that cell from the
+memory maps, and saves its ``-tfr.h5`` files (and their chunked copies,
+see lib.tfr_storage). Averaged Morlet TFRs are
+accumulated batch by batch, so a worker never holds all the trials of its
+cell at once.
+
+Alternatively, the single pass mode computes the complex Morlet TFR of
+every trial only once and derives the averaged power and ITC of all the
+cells from it, since the cells overlap (e.g. "All" contains every
+"Inner" trial).
+"""
+
+import os
+import shutil
+import tempfile
+import mne
+import numpy as np
+from pathlib import Path
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+from mne.time_frequency import tfr_multitaper, tfr_morlet
+from lib.accumulators import TFRAccumulator
+from lib.data_extractions import extract_data_from_subject
+from lib.data_processing import filter_by_condition, filter_by_class
+from lib.data_provider import iter_grouped_subjects
+from lib.tfr_engine import array_morlet
+from lib.tfr_storage import chunked_tfr_name, save_chunked_tfr
+from lib.utils import ensure_dir, unify_names
+
+
+def subjects_to_memmap(
+    root_dir: Path, n_s_list: list, datatype: str, memmap_dir: Path
+) -> list:
+    """
+    Load every subject once and save its data as a ``.npy`` file that can
+    be opened as a memory map.
+
+    Parameters:
+    - root_dir (Path): The root directory containing the data.
+    - n_s_list (list): List of subject numbers.
+    - datatype (str): The type of data to extract ("eeg" or "exg").
+    - memmap_dir (Path): Folder where the ``.npy`` files are written.
+
+    Returns:
+    - list: One (data file, events) tuple per subject.
+    """
+    ensure_dir(str(memmap_dir))
+
+    subjects = []
+    for n_s in n_s_list:
+        X, Y = extract_data_from_subject(Path(root_dir), n_s, datatype)
+        file_name = Path(memmap_dir) / f"subject_{n_s}_{datatype.lower()}.npy"
+        np.save(file_name, X)
+        subjects.append((file_name, np.asarray(Y)))
+        del X
+
+    return subjects
+
+
+def compute_tfr_cell(
+    subjects: list,
+    cond: str,
+    class_label: str,
+    info: mne.Info,
+    tmin: float,
+    tfr_method: str,
+    tfr_params: dict,
+    save_dir: Optional[Path],
+    overwrite: bool = True,
+    batch_size: int = 32,
+) -> list:
+    """
+    Compute and save the TFR of one condition/class cell.
+
+    Parameters:
+    - subjects (list): (data file, events) tuples from subjects_to_memmap.
+    - cond (str): The condition.
+    - class_label (str): The class label.
+    - info (mne.Info): Measurement info of the epochs.
+    - tmin (float): Start time of the epochs.
+    - tfr_method (str): "Morlet" or "Multitaper".
+    - tfr_params (dict): Keyword arguments of tfr_morlet/tfr_multitaper.
+    - save_dir (Path): Folder where the TFRs are saved. None computes the
+      TFRs without saving them.
+    - overwrite (bool): Whether to overwrite existing files. Default True.
+    - batch_size (int): Number of trials transformed at once when the
+      averaged Morlet TFR is accumulated. Default 32.
+
+    Returns:
+    - list: The saved file names.
+    """
+    if tfr_method not in ("Morlet", "Multitaper"):
+        raise ValueError(f"Invalid TFR method '{tfr_method}'")
+
+    # Select the trials of the cell in every subject, reading them from
+    # the shared memory maps
+    indexes = []
+    for file_name, Y in subjects:
+        index = np.arange(len(Y))
+        index, Y_cond = filter_by_condition(index, Y, cond)
+        index, _ = filter_by_class(index, Y_cond, class_label)
+        indexes.append(index)
+
+    if _can_accumulate(tfr_method, tfr_params):
+        accumulator = TFRAccumulator(
+            sfreq=info["sfreq"],
+            freqs=tfr_params["freqs"],
+            n_cycles=tfr_params["n_cycles"],
+            tmin=tmin,
+            use_fft=tfr_params.get("use_fft", False),
+            zero_mean=tfr_params.get("zero_mean", True),
+            decim=tfr_params.get("decim", 1),
+            batch_size=batch_size,
+            n_jobs=tfr_params.get("n_jobs", 1),
+        )
+        for (file_name, _), index in zip(subjects, indexes):
+            X_s = np.load(file_name, mmap_mode="r")
+            for start in range(0, len(index), batch_size):
+                accumulator.add(X_s[index[start : start + batch_size]])
+            del X_s
+        power, itc = accumulator.to_average_tfr(info)
+    else:
+        X_data = np.concatenate(
+            [
+                np.load(file_name, mmap_mode="r")[index]
+                for (file_name, _), index in zip(subjects, indexes)
+            ],
+            axis=0,
+        )
+        epochs = mne.EpochsArray(X_data, info, tmin=tmin, verbose="WARNING")
+
+        if tfr_method == "Multitaper":
+            power, itc = tfr_multitaper(epochs, **tfr_params)
+        else:
+            power, itc = tfr_morlet(epochs, **tfr_params)
+
+    return _save_tfr(
+        power,
+        itc,
+        tfr_method,
+        cond,
+        class_label,
+        save_dir,
+        overwrite,
+        tfr_params.get("return_itc", True),
+    )
+
+
+def run_tfr_grid(
+    root_dir: Path,
+    n_s_list: list,
+    datatype: str,
+    conditions: list,
+    classes: list,
+    info: mne.Info,
+    tmin: float,
+    tfr_method: str,
+    tfr_params: dict,
+    save_dir: Optional[Path],
+    n_workers: Optional[int] = 2,
+    overwrite: bool = True,
+    memmap_dir: Optional[Path] = None,
+    batch_size: int = 32,
+) -> list:
+    """
+    Compute the TFRs of every condition/class cell in parallel.
+
+    The subjects are loaded once and shared with the workers as read-only
+    memory maps; each worker computes and saves one cell.
+
+    Parameters:
+    - root_dir (Path): The root directory containing the data.
+    - n_s_list (list): List of subject numbers.
+    - datatype (str): The type of data to extract ("eeg" or "exg").
+    - conditions (list): Conditions of the grid.
+    - classes (list): Classes of the grid.
+    - info (mne.Info): Measurement info of the epochs.
+    - tmin (float): Start time of the epochs.
+    - tfr_method (str): "Morlet" or "Multitaper".
+    - tfr_params (dict): Keyword arguments of tfr_morlet/tfr_multitaper.
+    - save_dir (Path): Folder where the TFRs are saved. None computes the
+      TFRs without saving them.
+    - n_workers (int): Number of worker processes, each holding the TFR of
+      one cell. None uses every CPU. Default 2.
+    - overwrite (bool): Whether to overwrite existing files. Default True.
+    - memmap_dir (Path): Folder for the shared subject files. Default a
+      temporary folder removed at the end.
+    - batch_size (int): Number of trials transformed at once when the
+      averaged Morlet TFR is accumulated. Default 32.
+
+    Returns:
+    - list: The saved file names.
+    """
+    remove_memmap = memmap_dir is None
+    if remove_memmap:
+        memmap_dir = Path(tempfile.mkdtemp(prefix="inner_speech_tfr_"))
+
+    cells = [(cond, cl) for cl in classes for cond in conditions]
+    n_workers = min(n_workers or os.cpu_count() or 1, len(cells))
+
+    saved = []
+    try:
+        subjects = subjects_to_memmap(root_dir, n_s_list, datatype, memmap_dir)
+
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = [
+                pool.submit(
+                    compute_tfr_cell,
+                    subjects,
+                    cond,
+                    cl,
+                    info,
+                    tmin,
+                    tfr_method,
+                    tfr_params,
+                    save_dir,
+                    overwrite,
+                    batch_size,
+                )
+                for cond, cl in cells
+            ]
+            for (cond, cl), future in zip(cells, futures):
+                saved.extend(future.result())
+                print(f"Calculated {tfr_method} for Class: {cl} in Condition: {cond}")
+    finally:
+        if remove_memmap:
+            shutil.rmtree(memmap_dir, ignore_errors=True)
+
+    return saved
+
+
+def run_tfr_grid_single_pass(
+    root_dir: Path,
+    n_s_list: list,
+    datatype: str,
+    conditions: list,
+    classes: list,
+    info: mne.Info,
+    tmin: float,
+    tfr_params: dict,
+    save_dir: Optional[Path],
+    overwrite: bool = True,
+    batch_size: int = 32,
+    dtype: type = np.complex128,
+    exclude_emg: bool = False,
+) -> list:
+    """
+    Compute the averaged Morlet TFRs of every condition/class cell with a
+    single wavelet transform of each trial.
+
+    Each subject is loaded once and its trials are transformed in batches.
+    The power and unit phase vectors of each batch are summed into every
+    cell that contains the trials, so overlapping cells share the same
+    transform.
+
+    Parameters:
+    - root_dir (Path): The root directory containing the data.
+    - n_s_list (list): List of subject numbers.
+    - datatype (str): The type of data to extract ("eeg" or "exg").
+    - conditions (list): Conditions of the grid.
+    - classes (list): Classes of the grid.
+    - info (mne.Info): Measurement info of the epochs.
+    - tmin (float): Start time of the epochs.
+    - tfr_params (dict): Keyword arguments of tfr_morlet. Only averaged
+      TFRs of all channels are supported.
+    - save_dir (Path): Folder where the TFRs are saved. None computes the
+      TFRs without saving them.
+    - overwrite (bool): Whether to overwrite existing files. Default True.
+    - batch_size (int): Number of trials transformed at once. Default 32.
+    - dtype (type): Complex type of the trial TFRs. np.complex64 halves
+      the memory of the batches, with single precision results. Default
+      np.complex128.
+    - exclude_emg (bool): If True, skip the EMG contaminated trials.
+
+    Returns:
+    - list: The saved file names.
+    """
+    if not _can_accumulate("Morlet", tfr_params):
+        raise ValueError(
+            "The single pass mode only supports averaged Morlet TFRs "
+            "of all channels (average=True, picks='all')"
+        )
+
+    cells = [(cond, cl) for cl in classes for cond in conditions]
+    accumulators = {
+        cell: TFRAccumulator(
+            sfreq=info["sfreq"],
+            freqs=tfr_params["freqs"],
+            n_cycles=tfr_params["n_cycles"],
+            tmin=tmin,
+            decim=tfr_params.get("decim", 1),
+        )
+        for cell in cells
+    }
+
+    for n_s, X, Y, groups in iter_grouped_subjects(
+        root_dir, n_s_list, datatype, conditions, classes, exclude_emg
+    ):
+        # Membership of every trial in every cell
+        membership = np.zeros((len(X), len(cells)), dtype=np.float32)
+        for k, cell in enumerate(cells):
+            membership[groups[cell], k] = 1
+
+        # Transform only the trials used by at least one cell
+        used = np.flatnonzero(membership.any(axis=1))
+        for start in range(0, len(used), batch_size):
+            batch = used[start : start + batch_size]
+            tfr = array_morlet(
+                X[batch],
+                sfreq=info["sfreq"],
+                freqs=tfr_params["freqs"],
+                n_cycles=tfr_params["n_cycles"],
+                zero_mean=tfr_params.get("zero_mean", True),
+                use_fft=tfr_params.get("use_fft", False),
+                decim=tfr_params.get("decim", 1),
+                n_jobs=tfr_params.get("n_jobs", 1),
+            ).astype(dtype, copy=False)
+            _add_to_cells(tfr, membership[batch], cells, accumulators, X.shape[-1])
+            del tfr
+
+        print(f"Calculated Morlet of Subject: {n_s}")
+        del X
+
+    saved = []
+    for cond, cl in cells:
+        power, itc = accumulators[(cond, cl)].to_average_tfr(info)
+        saved.extend(
+            _save_tfr(
+                power,
+                itc,
+                "Morlet",
+                cond,
+                cl,
+                save_dir,
+                overwrite,
+                tfr_params.get("return_itc", True),
+            )
+        )
+        print(f"Calculated Morlet for Class: {cl} in Condition: {cond}")
+
+    return saved
+
+
+def _add_to_cells(
+    tfr: np.ndarray,
+    membership: np.ndarray,
+    cells: list,
+    accumulators: dict,
+    n_times: int,
+) -> None:
+    # Sums over the trials of every cell as one matrix product per batch
+    shape = tfr.shape[1:]
+    power = np.abs(tfr)
+    # Zero coefficients have no phase, as in MNE
+    phase = (tfr / np.where(power == 0, 1, power)).reshape(len(tfr), -1)
+    power = (power**2).reshape(len(tfr), -1)
+
+    power_sums = membership.T @ power
+    phase_sums = membership.T.astype(phase.dtype) @ phase
+    counts = membership.sum(axis=0)
+
+    for k, cell in enumerate(cells):
+        accumulators[cell].add_sums(
+            power_sums[k].reshape(shape),
+            phase_sums[k].reshape(shape),
+            int(counts[k]),
+            n_times=n_times,
+        )
+
+
+def _save_tfr(
+    power,
+    itc,
+    tfr_method: str,
+    cond: str,
+    class_label: str,
+    save_dir: Optional[Path],
+    overwrite: bool,
+    return_itc: bool,
+) -> list:
+    # Save the TFRs of one cell with the names used by the plotting scripts
+    if save_dir is None:
+        return []
+
+    cond, class_label = unify_names(cond, class_label)
+    ensure_dir(str(save_dir))
+
+    tfrs = [("power", power)]
+    if return_itc:
+        tfrs.append(("itc", itc))
+
+    # MNE file and chunked file with the band averages of the plots
+    saved = []
+    for trf_type, tfr in tfrs:
+        file_name = (
+            Path(save_dir) / f"{tfr_method}_{cond}_{class_label}_{trf_type}-tfr.h5"
+        )
+        tfr.save(fname=file_name, overwrite=overwrite)
+        save_chunked_tfr(tfr, chunked_tfr_name(file_name), overwrite=overwrite)
+        saved.append(file_name)
+
+    return saved
+
+
+def _can_accumulate(tfr_method: str, tfr_params: dict) -> bool:
+    # Averaged Morlet TFRs over all channels can be accumulated by batches
+    return (
+        tfr_method == "Morlet"
+        and tfr_params.get("average", True)
+        and tfr_params.get("picks", None) == "all"
+        and tfr_params.get("output", "power") == "power"
+    )
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+"""
+Chunked on-disk storage of averaged TFRs.
+
+The TFR data is stored in an HDF5 file as a (channel, freq, time) dataset
+split in chunks, so a frequency/time range can be read without loading
+the whole file. Band averages (channel, time) of the bands used by the
+plotting scripts are precomputed at save time, together with coarser
+versions along time (each level halves the number of time points).
+"""
+
+import os
+import h5py
+import mne
+import numpy as np
+from pathlib import Path
+from typing import Optional
+
+# Bands used by the topomap plotting scripts: (fmin, fmax, title)
+TFR_BANDS = [
+    (0.5, 4, "Delta (0.5-4 Hz)"),
+    (4, 8, "Theta (4-8 Hz)"),
+    (8, 12, "Alpha (8-12 Hz)"),
+    (12, 30, "Beta (12-30 Hz)"),
+    (30, 45, "Low Gamma (30-45Hz)"),
+    (55, 100, "High Gamma (55-100 Hz)"),
+]
+
+# Chunk shape of the (channel, freq, time) dataset
+TFR_CHUNKS = (16, 16, 128)
+
+# Smallest number of time points of a band average level
+_MIN_LEVEL_TIMES = 16
+
+
+def chunked_tfr_name(file_name: Path) -> Path:
+    """
+    Get the name of the chunked file stored next to an MNE ``-tfr.h5`` file.
+
+    Parameters:
+    - file_name (Path): Name of the MNE TFR file.
+
+    Returns:
+    - Path: Name of the chunked TFR file (``-tfr-chunked.h5``).
+    """
+    file_name = Path(file_name)
+    return file_name.with_name(file_name.name.replace("-tfr.h5", "-tfr-chunked.h5"))
+
+
+def make_average_tfr(
+    info: mne.Info,
+    data: np.ndarray,
+    times: np.ndarray,
+    freqs: np.ndarray,
+    nave: int,
+    method: str = "morlet",
+    comment: Optional[str] = None,
+):
+    """
+    Build an AverageTFR from its data.
+
+    Parameters:
+    - info (mne.Info): Measurement info of the channels.
+    - data (np.ndarray): TFR data (n_channels, n_freqs, n_times).
+    - times (np.ndarray): Time points.
+    - freqs (np.ndarray): Frequencies.
+    - nave (int): Number of averaged trials.
+    - method (str): TFR method. Default "morlet".
+    - comment (str): Comment of the TFR. Default None.
+
+    Returns:
+    - mne.time_frequency.AverageTFR: The TFR.
+    """
+    # AverageTFRArray replaced the AverageTFR constructor in recent MNE
+    if hasattr(mne.time_frequency, "AverageTFRArray"):
+        return mne.time_frequency.AverageTFRArray(
+            info, data, times, freqs, nave=nave, comment=comment, method=method
+        )
+    return mne.time_frequency.AverageTFR(
+        info, data, times, freqs, nave, comment=comment, method=method
+    )
+
+
+def save_chunked_tfr(
+    tfr,
+    file_name: Path,
+    bands: list = TFR_BANDS,
+    overwrite: bool = True,
+) -> None:
+    """
+    Save an averaged TFR in the chunked layout, with band averages.
+
+    Parameters:
+    - tfr (mne.time_frequency.AverageTFR): The TFR to save.
+    - file_name (Path): Name of the chunked file.
+    - bands (list): (fmin, fmax, ...) bands whose averages are stored.
+      Default TFR_BANDS.
+    - overwrite (bool): Whether to overwrite an existing file. Default True.
+
+    Returns:
+    - None
+    """
+    file_name = Path(file_name)
+    if file_name.exists() and not overwrite:
+        raise FileExistsError(f"{file_name} already exists")
+
+    info = tfr.info
+    data = tfr.data
+    chunks = tuple(min(c, s) for c, s in zip(TFR_CHUNKS, data.shape))
+
+    # Write next to the destination and atomically swap it in
+    tmp_name = file_name.with_name(f".{file_name.name}.{os.getpid()}.tmp")
+    try:
+        with h5py.File(tmp_name, "w") as f:
+            f.create_dataset("data", data=data, chunks=chunks)
+            f.create_dataset("freqs", data=tfr.freqs)
+            f.create_dataset("times", data=tfr.times)
+            f.create_dataset("ch_names", data=np.array(info["ch_names"], dtype="S"))
+            f.create_dataset(
+                "ch_types",
+                data=np.array(
+                    [mne.channel_type(info, k) for k in range(info["nchan"])],
+                    dtype="S",
+                ),
+            )
+            f.create_dataset(
+                "ch_locs", data=np.array([ch["loc"] for ch in info["chs"]])
+            )
+            f.attrs["sfreq"] = info["sfreq"]
+            f.attrs["nave"] = tfr.nave
+            f.attrs["method"] = str(tfr.method)
+            f.attrs["comment"] = str(tfr.comment or "")
+
+            group = f.create_group("bands")
+            for band in bands:
+                fmin, fmax = band[0], band[1]
+                mask = _range_mask(tfr.freqs, fmin, fmax)
+                if not mask.any():
+                    continue
+                band_group = group.create_group(_band_key(fmin, fmax))
+                band_group.attrs["fmin"] = fmin
+                band_group.attrs["fmax"] = fmax
+                band_group.attrs["freqs"] = tfr.freqs[mask]
+
+                level = data[:, mask].mean(axis=1)
+                factor = 1
+                while True:
+                    dataset = band_group.create_dataset(f"level_{factor}", data=level)
+                    dataset.attrs["factor"] = factor
+                    if level.shape[-1] // 2 < _MIN_LEVEL_TIMES:
+                        break
+                    n_times = level.shape[-1] // 2 * 2
+                    level = level[:, :n_times].reshape(len(level), -1, 2).mean(axis=-1)
+                    factor *= 2
+        os.replace(tmp_name, file_name)
+    finally:
+        if tmp_name.exists():
+            tmp_name.unlink()
+
+
+def read_chunked_tfr(
+    file_name: Path,
+    fmin: Optional[float] = None,
+    fmax: Optional[float] = None,
+    tmin: Optional[float] = None,
+    tmax: Optional[float] = None,
+):
+    """
+    Read a frequency/time range of a chunked TFR file.
+
+    Only the chunks of the requested range are read from disk.
+
+    Parameters:
+    - file_name (Path): Name of the chunked file.
+    - fmin (float): Lowest frequency. Default the first one.
+    - fmax (float): Highest frequency. Default the last one.
+    - tmin (float): First time point. Default the first one.
+    - tmax (float): Last time point. Default the last one.
+
+    Returns:
+    - mne.time_frequency.AverageTFR: The TFR restricted to the range.
+    """
+    with h5py.File(file_name, "r") as f:
+        freqs = f["freqs"][()]
+        times = f["times"][()]
+        f_slice = _range_slice(freqs, fmin, fmax)
+        t_slice = _range_slice(times, tmin, tmax)
+
+        data = f["data"][:, f_slice, t_slice]
+        info = _read_info(f)
+        nave = int(f.attrs["nave"])
+        method = f.attrs["method"]
+        comment = f.attrs["comment"] or None
+
+    return make_average_tfr(
+        info, data, times[t_slice], freqs[f_slice], nave, method, comment
+    )
+
+
+def read_chunked_band(
+    file_name: Path,
+    fmin: float,
+    fmax: float,
+    tmin: Optional[float] = None,
+    tmax: Optional[float] = None,
+    factor: int = 1,
+):
+    """
+    Read the average of a frequency band over a time range.
+
+    The precomputed band average is used if the band was stored, otherwise
+    the band is averaged from the frequency range of the data.
+
+    Parameters:
+    - file_name (Path): Name of the chunked file.
+    - fmin (float): Lowest frequency of the band.
+    - fmax (float): Highest frequency of the band.
+    - tmin (float): First time point. Default the first one.
+    - tmax (float): Last time point. Default the last one.
+    - factor (int): Time decimation level of the stored band average
+      (power of 2). Default 1 (all time points).
+
+    Returns:
+    - mne.time_frequency.AverageTFR: TFR with a single frequency (the
+      mean frequency of the band) holding the band average.
+    """
+    with h5py.File(file_name, "r") as f:
+        times = f["times"][()]
+        info = _read_info(f)
+        nave = int(f.attrs["nave"])
+        method = f.attrs["method"]
+        key = f"bands/{_band_key(fmin, fmax)}"
+
+        if key in f and f"level_{factor}" in f[key]:
+            band_freqs = f[key].attrs["freqs"]
+            n_times = f[key][f"level_{factor}"].shape[-1]
+            times = times[: n_times * factor].reshape(-1, factor).mean(axis=-1)
+            t_slice = _range_slice(times, tmin, tmax)
+            data = f[key][f"level_{factor}"][:, t_slice]
+        else:
+            if factor != 1:
+                raise ValueError(f"Band {fmin}-{fmax} Hz is not stored in {file_name}")
+            freqs = f["freqs"][()]
+            f_slice = _range_slice(freqs, fmin, fmax)
+            t_slice = _range_slice(times, tmin, tmax)
+            band_freqs = freqs[f_slice]
+            data = f["data"][:, f_slice, t_slice].mean(axis=1)
+
+    return make_average_tfr(
+        info,
+        data[:, np.newaxis],
+        times[t_slice],
+        np.array([band_freqs.mean()]),
+        nave,
+        method,
+        f"{fmin}-{fmax} Hz",
+    )
+
+
+def _read_info(f: h5py.File) -> mne.Info:
+    # Rebuild the channel information (names, types and locations)
+    ch_names = [name.decode() for name in f["ch_names"][()]]
+    ch_types = [ch_type.decode() for ch_type in f["ch_types"][()]]
+    info = mne.create_info(ch_names, float(f.attrs["sfreq"]), ch_types)
+    for ch, loc in zip(info["chs"], f["ch_locs"][()]):
+        ch["loc"][:] = loc
+
+    return info
+
+
+def _band_key(fmin: float, fmax: float) -> str:
+    return f"{fmin:g}-{fmax:g}"
+
+
+def _range_mask(values: np.ndarray, vmin: Optional[float], vmax: Optional[float]):
+    mask = np.ones(len(values), dtype=bool)
+    if vmin is not None:
+        mask &= values >= vmin
+    if vmax is not None:
+        mask &= values <= vmax
+    return mask
+
+
+def _range_slice(values: np.ndarray, vmin: Optional[float], vmax: Optional[float]):
+    # Values are sorted, so the range is a contiguous slice
+    index = np.flatnonzero(_range_mask(values, vmin, vmax))
+    if len(index) == 0:
+        raise ValueError(f"No values in the range [{vmin}, {vmax}]")
+    return slice(index[0], index[-1] + 1)
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+"""
+Batched topomap rendering of frequency band averages.
+
+All band x time window averages of a TFR are computed in one vectorized
+pass, the sensor-to-grid interpolation matrix is built once per montage
+and head sphere (and cached), and every band panel is rendered from it,
+optionally in a process pool with the non-interactive Agg backend
+(lib.figure_export).
+"""
+
+import mne
+import numpy as np
+from typing import Optional
+from scipy.interpolate import CloughTocher2DInterpolator
+from lib.figure_export import export_figures, figure_spec
+
+# Default head radius of MNE (m)
+HEAD_RADIUS = 0.095
+
+# Interpolation matrices, keyed by (positions, sphere, outlines, resolution)
+_INTERPOLATORS = dict()
+
+
+def band_time_averages(
+    data: np.ndarray,
+    freqs: np.ndarray,
+    times: np.ndarray,
+    bands: list,
+    tmin: Optional[float] = None,
+    tmax: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Average a TFR over every frequency band and a time window at once.
+
+    Parameters:
+    - data (np.ndarray): TFR data (n_channels, n_freqs, n_times).
+    - freqs (np.ndarray): Frequencies of the TFR.
+    - times (np.ndarray): Time points of the TFR.
+    - bands (list): (fmin, fmax, ...) bands.
+    - tmin (float): Start of the time window. Default the first time.
+    - tmax (float): End of the time window. Default the last time.
+
+    Returns:
+    - np.ndarray: Band averages (n_bands, n_channels).
+    """
+    time_mask = np.ones(len(times), dtype=bool)
+    if tmin is not None:
+        time_mask &= times >= tmin
+    if tmax is not None:
+        time_mask &= times <= tmax
+
+    # Band membership of every frequency, normalized to average
+    weights = np.array(
+        [(freqs >= band[0]) & (freqs <= band[1]) for band in bands], dtype=float
+    )
+    n_freqs = weights.sum(axis=1, keepdims=True)
+    if np.any(n_freqs == 0):
+        empty = [band[:2] for band, n in zip(bands, n_freqs[:, 0]) if n == 0]
+        raise ValueError(f"No frequencies in the bands {empty}")
+    weights /= n_freqs
+
+    window_mean = data[:, :, time_mask].mean(axis=-1)
+
+    return weights @ window_mean.T
+
+
+def topomap_layout(
+    info: mne.Info,
+    sphere=None,
+    outlines: str = "head",
+    res: int = 64,
+) -> dict:
+    """
+    Get the 2D sensor positions and the sensor-to-grid interpolation
+    matrix of a montage. The layout is computed once per montage, head
+    sphere, outlines and resolution.
+
+    Parameters:
+    - info (mne.Info): Measurement info with the sensor locations.
+    - sphere (float | tuple): Head radius or (x, y, z, radius) sphere.
+      Default None (MNE default head sphere).
+    - outlines (str): "head" (clip to the head) or "skirt" (show the
+      sensors outside the head). Default "head".
+    - res (int): Resolution of the image grid. Default 64.
+
+    Returns:
+    - dict: Sensor positions ("pos"), interpolation matrix ("matrix",
+      (res * res, n_channels) with NaN rows outside the head), grid
+      extent ("extent") and head sphere ("sphere").
+    """
+    sphere = _check_sphere(sphere)
+    locs = np.array([ch["loc"][:3] for ch in info["chs"]])
+    locs[~np.isfinite(locs)] = 0
+    key = (locs.round(6).tobytes(), tuple(sphere), outlines, res)
+
+    if key not in _INTERPOLATORS:
+        pos = _project_sensors(locs, sphere)
+        _INTERPOLATORS[key] = _build_layout(pos, sphere, outlines, res)
+
+    return _INTERPOLATORS[key]
+
+
+def render_topomaps(
+    values: np.ndarray,
+    layout: dict,
+    titles: list,
+    vlims: Optional[list] = None,
+    file_names: Optional[list] = None,
+    n_jobs: int = 1,
+    cmap: str = "RdBu_r",
+    sensors: bool = True,
+    unit: Optional[str] = None,
+    figsize: tuple = (20, 10),
+    savefig_kwargs: Optional[dict] = None,
+    rc_params: Optional[dict] = None,
+    inputs: tuple = (),
+    force: bool = False,
+) -> list:
+    """
+    Render one topomap figure per row of values.
+
+    Parameters:
+    - values (np.ndarray): Values to plot (n_panels, n_channels).
+    - layout (dict): Layout from topomap_layout.
+    - titles (list): Title of every panel.
+    - vlims (list): (vmin, vmax) of every panel. Default data range.
+    - file_names (list): If given, every figure is exported to its file
+      (see lib.figure_export) and closed. Otherwise the figures are
+      returned.
+    - n_jobs (int): Number of worker processes when saving. Default 1.
+    - cmap (str): Colormap. Default "RdBu_r".
+    - sensors (bool): Whether to draw the sensors. Default True.
+    - unit (str): Label of the colorbar. Default None.
+    - figsize (tuple): Size of the figures. Default (20, 10).
+    - savefig_kwargs (dict): Keyword arguments of savefig.
+    - rc_params (dict): Matplotlib rcParams used while drawing (e.g. the
+      font size). Part of the hash of the saved figures.
+    - inputs (tuple): Files the values were computed from. Saved figures
+      are skipped if their inputs and values did not change.
+    - force (bool): Save even the figures that are up to date.
+
+    Returns:
+    - list: The saved file names, or the figures if file_names is None.
+    """
+    if vlims is None:
+        vlims = [(None, None)] * len(values)
+
+    panels = [
+        dict(
+            values=values[k],
+            layout=layout,
+            title=titles[k],
+            vlim=vlims[k],
+            cmap=cmap,
+            sensors=sensors,
+            unit=unit,
+            figsize=figsize,
+        )
+        for k in range(len(values))
+    ]
+
+    if file_names is None:
+        import matplotlib.pyplot as plt
+
+        with plt.rc_context(rc_params or dict()):
+            return [_draw_topomap(**panel) for panel in panels]
+
+    specs = [
+        figure_spec(file_name, _draw_topomap, panel, inputs, savefig_kwargs, rc_params)
+        for panel, file_name in zip(panels, file_names)
+    ]
+    export_figures(specs, n_jobs=n_jobs, force=force)
+
+    return [str(file_name) for file_name in file_names]
+
+
+def _draw_topomap(
+    values: np.ndarray,
+    layout: dict,
+    title: str,
+    vlim: tuple,
+    cmap: str,
+    sensors: bool,
+    unit: Optional[str],
+    figsize: tuple,
+):
+    import matplotlib.pyplot as plt
+
+    res = int(np.sqrt(len(layout["matrix"])))
+    image = (layout["matrix"] @ values).reshape(res, res)
+
+    fig = plt.figure(figsize=figsize)
+    ax = fig.add_axes([0.1, 0.1, 0.8, 0.8])
+    im = ax.imshow(
+        image,
+        origin="lower",
+        extent=layout["extent"],
+        cmap=cmap,
+        vmin=vlim[0],
+        vmax=vlim[1],
+        interpolation="bilinear",
+    )
+    ax.contour(
+        image,
+        levels=6,
+        colors="k",
+        linewidths=0.5,
+        origin="lower",
+        extent=layout["extent"],
+    )
+    _draw_head(ax, layout["sphere"])
+    if sensors:
+        ax.plot(*layout["pos"].T, "k.", markersize=2)
+
+    ax.set_title(title)
+    ax.set_aspect("equal")
+    ax.set_axis_off()
+    cbar = fig.colorbar(im, ax=ax, shrink=0.6)
+    if unit is not None:
+        cbar.set_label(unit)
+
+    return fig
+
+
+def _draw_head(ax, sphere: np.ndarray) -> None:
+    # Head circle, nose and ears, as in MNE topomaps
+    x, y, _, radius = sphere
+    angle = np.linspace(0, 2 * np.pi, 101)
+    ax.plot(x + radius * np.cos(angle), y + radius * np.sin(angle), "k", lw=1)
+
+    nose_x = np.array([0.18, 0, -0.18]) * radius
+    nose_y = np.array([0.995, 1.15, 0.995]) * radius
+    ax.plot(x + nose_x, y + nose_y, "k", lw=1)
+
+    ear_x = np.array(
+        [0.497, 0.510, 0.518, 0.5299, 0.5419, 0.54, 0.547, 0.532, 0.510, 0.489]
+    )
+    ear_y = np.array(
+        [
+            0.0555,
+            0.0775,
+            0.0783,
+            0.0746,
+            0.0555,
+            -0.0055,
+            -0.0932,
+            -0.1313,
+            -0.1384,
+            -0.1199,
+        ]
+    )
+    for side in (-1, 1):
+        ax.plot(x + side * ear_x * 2 * radius, y + ear_y * 2 * radius, "k", lw=1)
+
+
+def _check_sphere(sphere) -> np.ndarray:
+    if sphere is None:
+        return np.array([0.0, 0.0, 0.0, HEAD_RADIUS])
+    if np.isscalar(sphere):
+        return np.array([0.0, 0.0, 0.0, float(sphere)])
+    sphere = np.asarray(sphere, dtype=float)
+    if sphere.shape != (4,):
+        raise ValueError("sphere must be a radius or (x, y, z, radius)")
+    return sphere
+
+
+def _project_sensors(locs: np.ndarray, sphere: np.ndarray) -> np.ndarray:
+    # Azimuthal equidistant projection from the top of the head sphere
+    # (as mne.channels.layout._auto_topomap_coords)
+    locs = locs - sphere[:3]
+    radius = np.linalg.norm(locs, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        polar = np.nan_to_num(np.arccos(locs[:, 2] / radius))
+    azimuth = np.arctan2(locs[:, 1], locs[:, 0])
+    distance = polar * radius / (np.pi / 2)
+
+    return (
+        np.column_stack((distance * np.cos(azimuth), distance * np.sin(azimuth)))
+        + sphere[:2]
+    )
+
+
+def _build_layout(pos: np.ndarray, sphere: np.ndarray, outlines: str, res: int) -> dict:
+    center = sphere[:2]
+    radius = sphere[3]
+    sensor_radius = np.linalg.norm(pos - center, axis=1).max()
+    outer = max(radius, sensor_radius) * 1.05
+    clip = radius if outlines == "head" else outer
+
+    # Extrapolation points on a circle around the sensors take the value of
+    # their nearest sensor, so the whole disk can be interpolated
+    angle = np.linspace(0, 2 * np.pi, 48, endpoint=False)
+    extra = center + outer * np.column_stack((np.cos(angle), np.sin(angle)))
+    nearest = np.argmin(
+        np.linalg.norm(extra[:, np.newaxis] - pos[np.newaxis], axis=-1), axis=1
+    )
+    n_channels = len(pos)
+    expand = np.vstack((np.eye(n_channels), np.eye(n_channels)[nearest]))
+
+    # The interpolation is linear in the values: interpolating the identity
+    # gives the matrix that maps sensor values to the grid
+    points = np.vstack((pos, extra))
+    interpolator = CloughTocher2DInterpolator(points, np.eye(len(points)))
+    x = np.linspace(center[0] - outer, center[0] + outer, res)
+    y = np.linspace(center[1] - outer, center[1] + outer, res)
+    xx, yy = np.meshgrid(x, y)
+    grid = np.column_stack((xx.ravel(), yy.ravel()))
+    matrix = interpolator(grid) @ expand
+
+    outside = np.linalg.norm(grid - center, axis=1) > clip
+    matrix[outside] = np.nan
+
+    return {
+        "pos": pos,
+        "matrix": matrix,
+        "extent": (x[0], x[-1], y[0], y[-1]),
+        "sphere": sphere,
+    }
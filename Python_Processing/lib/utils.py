@@ -7,7 +7,20 @@
 Utilitys for Inner speech dataset processing
 """
 
+import logging
 import os
+import time
+from pathlib import Path
+from typing import Iterable, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Root logger of the library modules (lib.*)
+LOGGER_NAME = "lib"
 
 
 def ensure_dir(dir_name: str) -> None:
@@ -24,6 +37,57 @@ def ensure_dir(dir_name: str) -> None:
         os.makedirs(dir_name)
 
 
+def set_log_level(level: Union[int, str] = "INFO") -> logging.Logger:
+    """
+    Show the log messages of the library (loading progress and throughput)
+    on the console.
+
+    Messages are hidden by default (warnings only). Use "DEBUG" for one
+    message per session and per call, and "WARNING" to silence them again.
+
+    Parameters:
+    - level (int or str): Logging level. Default "INFO".
+
+    Returns:
+    - logging.Logger: The library logger.
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s %(name)s %(levelname)s: %(message)s")
+        )
+        logger.addHandler(handler)
+    logger.setLevel(level)
+
+    return logger
+
+
+def progress_bar(iterable: Iterable, enabled: bool = False, **kwargs) -> Iterable:
+    """
+    Wrap an iterable in a tqdm progress bar.
+
+    Parameters:
+    - iterable (Iterable): The iterable.
+    - enabled (bool): Whether to show the bar. Default False.
+    - **kwargs: Options of tqdm (desc, total, unit, ...).
+
+    Returns:
+    - Iterable: The bar, or the iterable itself if disabled or if tqdm is
+      not installed.
+    """
+    if not enabled:
+        return iterable
+
+    try:
+        from tqdm import tqdm
+    except ImportError:
+        logging.getLogger(LOGGER_NAME).warning("tqdm is not installed")
+        return iterable
+
+    return tqdm(iterable, **kwargs)
+
+
 def picks_from_channels(channels):
     """
     Parameters
@@ -174,3 +238,76 @@ def sub_name(N_S: int) -> str:
         Num_s = "sub-" + str(N_S)
 
     return Num_s
+
+
+class FileLock:
+    """
+    Exclusive lock shared by processes, held on a lock file next to the
+    locked file. The lock is taken with fcntl.flock (msvcrt.locking on
+    Windows), so the operating system releases it when its owner exits,
+    even if the process is killed. The lock file is kept, with the pid
+    of the last owner.
+
+    Parameters:
+    - file_name (Path): The locked file.
+    - timeout (float): Seconds to wait for the other processes.
+    """
+
+    def __init__(self, file_name: Path, timeout: float):
+        file_name = Path(file_name)
+        self.lock_name = file_name.with_name(f".{file_name.name}.lock")
+        self.timeout = timeout
+        self._fd = None
+
+    def __enter__(self):
+        fd = os.open(self.lock_name, os.O_CREAT | os.O_RDWR)
+        start = time.monotonic()
+        while True:
+            try:
+                _lock_fd(fd)
+                break
+            except OSError:
+                if time.monotonic() - start > self.timeout:
+                    os.close(fd)
+                    raise TimeoutError(
+                        f"Could not lock {self.lock_name}, "
+                        f"held by process {_read_pid(self.lock_name)}."
+                    )
+                time.sleep(0.05)
+
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return self
+
+    def __exit__(self, *exc):
+        # Never unlink the lock file: a waiting process may hold it open
+        fd, self._fd = self._fd, None
+        _unlock_fd(fd)
+        os.close(fd)
+        return False
+
+
+def _lock_fd(fd: int) -> None:
+    # Non-blocking exclusive lock, OSError if another process holds it
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+
+def _unlock_fd(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+def _read_pid(lock_name: Path) -> str:
+    # Pid written by the owner of a lock file, for error messages
+    try:
+        return Path(lock_name).read_text().strip() or "unknown"
+    except OSError:
+        return "unknown"